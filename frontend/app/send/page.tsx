@@ -45,6 +45,7 @@ export default function SendScanPage() {
   const [addr, setAddr] = useState<string>("");
   const [Rhex, setRhex] = useState<string>("");
   const [tagHex, setTagHex] = useState<string>("");
+  const [memoCipher, setMemoCipher] = useState<string>("");
   const [txHash, setTxHash] = useState<string>("");
 
   // post channel: signal or announce
@@ -121,7 +122,7 @@ export default function SendScanPage() {
     try {
       setBusy("derive");
       setStatus("");
-      setAddr(""); setRhex(""); setTagHex(""); setTxHash("");
+      setAddr(""); setRhex(""); setTagHex(""); setMemoCipher(""); setTxHash("");
       if (!decoded) {
         setStatus("Please scan a Receive Code first.");
         return;
@@ -147,6 +148,7 @@ export default function SendScanPage() {
       setAddr(out.addr);
       setRhex(out.R);
       setTagHex(out.tag);
+      setMemoCipher(out.memoCipher || "");
       setStatus("Derived one-time address & announcement params.");
     } catch (e: any) {
       setStatus(`Derivation failed: ${e?.message || String(e)}`);
@@ -206,7 +208,7 @@ export default function SendScanPage() {
         const body = {
           R: Rhex,
           tag: tagHex,
-          memoCipher: null as any,
+          memoCipher: memoCipher || null,
           commitment,
           txHash: txHash || null,
         };
@@ -232,7 +234,7 @@ export default function SendScanPage() {
           rx,                      // bytes32
           yParity,                 // bool
           tag: tagHex,             // bytes32
-          memo: "0x",              // optional ciphertext
+          memo: memoCipher || "0x", // optional ciphertext (stealth memo, see lib/crypto.js)
           txHash: txHash || null,
         };
         const res = await fetch("http://127.0.0.1:8000/sender/signal", {
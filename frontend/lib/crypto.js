@@ -109,6 +109,7 @@ export async function deriveOneTimeAddress({ spendPubUncompressed, viewPubCompre
     P_uncompressed: P_uncompressedHex, // 65B
     addr,
     tag: tagHex,
+    shared,                  // x32(r·V)，memo 密钥由它派生；不要上链或外发
   };
 }
 
@@ -150,13 +151,47 @@ export async function eciesEncryptToView(viewPubCompressed, plaintext) {
   return { ephPub, iv: bytesToHex(iv), ct: bytesToHex(ct) };
 }
 
+/* ------------------ 隐身公告 memo（与 R 同一个 r，AES-GCM） ------------------ */
+// memo = 0x01 || nonce(12B) || ct || gcmTag(16B)；key = HKDF(x32(r·V), info "stealth-memo-v1")，AAD = R(33B)
+// 接收方 scanner 命中时已有 S = v·R，直接解；认证失败即丢弃（对应 mpc/mpc_core/crypto.py）
+export const MEMO_V1 = 0x01;
+
+export async function encryptMemoForStealth(sharedX32, R_compressed, plaintext) {
+  if (!webcrypto?.subtle) throw new Error("WebCrypto not available");
+
+  const keyMaterial = await webcrypto.subtle.importKey("raw", toArrayBuffer(sharedX32), "HKDF", false, ["deriveKey"]);
+  const key = await webcrypto.subtle.deriveKey(
+    { name: "HKDF", hash: "SHA-256", salt: new Uint8Array([]), info: new TextEncoder().encode("stealth-memo-v1") },
+    keyMaterial,
+    { name: "AES-GCM", length: 256 },
+    false,
+    ["encrypt"]
+  );
+
+  const nonce = webcrypto.getRandomValues(new Uint8Array(12));
+  const ctBuf = await webcrypto.subtle.encrypt(
+    { name: "AES-GCM", iv: toArrayBuffer(nonce), additionalData: toArrayBuffer(hexToBytes(R_compressed)), tagLength: 128 },
+    key,
+    toArrayBuffer(plaintext)
+  );
+  const ct = new Uint8Array(ctBuf);
+
+  const out = new Uint8Array(1 + nonce.length + ct.length);
+  out[0] = MEMO_V1;
+  out.set(nonce, 1);
+  out.set(ct, 1 + nonce.length);
+  return bytesToHex(out);
+}
+
 /* ------------------ 组合接口 ------------------ */
 export async function senderAssembleAnnouncement({ spendPubUncompressed, viewPubCompressed, memoPlaintext }) {
   const ot = await deriveOneTimeAddress({ spendPubUncompressed, viewPubCompressed });
 
   let amountCipher;
+  let memoCipher;
   if (memoPlaintext && memoPlaintext.length > 0) {
-    amountCipher = await eciesEncryptToView(viewPubCompressed, memoPlaintext);
+    amountCipher = await eciesEncryptToView(viewPubCompressed, memoPlaintext); // payment.py 路线（自带 ephPub）
+    memoCipher = await encryptMemoForStealth(ot.shared, ot.R_compressed, memoPlaintext); // 链上公告 memo
   }
 
   return {
@@ -164,6 +199,7 @@ export async function senderAssembleAnnouncement({ spendPubUncompressed, viewPub
     R: ot.R_compressed,
     tag: ot.tag,
     amountCipher,
+    memoCipher,
     rHex: ot.rHex,
   };
 }
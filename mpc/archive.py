@@ -0,0 +1,86 @@
+# mpc/archive.py
+# -*- coding: utf-8 -*-
+"""
+冷热分区：把终局、已扫、未命中的事件从 events 搬进冷库，热表只留工作集
+
+watcher 按 ARCHIVE_INTERVAL_S 自动执行同样的归档；这里用于手动补跑 / 查看状态 / 老库一次性开启增量 vacuum。
+- 冷库默认 <DB_PATH 去扩展名>_cold.db，ATTACH 为 cold，表 cold.events_archive（id 不变，只留重扫需要的列）
+- rescan / threshold_scan 审计会同时读冷库；重扫命中已归档的事件时会把它搬回热表
+- 计数（storage.counters）把归档的行计入 events / events_done，test_wallet 与 /metrics 口径不变
+
+用法：
+  python3 -m mpc.archive                     # 归档一次 + incremental_vacuum
+  python3 -m mpc.archive status              # 热表 / 冷库行数、页数、空闲页、文件大小
+  python3 mpc/archive.py --finality 128 --batch 20000
+  python3 -m mpc.archive --enable-incremental-vacuum   # 老库一次性 VACUUM 切到 auto_vacuum=INCREMENTAL
+
+环境变量（可选）：
+  DB_PATH=mpc_index.db
+  ARCHIVE_DB_PATH / ARCHIVE_FINALITY_BLOCKS=64 / ARCHIVE_BATCH=5000 / ARCHIVE_VACUUM_PAGES=2000（见 mpc_core/storage.py）
+"""
+import argparse
+import os
+import time
+
+try:
+    from .mpc_core import storage
+except ImportError:  # 以脚本方式运行：python3 mpc/archive.py
+    from mpc_core import storage
+
+DB_PATH = os.getenv("DB_PATH", "mpc_index.db")
+
+def _size_mb(path) -> str:
+    total = sum(os.path.getsize(path + suf) for suf in ("", "-wal") if path and os.path.exists(path + suf))
+    return f"{total / 1e6:.1f}MB"
+
+def print_status(con):
+    c = storage.counters(con)
+    hot = con.execute("SELECT COUNT(*) FROM main.events").fetchone()[0]
+    vac = {0: "none", 1: "full", 2: "incremental"}.get(con.execute("PRAGMA main.auto_vacuum").fetchone()[0], "?")
+    pages = con.execute("PRAGMA main.page_count").fetchone()[0]
+    free = con.execute("PRAGMA main.freelist_count").fetchone()[0]
+    print(f"hot   {os.path.abspath(DB_PATH)}  {_size_mb(DB_PATH)}  events={hot}  "
+          f"pending={c['events_pending']}  pages={pages}  free={free}  auto_vacuum={vac}")
+    cold = storage.cold_path(con)
+    if storage.has_cold(con):
+        n = con.execute("SELECT COUNT(*) FROM cold.events_archive").fetchone()[0]
+        print(f"cold  {cold}  {_size_mb(cold)}  events={n}  archive_max_block={storage.get_meta(con, 'archive_max_block')}")
+    else:
+        print(f"cold  {cold}  (not created yet)")
+    print(f"head  last_block={storage.get_meta(con, 'last_block')}  finality={storage.ARCHIVE_FINALITY_BLOCKS}")
+
+def main():
+    ap = argparse.ArgumentParser(description="move finalized scanned non-matching events to the cold store")
+    ap.add_argument("command", nargs="?", default="run", choices=("run", "status"))
+    ap.add_argument("--finality", type=int, default=storage.ARCHIVE_FINALITY_BLOCKS)
+    ap.add_argument("--batch", type=int, default=storage.ARCHIVE_BATCH)
+    ap.add_argument("--vacuum-pages", type=int, default=storage.ARCHIVE_VACUUM_PAGES,
+                    help="pages to release after archiving (0 = skip)")
+    ap.add_argument("--enable-incremental-vacuum", action="store_true",
+                    help="one-time VACUUM to switch an old DB to auto_vacuum=INCREMENTAL")
+    args = ap.parse_args()
+
+    con = storage.connect(DB_PATH)
+    try:
+        if args.command == "status":
+            print_status(con)
+            return
+        if args.enable_incremental_vacuum:
+            t0 = time.time()
+            storage.enable_incremental_vacuum(con)
+            print(f"[archive] 🧹 auto_vacuum=INCREMENTAL after full VACUUM in {time.time() - t0:.1f}s")
+        t0 = time.time()
+        n = storage.archive_finalized(con, finality=args.finality, batch=args.batch)
+        print(f"[archive] 🧊 archived {n} event(s) in {time.time() - t0:.1f}s")
+        if args.vacuum_pages > 0:
+            freed = storage.incremental_vacuum(con, args.vacuum_pages)
+            if freed < 0:
+                print("[archive] ℹ️ auto_vacuum is not INCREMENTAL; run with --enable-incremental-vacuum once")
+            else:
+                print(f"[archive] 🧹 released {freed} page(s)")
+        print_status(con)
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the scan / decrypt hot paths.
+Run from the repo root, e.g. `python3 -m mpc.bench.bench_aggregate`.
+Per-primitive costs with a regression check: `python3 -m mpc.bench.micro --compare`.
+"""
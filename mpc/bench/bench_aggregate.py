@@ -0,0 +1,72 @@
+# bench/bench_aggregate.py
+"""
+微基准：阈值聚合 S = Σ λ_i·Y_i
+  legacy : 每个事件重算 λ（含模逆）+ t 次 multiply + t-1 次两两 combine_keys
+  cached : λ 按索引集合缓存 + 一次 combine_keys（mpc_core.aggregate）
+  session: 节点已返回 λ_i·y_i·R，协调端只做一次 combine（MPC_SESSION=true）
+
+用法：python3 -m mpc.bench.bench_aggregate [--t 2] [--n 2000]
+"""
+import argparse
+import secrets
+import time
+
+from coincurve import PrivateKey, PublicKey
+
+from ..mpc_core.aggregate import SECP_N, aggregate_shares, combine_points, lagrange_coeffs_at_zero
+
+def _legacy_aggregate(shares):
+    lambdas = []
+    indices = [i for (i, _) in shares]
+    for i in indices:
+        num, den = 1, 1
+        for j in indices:
+            if j == i:
+                continue
+            num = (num * (-j % SECP_N)) % SECP_N
+            den = (den * ((i - j) % SECP_N)) % SECP_N
+        lambdas.append((num * pow(den, SECP_N - 2, SECP_N)) % SECP_N)
+    S = None
+    for lam, (_, Yi_bytes) in zip(lambdas, shares):
+        lamYi = PublicKey(Yi_bytes).multiply((lam % SECP_N).to_bytes(32, "big"))
+        S = lamYi if S is None else PublicKey.combine_keys([S, lamYi])
+    return S
+
+def _make_events(t: int, n: int):
+    ys = [secrets.randbelow(SECP_N - 1) + 1 for _ in range(t)]
+    lambdas = lagrange_coeffs_at_zero(list(range(1, t + 1)))
+    events = []
+    for _ in range(n):
+        R = PrivateKey().public_key
+        shares = [(i + 1, R.multiply(y.to_bytes(32, "big")).format()) for i, y in enumerate(ys)]
+        weighted = [R.multiply(((lam * y) % SECP_N).to_bytes(32, "big")).format() for lam, y in zip(lambdas, ys)]
+        events.append((shares, weighted))
+    return events
+
+def _run(name, fn, events):
+    t0 = time.perf_counter()
+    for ev in events:
+        fn(ev)
+    dt = time.perf_counter() - t0
+    print(f"{name:8s} {len(events) / dt:10.0f} ev/s  {dt / len(events) * 1e6:8.1f} us/ev")
+    return dt
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--t", type=int, default=2, help="threshold (shares per event)")
+    ap.add_argument("--n", type=int, default=2000, help="events")
+    args = ap.parse_args()
+
+    events = _make_events(args.t, args.n)
+    # 结果一致性
+    shares, weighted = events[0]
+    assert _legacy_aggregate(shares).format() == aggregate_shares(shares).format() == combine_points(weighted).format()
+
+    print(f"t={args.t} events={args.n}")
+    base = _run("legacy", lambda ev: _legacy_aggregate(ev[0]), events)
+    fast = _run("cached", lambda ev: aggregate_shares(ev[0]), events)
+    sess = _run("session", lambda ev: combine_points(ev[1]), events)
+    print(f"speedup cached={base / fast:.2f}x session={base / sess:.2f}x")
+
+if __name__ == "__main__":
+    main()
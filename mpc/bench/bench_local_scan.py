@@ -0,0 +1,76 @@
+# bench/bench_local_scan.py
+"""
+基准：本地 ECDH 扫描（USE_MPC=false / 回退路径）的 events/sec
+  legacy   : 旧 derive_tag_local —— 每个事件 PrivateKey.from_hex，auto 时点乘两次
+  engine   : LocalScanEngine.tags —— 私钥解析一次，每个 R 一次点乘
+  pool     : LocalScanEngine.tags_batch(workers=N)（coincurve 后端，多进程）
+
+用法：python3 -m mpc.bench.bench_local_scan [--n 20000] [--codec auto] [--workers 4]
+"""
+import argparse
+import hashlib
+import os
+import time
+
+from web3 import Web3
+from coincurve import PrivateKey, PublicKey
+
+from ..mpc_core.local_scan import LocalScanEngine
+
+def _legacy_x32(R_bytes, view_sk_hex):
+    sk = PrivateKey.from_hex(view_sk_hex[2:])
+    x32 = PublicKey(R_bytes).multiply(sk.secret).format(compressed=False)[1:33]
+    return Web3.keccak(hashlib.sha256(x32).digest())
+
+def _legacy_comp33(R_bytes, view_sk_hex):
+    sk = PrivateKey.from_hex(view_sk_hex[2:])
+    comp33 = PublicKey(R_bytes).multiply(sk.secret).format(compressed=True)
+    return Web3.keccak(hashlib.sha256(comp33).digest())
+
+def _legacy(R_bytes, view_sk_hex, codec):
+    if codec == "x32":
+        return _legacy_x32(R_bytes, view_sk_hex), None
+    if codec == "comp33":
+        return _legacy_comp33(R_bytes, view_sk_hex), None
+    return _legacy_x32(R_bytes, view_sk_hex), _legacy_comp33(R_bytes, view_sk_hex)
+
+def _report(name, n, dt, base=None):
+    line = f"{name:8s} {n / dt:10.0f} ev/s"
+    if base:
+        line += f"  {base / dt:6.2f}x"
+    print(line)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--codec", default="auto", choices=("x32", "comp33", "auto"))
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    sk_hex = "0x" + PrivateKey().secret.hex()
+    Rs = [PrivateKey().public_key.format() for _ in range(args.n)]
+    eng = LocalScanEngine(sk_hex, codec=args.codec)
+
+    # 口径一致性
+    want = _legacy(Rs[0], sk_hex, args.codec)
+    assert eng.tags(Rs[0])[:2] == tuple(bytes(t) if t else None for t in want)
+
+    print(f"events={args.n} codec={args.codec} workers={args.workers}")
+    t0 = time.perf_counter()
+    for R in Rs:
+        _legacy(R, sk_hex, args.codec)
+    base = time.perf_counter() - t0
+    _report("legacy", args.n, base)
+
+    t0 = time.perf_counter()
+    for R in Rs:
+        eng.tags(R)
+    _report("engine", args.n, time.perf_counter() - t0, base)
+
+    t0 = time.perf_counter()
+    eng.tags_batch(Rs, workers=args.workers)
+    _report("pool", args.n, time.perf_counter() - t0, base)
+    eng.close()
+
+if __name__ == "__main__":
+    main()
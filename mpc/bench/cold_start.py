@@ -0,0 +1,100 @@
+# bench/cold_start.py
+"""
+冷启动：每个入口模块在全新解释器里 import 的耗时与峰值 RSS
+
+- 每个目标起 --runs 个子进程，取中位数；RPC 指向不可达地址，确认 import 阶段不联网
+- 同时报告 import 之后 web3 / fastapi 是否已被加载（scanner 子进程、节点不该背 web3）
+
+用法：python3 -m mpc.bench.cold_start [--runs 5] [--only scanner,node_scan] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TARGETS = {
+    "python":        None,  # 空解释器，作为基线
+    "local_scan":    "mpc.mpc_core.local_scan",
+    "threshold_scan": "mpc.mpc_core.threshold_scan",
+    "ecdh_client":   "mpc.mpc_core.ecdh_client",
+    "scanner":       "mpc.scanner",
+    "node_scan":     "mpc.node_scan",
+    "rescan":        "mpc.rescan",
+    "watcher":       "mpc.watcher",
+    "server":        "mpc.server",
+    "payment":       "mpc.payment",
+}
+
+_PROBE = r"""
+import json, resource, sys, time
+t0 = time.perf_counter()
+err = None
+mod = sys.argv[1]
+if mod:
+    try:
+        __import__(mod)
+    except BaseException as e:
+        err = f"{type(e).__name__}: {e}"
+dt = time.perf_counter() - t0
+print("@@" + json.dumps({"ms": dt * 1000, "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                         "web3": "web3" in sys.modules, "fastapi": "fastapi" in sys.modules, "error": err}))
+"""
+
+def _env() -> dict:
+    unreachable = "http://127.0.0.1:1"
+    # payment.py 用绝对导入 mpc_core.*，需要 mpc/ 在 sys.path 上
+    return dict(os.environ, PYTHONPATH=os.path.join(REPO_ROOT, "mpc"), RPC_URL=unreachable, envRPC_URL=unreachable, METRICS_PORT="0",
+                NODE_INDEX="1", VIEW_SK_SHARE_HEX="0x" + "11" * 32,
+                SINGNALBOARD="0x5FbDB2315678afecb367f032d93F642f64180aa3",
+                DB_PATH=os.path.join(REPO_ROOT, ".cold_start.db"))
+
+def measure(module, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", _PROBE, module or ""], cwd=REPO_ROOT, env=_env(),
+                             capture_output=True, text=True, timeout=120).stdout
+        line = next((l for l in out.splitlines() if l.startswith("@@")), None)
+        if line is None:
+            return {"error": "probe printed nothing"}
+        samples.append(json.loads(line[2:]))
+    last = samples[-1]
+    return {
+        "import_ms": round(statistics.median(s["ms"] for s in samples), 1),
+        "rss_mb": round(statistics.median(s["rss_kb"] for s in samples) / 1024, 1),
+        "web3": last["web3"], "fastapi": last["fastapi"], "error": last["error"],
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="cold-start import time and RSS per entry point")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--only", default=None, help="comma-separated target names")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(TARGETS)
+    print(f"{'target':<16} {'import_ms':>10} {'rss_mb':>8}  web3  fastapi  error")
+    results = {}
+    try:
+        for name in names:
+            r = measure(TARGETS[name], args.runs)
+            results[name] = r
+            if "import_ms" not in r:
+                print(f"{name:<16} {r['error']}")
+                continue
+            print(f"{name:<16} {r['import_ms']:>10} {r['rss_mb']:>8}  {'yes' if r['web3'] else 'no':<4}  "
+                  f"{'yes' if r['fastapi'] else 'no':<7}  {r['error'] or ''}", flush=True)
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            p = os.path.join(REPO_ROOT, ".cold_start.db" + suffix)
+            if os.path.exists(p):
+                os.remove(p)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# bench/e2e_load.py
+"""
+端到端压测：桩链 -> watcher.py -> scanner.py -> server.py
+
+- 进程内起桩链（stub_chain）和 t-of-n 桩节点（stub_nodes），watcher / scanner / server 以子进程方式
+  运行真实代码，共用一个临时 SQLite
+- 驱动按 --poll-ms 轮询：DB 里新入库的事件（block -> ingest）、已扫描数，以及 server 的
+  /wallet/sync（block -> inbox，用户真正能看到的时刻）
+- 报告：链上供给速率、scanner 持续吞吐（events/sec），各段延迟 p50 / p99 / max
+  吞吐低于供给速率时积压会持续增长，延迟随压测时长线性变大 —— 这就是流水线的瓶颈点
+
+用法：
+  python3 -m mpc.bench.e2e_load [--events 2000] [--per-block 20] [--block-time 0.5] [--match-rate 0.05]
+                                [--kind signal|announce] [--local] [--node-delay-ms 0] [--json out.json]
+子进程日志与 DB 留在 --workdir（默认临时目录），结束时打印路径
+  额外环境变量原样传给子进程，例如 MPC_SESSION=true LOCAL_SCAN_WORKERS=4 python3 -m mpc.bench.e2e_load
+"""
+import argparse
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import requests
+from coincurve import PrivateKey
+
+from ..mpc_core import storage
+from ..mpc_core.aggregate import SECP_N
+from .stub_chain import CONTRACT_ADDR, StubChain
+from .stub_nodes import StubNodes
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+USER_ID = "loadtest"
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _norm(h: str) -> str:
+    h = (h or "").lower()
+    return h[2:] if h.startswith("0x") else h
+
+def _pct(xs: List[float], q: float) -> Optional[float]:
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+def _lat(xs: List[float]) -> dict:
+    ms = lambda v: None if v is None else round(v * 1000, 1)
+    return {"n": len(xs), "p50_ms": ms(_pct(xs, 0.50)), "p99_ms": ms(_pct(xs, 0.99)),
+            "max_ms": ms(max(xs) if xs else None)}
+
+def _spawn(name: str, args: List[str], env: dict, workdir: str) -> subprocess.Popen:
+    log = open(os.path.join(workdir, f"{name}.log"), "w")
+    return subprocess.Popen([sys.executable, *args], cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+class _Observer:
+    """只读轮询 DB 与 server，记录每个 txhash 第一次出现的时刻"""
+    def __init__(self, db_path: str, server_url: str):
+        self.db_path = db_path
+        self.server_url = server_url
+        self.http = requests.Session()
+        self.ingested: Dict[str, float] = {}
+        self.inbox: Dict[str, float] = {}
+        self.scanned = 0
+        self.all_scanned_at: Optional[float] = None
+        self._last_id = 0
+
+    def poll_db(self, total: int):
+        try:
+            con = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=1.0)
+            try:
+                now = time.time()
+                rows = con.execute("SELECT id, txhash FROM events WHERE id>? ORDER BY id", (self._last_id,)).fetchall()
+                for eid, txhash in rows:
+                    self.ingested.setdefault(_norm(txhash), now)
+                    self._last_id = eid
+                self.scanned = storage.counters(con)["events_done"]  # 含已归档到冷库的
+            finally:
+                con.close()
+        except sqlite3.Error:
+            return  # 表还没建好 / 瞬时锁
+        if self.all_scanned_at is None and self.scanned >= total:
+            self.all_scanned_at = time.time()
+
+    def poll_server(self):
+        try:
+            r = self.http.get(f"{self.server_url}/wallet/sync", params={"user_id": USER_ID}, timeout=2.0)
+            items = r.json().get("inbox", [])
+        except (requests.RequestException, ValueError):
+            return
+        now = time.time()
+        for it in items:
+            self.inbox.setdefault(_norm(it.get("txhash")), now)
+
+def _wait_http(url: str, timeout_s: float) -> bool:
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1.0)
+            return True
+        except requests.RequestException:
+            time.sleep(0.2)
+    return False
+
+def main():
+    ap = argparse.ArgumentParser(description="end-to-end load test: stub chain -> watcher -> scanner -> server")
+    ap.add_argument("--events", type=int, default=2000)
+    ap.add_argument("--per-block", type=int, default=20, help="events per block (density)")
+    ap.add_argument("--block-time", type=float, default=0.5, help="seconds between blocks")
+    ap.add_argument("--match-rate", type=float, default=0.05)
+    ap.add_argument("--kind", default="signal", choices=("signal", "announce"))
+    ap.add_argument("--codec", default="x32", choices=("x32", "comp33"))
+    ap.add_argument("--local", action="store_true", help="scanner uses the local view key (USE_MPC=false)")
+    ap.add_argument("--nodes", type=int, default=3)
+    ap.add_argument("--threshold", type=int, default=2)
+    ap.add_argument("--node-delay-ms", type=float, default=0.0, help="extra per-request delay at each stub node")
+    ap.add_argument("--node-jitter-ms", type=float, default=0.0)
+    ap.add_argument("--watch-interval", type=float, default=0.2, help="WATCH_INTERVAL_S for watcher.py")
+    ap.add_argument("--scan-interval", type=float, default=0.2, help="LOOP_INTERVAL_S for scanner.py")
+    ap.add_argument("--poll-ms", type=float, default=50)
+    ap.add_argument("--timeout", type=float, default=300, help="give up after this many seconds")
+    ap.add_argument("--workdir", default=None)
+    ap.add_argument("--json", default=None, help="also write the report here")
+    args = ap.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="e2e-load-")
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, "mpc_index.db")
+    view_sk = secrets.randbelow(SECP_N - 1) + 1
+    view_pub = PrivateKey(view_sk.to_bytes(32, "big")).public_key.format(compressed=True)
+
+    print(f"🧪 generating {args.events} events ({args.kind}, match_rate={args.match_rate}) …")
+    chain = StubChain(view_pub, args.events, args.per_block, args.block_time, args.match_rate, args.kind, args.codec)
+    nodes = StubNodes(view_sk, args.nodes, args.threshold, args.node_delay_ms, args.node_jitter_ms)
+    if not args.local:
+        nodes.start()
+
+    server_port = _free_port()
+    env = dict(os.environ, DB_PATH=db_path, METRICS_PORT="0", PYTHONUNBUFFERED="1")
+    env_watcher = dict(env, SINGNALBOARD=CONTRACT_ADDR, WATCH_INTERVAL_S=str(args.watch_interval))
+    if args.kind == "announce":
+        # watcher 优先选 Signal：给它一份只含 Announce 的 ABI（按合约 artifact 格式）
+        abi_path = os.path.join(workdir, "announce_abi.json")
+        with open(abi_path, "w") as f:
+            json.dump({"abi": [{"type": "event", "name": "Announce", "anonymous": False, "inputs": [
+                {"indexed": False, "name": "R", "type": "bytes"},
+                {"indexed": False, "name": "memoCipher", "type": "bytes"},
+                {"indexed": True, "name": "commitment", "type": "bytes32"},
+                {"indexed": True, "name": "tag", "type": "bytes32"}]}]}, f)
+        env_watcher["SIGNALBOARD_ABI"] = abi_path
+    env_scanner = dict(env, USER_ID=USER_ID, VIEW_SK_HEX="0x%064x" % view_sk, SCAN_CODEC=args.codec,
+                       USE_MPC="false" if args.local else "true", MPC_NODES=",".join(nodes.urls),
+                       MPC_THRESHOLD=str(args.threshold), LOOP_INTERVAL_S=str(args.scan_interval))
+
+    procs: Dict[str, subprocess.Popen] = {}
+    try:
+        # server 先起：启动较慢，且只读 DB
+        rpc_url = chain.start()
+        procs["server"] = _spawn("server", ["-m", "uvicorn", "mpc.server:app", "--host", "127.0.0.1",
+                                            "--port", str(server_port), "--log-level", "warning"],
+                                 dict(env, RPC_URL=rpc_url), workdir)
+        server_url = f"http://127.0.0.1:{server_port}"
+        if not _wait_http(f"{server_url}/wallet/sync", 60):
+            raise SystemExit(f"❌ server did not come up, see {workdir}/server.log")
+        procs["scanner"] = _spawn("scanner", ["-m", "mpc.scanner"], env_scanner, workdir)
+        # 桩链从 watcher 启动前重新计时，server 的启动时间不算进延迟
+        chain.t0 = time.time()
+        procs["watcher"] = _spawn("watcher", ["-m", "mpc.watcher"], dict(env_watcher, envRPC_URL=rpc_url), workdir)
+        print(f"🚀 rpc={rpc_url} server={server_url} nodes={nodes.urls or '-'} "
+              f"offered={chain.offered_rate:.0f} ev/s over {chain.n_blocks} blocks")
+
+        obs = _Observer(db_path, server_url)
+        deadline = time.time() + args.timeout
+        last_print = 0.0
+        while time.time() < deadline:
+            obs.poll_db(chain.events)
+            obs.poll_server()
+            dead = [n for n, p in procs.items() if p.poll() is not None]
+            if dead:
+                raise SystemExit(f"❌ {', '.join(dead)} exited early, see logs in {workdir}")
+            if obs.all_scanned_at is not None and all(tx in obs.inbox for tx in chain.matches):
+                break
+            if time.time() - last_print >= 2:
+                last_print = time.time()
+                print(f"   head={chain.head()}/{chain.n_blocks} ingested={len(obs.ingested)} "
+                      f"scanned={obs.scanned} inbox={len(obs.inbox)}/{len(chain.matches)}")
+            time.sleep(args.poll_ms / 1000.0)
+        else:
+            print(f"⚠️ timed out after {args.timeout}s")
+    finally:
+        for p in procs.values():
+            p.terminate()
+        for p in procs.values():
+            try:
+                p.wait(5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        chain.stop()
+        nodes.stop()
+
+    ingest_lat = [t - chain.mined_at(chain.blocks[tx]) for tx, t in obs.ingested.items() if tx in chain.blocks]
+    inbox_lat = [t - chain.mined_at(chain.matches[tx]) for tx, t in obs.inbox.items() if tx in chain.matches]
+    ingest_to_inbox = [t - obs.ingested[tx] for tx, t in obs.inbox.items() if tx in obs.ingested]
+    end = obs.all_scanned_at or time.time()
+    first_ingest = min(obs.ingested.values(), default=end)
+    report = {
+        "events": chain.events, "matches": len(chain.matches), "blocks": chain.n_blocks,
+        "kind": args.kind, "mode": "local" if args.local else f"mpc {args.threshold}-of-{args.nodes}",
+        "offered_ev_s": round(chain.offered_rate, 1),
+        "ingested": len(obs.ingested), "scanned": obs.scanned, "inbox": len(obs.inbox),
+        "duration_s": round(end - chain.t0, 3),
+        "events_per_s": round(obs.scanned / (end - chain.t0), 1) if end > chain.t0 else None,
+        "scan_events_per_s": round(obs.scanned / (end - first_ingest), 1) if end > first_ingest else None,
+        "block_to_ingest": _lat(ingest_lat),
+        "ingest_to_inbox": _lat(ingest_to_inbox),
+        "block_to_inbox": _lat(inbox_lat),
+        "node_requests": nodes.served() if not args.local else {},
+        "workdir": workdir,
+    }
+
+    print(f"\n== {report['mode']}  {report['events']} events / {report['blocks']} blocks, "
+          f"{report['matches']} matches, offered {report['offered_ev_s']} ev/s")
+    print(f"throughput      {report['events_per_s']} ev/s end-to-end, {report['scan_events_per_s']} ev/s "
+          f"after first ingest  ({report['scanned']}/{report['events']} scanned in {report['duration_s']}s)")
+    for key in ("block_to_ingest", "ingest_to_inbox", "block_to_inbox"):
+        st = report[key]
+        print(f"{key:<15} n={st['n']:<6} p50={st['p50_ms']}ms  p99={st['p99_ms']}ms  max={st['max_ms']}ms")
+    print(f"logs + db: {workdir}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
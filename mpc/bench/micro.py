@@ -0,0 +1,372 @@
+# bench/micro.py
+"""
+微基准套件：每个事件都会经过的密码学原语，逐项给出 ns/op，并与基线对比出回归报告
+
+覆盖：
+  lagrange.*   λ_i(0)（缓存命中 / 未缓存，t=2、3）
+  point.*      33B 解析、点乘、t 点 combine
+  aggregate.*  Σ λ_i·Y_i：legacy（逐点乘 + 两两相加）/ cached / session（见 bench_aggregate）
+  tag.*        keccak(sha256(x32 | comp33))，以及本地引擎 R -> tag 全程
+  ecies.*      ecies_decrypt_secp256k1（私钥 ECDH + 解密）/ ecies_decrypt_with_shared（已有 S）
+  shamir.*     shamir_split / shamir_reconstruct（P = 2^127-1）
+  beaver.*     beaver_triple / mpc_multiply（3 方）
+
+计时方法（同 timeit）：关 GC，先自动标定每轮循环次数使一轮 >= --min-time，再跑 --repeat 轮，
+取最小值作为 ns/op（噪声只会让时间变长，最小值最稳定），中位数与离散度一起报告。
+输入按固定种子预生成并轮换使用，避免只测到同一个点。
+
+基线：
+  --save baselines/micro.json    记录本机结果（含 python / coincurve 版本与 calib）
+  --compare baselines/micro.json 对比；慢于基线 --threshold（默认 10%）且超出本次噪声的算回归，退出码 1
+  calib 是一段固定的纯 Python 负载；换机器后用 --normalize 按 calib 比例折算，跨机器也能粗略对比
+
+用法：python3 -m mpc.bench.micro [--filter tag] [--repeat 7] [--min-time 0.2] [--compare mpc/bench/baselines/micro.json]
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import coincurve
+from coincurve import PrivateKey, PublicKey
+
+from ..mpc_core.aggregate import SECP_N, _lagrange_at_zero, aggregate_shares, combine_points, lagrange_coeffs_at_zero
+from ..mpc_core.beaver import beaver_triple, mpc_multiply
+from ..mpc_core.crypto import ecies_decrypt_secp256k1, ecies_decrypt_with_shared, ecies_encrypt_secp256k1
+from ..mpc_core.local_scan import LocalScanEngine, _tag
+from ..mpc_core.shamir import shamir_reconstruct, shamir_split
+from .bench_aggregate import _legacy_aggregate
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "micro.json")
+POOL = 64  # 每个用例预生成的输入个数
+
+# =============================================================================
+# 用例：setup(rng) -> 无参函数，每次调用做一次被测操作
+# =============================================================================
+CASES: Dict[str, Callable[[random.Random], Callable[[], object]]] = {}
+
+def case(name: str):
+    def deco(setup):
+        CASES[name] = setup
+        return setup
+    return deco
+
+def _cycle(items: List):
+    """轮换输入；取下一个输入的固定开销见 baseline.noop"""
+    n = len(items)
+    state = [0]
+
+    def nxt():
+        state[0] = (state[0] + 1) % n
+        return items[state[0]]
+    return nxt
+
+def _scalar(rng: random.Random) -> int:
+    return rng.randrange(1, SECP_N)
+
+def _point(rng: random.Random) -> PublicKey:
+    return PrivateKey(_scalar(rng).to_bytes(32, "big")).public_key
+
+@case("baseline.noop")
+def _noop(rng):
+    nxt = _cycle(list(range(POOL)))
+    return lambda: nxt()
+
+# ---- Lagrange ---------------------------------------------------------------
+@case("lagrange.cached.t2")
+def _lag_cached(rng):
+    return lambda: lagrange_coeffs_at_zero([1, 2])
+
+@case("lagrange.uncached.t2")
+def _lag_t2(rng):
+    return lambda: _lagrange_at_zero.__wrapped__((1, 2))
+
+@case("lagrange.uncached.t3")
+def _lag_t3(rng):
+    return lambda: _lagrange_at_zero.__wrapped__((1, 2, 3))
+
+# ---- 点运算 -----------------------------------------------------------------
+@case("point.parse33")
+def _parse(rng):
+    nxt = _cycle([_point(rng).format() for _ in range(POOL)])
+    return lambda: PublicKey(nxt())
+
+@case("point.multiply")
+def _mul(rng):
+    nxt = _cycle([(_point(rng), _scalar(rng).to_bytes(32, "big")) for _ in range(POOL)])
+
+    def op():
+        P, k = nxt()
+        return P.multiply(k)
+    return op
+
+@case("point.combine.t2")
+def _comb2(rng):
+    nxt = _cycle([[_point(rng) for _ in range(2)] for _ in range(POOL)])
+    return lambda: combine_points(nxt())
+
+@case("point.combine.t3")
+def _comb3(rng):
+    nxt = _cycle([[_point(rng) for _ in range(3)] for _ in range(POOL)])
+    return lambda: combine_points(nxt())
+
+# ---- 聚合（节点返回 33B 字节，与 scanner 收到的一致）--------------------------
+def _agg_inputs(rng, t: int):
+    ys = [_scalar(rng) for _ in range(t)]
+    lams = lagrange_coeffs_at_zero(list(range(1, t + 1)))
+    out = []
+    for _ in range(POOL):
+        R = _point(rng)
+        shares = [(i + 1, R.multiply(y.to_bytes(32, "big")).format()) for i, y in enumerate(ys)]
+        weighted = [R.multiply(((l * y) % SECP_N).to_bytes(32, "big")).format() for l, y in zip(lams, ys)]
+        out.append((shares, weighted))
+    return _cycle(out)
+
+@case("aggregate.legacy.t2")
+def _agg_legacy(rng):
+    nxt = _agg_inputs(rng, 2)
+    return lambda: _legacy_aggregate(nxt()[0])
+
+@case("aggregate.cached.t2")
+def _agg_cached(rng):
+    nxt = _agg_inputs(rng, 2)
+    return lambda: aggregate_shares(nxt()[0])
+
+@case("aggregate.session.t2")
+def _agg_session(rng):
+    nxt = _agg_inputs(rng, 2)
+    return lambda: combine_points(nxt()[1])
+
+@case("aggregate.cached.t3")
+def _agg_cached3(rng):
+    nxt = _agg_inputs(rng, 3)
+    return lambda: aggregate_shares(nxt()[0])
+
+# ---- tag --------------------------------------------------------------------
+@case("tag.x32")
+def _tag_x32(rng):
+    nxt = _cycle([_point(rng) for _ in range(POOL)])
+    return lambda: _tag(nxt().format(compressed=False)[1:33])
+
+@case("tag.comp33")
+def _tag_comp33(rng):
+    nxt = _cycle([_point(rng) for _ in range(POOL)])
+    return lambda: _tag(nxt().format(compressed=True))
+
+@case("tag.local_engine.x32")
+def _tag_engine(rng):
+    eng = LocalScanEngine("0x%064x" % _scalar(rng), codec="x32")
+    nxt = _cycle([_point(rng).format() for _ in range(POOL)])
+    return lambda: eng.tags(nxt())
+
+# ---- ECIES ------------------------------------------------------------------
+def _ecies_inputs(rng):
+    sk = _scalar(rng)
+    pub = PrivateKey(sk.to_bytes(32, "big")).public_key.format()
+    return sk, [ecies_encrypt_secp256k1(pub, os.urandom(64)) for _ in range(POOL)]
+
+@case("ecies.decrypt_secp256k1")
+def _ecies_dec(rng):
+    sk, items = _ecies_inputs(rng)
+    sk_hex = "%064x" % sk
+    nxt = _cycle(items)
+
+    def op():
+        eph, iv, ct = nxt()
+        return ecies_decrypt_secp256k1(sk_hex, eph, iv, ct)
+    return op
+
+@case("ecies.decrypt_with_shared")
+def _ecies_shared(rng):
+    nxt = _cycle([(os.urandom(32), os.urandom(16), os.urandom(64)) for _ in range(POOL)])
+
+    def op():
+        x32, iv, ct = nxt()
+        return ecies_decrypt_with_shared(x32, iv, ct)
+    return op
+
+# ---- Shamir / Beaver --------------------------------------------------------
+@case("shamir.split.3of2")
+def _sh_split(rng):
+    nxt = _cycle([rng.randrange(0, 2**127 - 1) for _ in range(POOL)])
+    return lambda: shamir_split(nxt(), 3, 2)
+
+@case("shamir.reconstruct.t2")
+def _sh_rec(rng):
+    nxt = _cycle([shamir_split(rng.randrange(0, 2**127 - 1), 3, 2)[:2] for _ in range(POOL)])
+    return lambda: shamir_reconstruct(nxt())
+
+@case("beaver.triple")
+def _bv_triple(rng):
+    return lambda: beaver_triple(3, 2)
+
+@case("beaver.mpc_multiply")
+def _bv_mul(rng):
+    items = []
+    for _ in range(POOL):
+        x, y = rng.randrange(0, 2**64), rng.randrange(0, 2**64)
+        items.append((shamir_split(x, 3, 2), shamir_split(y, 3, 2), beaver_triple(3, 2)))
+    nxt = _cycle(items)
+
+    def op():
+        xs, ys, triple = nxt()
+        return mpc_multiply(xs, ys, triple)
+    return op
+
+# =============================================================================
+# 计时
+# =============================================================================
+def _calib_op():
+    # 固定的纯 Python 负载：整数运算 + 小循环 + 一次 C 哈希，用来折算机器速度
+    acc = 0
+    for i in range(200):
+        acc = (acc * 31 + i) & 0xFFFFFFFF
+    return hashlib.sha256(acc.to_bytes(4, "big")).digest()
+
+def _time_op(op: Callable[[], object], repeat: int, min_time: float) -> Tuple[float, float, float]:
+    """返回 (min_ns, median_ns, spread)，spread = (p75 - p25) / median"""
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            op()
+        dt = time.perf_counter() - t0
+        if dt >= min_time / 4 or loops >= 1 << 24:
+            break
+        loops *= 4 if dt < min_time / 40 else 2
+    loops = max(1, int(loops * (min_time / max(dt, 1e-9))))
+
+    samples: List[float] = []
+    gc_was_on = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for _ in range(loops):
+                op()
+            samples.append((time.perf_counter() - t0) / loops * 1e9)
+    finally:
+        if gc_was_on:
+            gc.enable()
+    samples.sort()
+    med = statistics.median(samples)
+    q = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))]
+    return samples[0], med, (q(0.75) - q(0.25)) / med if med else 0.0
+
+def run(names: List[str], repeat: int, min_time: float, seed: int = 2025) -> dict:
+    calib = _time_op(_calib_op, repeat, min_time)[0]
+    results: Dict[str, dict] = {}
+    for name in names:
+        op = CASES[name](random.Random(f"{seed}:{name}"))
+        op()  # 预热（lru_cache、模块内部缓存）
+        best, med, spread = _time_op(op, repeat, min_time)
+        results[name] = {"ns": round(best, 1), "median_ns": round(med, 1), "spread": round(spread, 4)}
+        print(f"  {name:<28} {best:12.1f} ns/op  (median {med:.1f}, ±{spread * 100:.1f}%)", flush=True)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "coincurve": getattr(coincurve, "__version__", "?"),
+            "calib_ns": round(calib, 1),
+            "repeat": repeat,
+            "min_time": min_time,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+
+# =============================================================================
+# 对比基线
+# =============================================================================
+def compare(current: dict, baseline: dict, threshold: float, normalize: bool) -> Tuple[str, List[str]]:
+    scale = 1.0
+    if normalize and baseline["meta"].get("calib_ns"):
+        scale = current["meta"]["calib_ns"] / baseline["meta"]["calib_ns"]
+    lines = [f"{'case':<28} {'ns/op':>12} {'baseline':>12} {'delta':>8}  verdict"]
+    regressions: List[str] = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            lines.append(f"{name:<28} {cur['ns']:12.1f} {'-':>12} {'-':>8}  new")
+            continue
+        expected = base["ns"] * scale
+        delta = cur["ns"] / expected - 1.0
+        # 本次与基线各自的离散度都算作噪声带
+        noise = max(cur["spread"], base.get("spread", 0.0))
+        if delta > threshold and delta > noise:
+            verdict = "REGRESSION"
+            regressions.append(name)
+        elif delta < -threshold and -delta > noise:
+            verdict = "faster"
+        else:
+            verdict = "ok"
+        lines.append(f"{name:<28} {cur['ns']:12.1f} {expected:12.1f} {delta * 100:+7.1f}%  {verdict}")
+    missing = sorted(set(baseline["results"]) - set(current["results"]))
+    header = (f"baseline {baseline['meta'].get('created', '?')} "
+              f"(python {baseline['meta'].get('python')}, coincurve {baseline['meta'].get('coincurve')})")
+    if normalize:
+        header += f"  normalized by calib x{scale:.3f}"
+    if missing and len(current["results"]) == len(CASES):
+        header += f"\nno longer measured: {', '.join(missing)}"
+    return header + "\n" + "\n".join(lines), regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="crypto hot-path microbenchmarks with baseline comparison")
+    ap.add_argument("--filter", default=None, help="regex on case names")
+    ap.add_argument("--list", action="store_true")
+    ap.add_argument("--repeat", type=int, default=7)
+    ap.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    ap.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, default=None, help="write results as the new baseline")
+    ap.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, default=None, help="baseline JSON to compare with")
+    ap.add_argument("--threshold", type=float, default=0.10, help="relative slowdown that counts as a regression")
+    ap.add_argument("--normalize", action="store_true", help="scale the baseline by the calib ratio (other machine)")
+    ap.add_argument("--json", default=None, help="also write this run's results here")
+    args = ap.parse_args()
+
+    names = [n for n in CASES if not args.filter or re.search(args.filter, n)]
+    if args.list:
+        print("\n".join(names))
+        return
+    if not names:
+        raise SystemExit(f"no case matches {args.filter!r}")
+
+    print(f"micro: {len(names)} case(s), repeat={args.repeat}, min_time={args.min_time}s")
+    current = run(names, args.repeat, args.min_time)
+    print(f"  calib {current['meta']['calib_ns']} ns")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        if os.path.exists(args.save) and args.filter:
+            # 只重测了部分用例：合并进已有基线
+            with open(args.save) as f:
+                old = json.load(f)
+            old["results"].update(current["results"])
+            old["meta"] = current["meta"]
+            current = old
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+        print(f"💾 baseline -> {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report, regressions = compare(current, baseline, args.threshold, args.normalize)
+        print("\n" + report)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✅ no regressions")
+
+if __name__ == "__main__":
+    main()
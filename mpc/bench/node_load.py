@@ -0,0 +1,274 @@
+# bench/node_load.py
+"""
+压测单个 node_scan.py：/scan_share 或 /scan_share_batch，逐级提高并发，给出吞吐、尾延迟与 CPU
+
+- R 为预生成的合法随机点（不把客户端点乘算进来）
+- 每级并发跑 --duration 秒（前 --warmup 秒不计），每个并发一个线程 + 自己的连接
+- 指标：req/s、points/s、p50 / p99 / p999 延迟、503 与错误数、节点 CPU%（读 /proc/<pid>/stat）、压测端 CPU%
+  压测端 CPU 接近 100% 时结果受客户端限制，应换更快的机器或多开几个压测进程
+- 对比：--mode / --transport / --encoding 都可以逗号分隔，按笛卡尔积逐个跑
+    transport  keepalive（一条连接复用）| close（每个请求新建 TCP 连接）
+    encoding   hex | base64（仅 batch；single 接口固定 hex）
+
+默认在本机起一个节点子进程（NODE_INDEX=1、随机分片；NODE_* 环境变量原样传入），
+也可以用 --url 指向已有节点，配合 --pid 采集其 CPU。
+
+用法：
+  python3 -m mpc.bench.node_load [--concurrency 1,2,4,8,16,32] [--duration 5]
+                                 [--mode single,batch] [--batch 32] [--encoding hex,base64]
+                                 [--transport keepalive,close] [--session] [--json out.json]
+"""
+import argparse
+import base64
+import http.client
+import itertools
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from coincurve import PrivateKey
+
+from ..mpc_core.aggregate import SECP_N
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _proc_cpu_s(pid: Optional[int]) -> Optional[float]:
+    """/proc/<pid>/stat 里的 utime + stime（秒）；拿不到返回 None"""
+    if not pid:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / _CLK_TCK
+    except (OSError, IndexError, ValueError):
+        return None
+
+def _pct(xs: List[float], q: float) -> Optional[float]:
+    if not xs:
+        return None
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+def _make_points(n: int) -> List[bytes]:
+    return [PrivateKey((secrets.randbelow(SECP_N - 1) + 1).to_bytes(32, "big")).public_key.format() for _ in range(n)]
+
+# =============================================================================
+# 压测
+# =============================================================================
+class _Config:
+    def __init__(self, mode: str, transport: str, encoding: str, batch: int, lane: str, session: Optional[str]):
+        self.mode = mode
+        self.transport = transport
+        self.encoding = encoding if mode == "batch" else "hex"
+        self.batch = batch if mode == "batch" else 1
+        self.lane = lane
+        self.session = session
+
+    @property
+    def label(self) -> str:
+        if self.mode == "batch":
+            return f"batch{self.batch}/{self.encoding}/{self.transport}"
+        return f"single/{self.transport}"
+
+    def body(self, points: List[bytes], k: int) -> bytes:
+        if self.mode == "batch":
+            Rs = [points[(k + j) % len(points)] for j in range(self.batch)]
+            enc = (lambda b: base64.b64encode(b).decode()) if self.encoding == "base64" else (lambda b: "0x" + b.hex())
+            payload = {"Rs": [enc(R) for R in Rs], "lane": self.lane, "encoding": self.encoding}
+        else:
+            payload = {"R": "0x" + points[k % len(points)].hex(), "lane": self.lane}
+        if self.session:
+            payload["session"] = self.session
+        return json.dumps(payload).encode()
+
+    @property
+    def path(self) -> str:
+        return "/scan_share_batch" if self.mode == "batch" else "/scan_share"
+
+def _worker(url, cfg: _Config, bodies: List[bytes], stop: threading.Event, t_measure: float, out: dict):
+    u = urlparse(url)
+    conn = None
+    lat: List[float] = []
+    status: Dict[str, int] = {}
+    k = 0
+    headers = {"Content-Type": "application/json"}
+    if cfg.transport == "close":
+        headers["Connection"] = "close"
+    while not stop.is_set():
+        body = bodies[k % len(bodies)]
+        k += 1
+        t0 = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+            conn.request("POST", cfg.path, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            code = str(resp.status)
+            if cfg.transport == "close" or resp.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException) as e:
+            code = type(e).__name__
+            if conn is not None:
+                conn.close()
+            conn = None
+        dt = time.perf_counter() - t0
+        if t0 >= t_measure:
+            status[code] = status.get(code, 0) + 1
+            if code == "200":
+                lat.append(dt)
+    if conn is not None:
+        conn.close()
+    out["lat"] = lat
+    out["status"] = status
+
+def run_level(url: str, cfg: _Config, concurrency: int, duration: float, warmup: float,
+              points: List[bytes], node_pid: Optional[int]) -> dict:
+    bodies = [cfg.body(points, k * cfg.batch) for k in range(max(64, len(points) // cfg.batch))]
+    stop = threading.Event()
+    outs = [dict() for _ in range(concurrency)]
+    t_measure = time.perf_counter() + warmup
+    threads = [threading.Thread(target=_worker, args=(url, cfg, bodies, stop, t_measure, outs[i]), daemon=True)
+               for i in range(concurrency)]
+    for th in threads:
+        th.start()
+    time.sleep(warmup)
+    cpu_node0, cpu_me0, w0 = _proc_cpu_s(node_pid), os.times(), time.perf_counter()
+    time.sleep(duration)
+    cpu_node1, cpu_me1, w1 = _proc_cpu_s(node_pid), os.times(), time.perf_counter()
+    stop.set()
+    for th in threads:
+        th.join()
+
+    wall = w1 - w0
+    lat = sorted(x for o in outs for x in o["lat"])
+    status: Dict[str, int] = {}
+    for o in outs:
+        for code, n in o["status"].items():
+            status[code] = status.get(code, 0) + n
+    ok = len(lat)
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    me = (cpu_me1.user + cpu_me1.system) - (cpu_me0.user + cpu_me0.system)
+    return {
+        "config": cfg.label, "concurrency": concurrency, "ok": ok,
+        "rejected": status.get("503", 0), "errors": sum(n for c, n in status.items() if c not in ("200", "503")),
+        "req_s": round(ok / wall, 1), "points_s": round(ok * cfg.batch / wall, 1),
+        "p50_ms": ms(_pct(lat, 0.50)), "p99_ms": ms(_pct(lat, 0.99)), "p999_ms": ms(_pct(lat, 0.999)),
+        "node_cpu_pct": None if cpu_node0 is None or cpu_node1 is None else round((cpu_node1 - cpu_node0) / wall * 100, 1),
+        "client_cpu_pct": round(me / wall * 100, 1),
+        "status": status,
+    }
+
+def _open_session(url: str) -> str:
+    u = urlparse(url)
+    conn = http.client.HTTPConnection(u.hostname, u.port, timeout=10)
+    conn.request("GET", "/whoami")
+    me = json.loads(conn.getresponse().read())["index"]
+    other = 1 if me != 1 else 2
+    conn.request("POST", "/session", body=json.dumps({"participants": [me, other]}),
+                 headers={"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    data = json.loads(resp.read())
+    conn.close()
+    if resp.status != 200:
+        raise SystemExit(f"❌ /session failed: {data}")
+    return data["session"]
+
+def _spawn_node(port: int, max_conc: int) -> subprocess.Popen:
+    env = dict(os.environ, NODE_INDEX=os.getenv("NODE_INDEX", "1"),
+               VIEW_SK_SHARE_HEX=os.getenv("VIEW_SK_SHARE_HEX", "0x%064x" % (secrets.randbelow(SECP_N - 1) + 1)))
+    # 默认队列放宽到最大并发，测的是节点算力；要测准入行为就显式设置 NODE_QUEUE_MAX
+    env.setdefault("NODE_QUEUE_MAX", str(max(64, max_conc)))
+    cmd = [sys.executable, "-m", "uvicorn", "mpc.node_scan:app", "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            conn.getresponse().read()
+            conn.close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise SystemExit("❌ node exited during startup")
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("❌ node did not come up")
+
+def main():
+    ap = argparse.ArgumentParser(description="load test a single scan node (/scan_share, /scan_share_batch)")
+    ap.add_argument("--url", default=None, help="existing node; default spawns one locally")
+    ap.add_argument("--pid", type=int, default=None, help="node pid for CPU sampling when --url is used")
+    ap.add_argument("--concurrency", default="1,2,4,8,16,32")
+    ap.add_argument("--duration", type=float, default=5.0, help="measured seconds per level")
+    ap.add_argument("--warmup", type=float, default=1.0)
+    ap.add_argument("--mode", default="single", help="single,batch")
+    ap.add_argument("--batch", type=int, default=32, help="points per /scan_share_batch request")
+    ap.add_argument("--encoding", default="hex", help="hex,base64 (batch only)")
+    ap.add_argument("--transport", default="keepalive", help="keepalive,close")
+    ap.add_argument("--lane", default="live", choices=("live", "backfill"))
+    ap.add_argument("--session", action="store_true", help="open a participant session (weighted shares)")
+    ap.add_argument("--points", type=int, default=1024, help="distinct random R points")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    split = lambda s: [x.strip() for x in s.split(",") if x.strip()]
+    proc = None
+    url, node_pid = args.url, args.pid
+    if url is None:
+        port = _free_port()
+        proc = _spawn_node(port, max(levels))
+        url, node_pid = f"http://127.0.0.1:{port}", proc.pid
+    try:
+        points = _make_points(args.points)
+        session = _open_session(url) if args.session else None
+        configs = [_Config(m, t, e, args.batch, args.lane, session)
+                   for m, t, e in itertools.product(split(args.mode), split(args.transport), split(args.encoding))]
+        # single 不区分编码：去重
+        seen, uniq = set(), []
+        for c in configs:
+            if c.label not in seen:
+                seen.add(c.label)
+                uniq.append(c)
+
+        print(f"🎯 {url}  levels={levels}  {args.duration}s/level  cpus={os.cpu_count()}")
+        print(f"{'config':<26} {'conc':>5} {'req/s':>9} {'points/s':>9} {'p50ms':>8} {'p99ms':>8} {'p999ms':>8} "
+              f"{'503':>6} {'err':>5} {'nodeCPU%':>9} {'cliCPU%':>8}")
+        results = []
+        for cfg in uniq:
+            for c in levels:
+                r = run_level(url, cfg, c, args.duration, args.warmup, points, node_pid)
+                results.append(r)
+                fmt = lambda v: "-" if v is None else v
+                print(f"{r['config']:<26} {c:>5} {r['req_s']:>9} {r['points_s']:>9} {fmt(r['p50_ms']):>8} "
+                      f"{fmt(r['p99_ms']):>8} {fmt(r['p999_ms']):>8} {r['rejected']:>6} {r['errors']:>5} "
+                      f"{fmt(r['node_cpu_pct']):>9} {r['client_cpu_pct']:>8}", flush=True)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"url": url, "cpus": os.cpu_count(), "results": results}, f, indent=2)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench/store_pipeline.py
+"""
+存储后端吞吐上限：同一条 watcher -> scanner -> server 存取路径，分别跑在 SQLite 与内存后端上
+
+- ingest：逐条 insert_event + 提交（watcher 的写法），每 100 条推进一次 last_block
+- scan：claim（live / backfill 两条车道交替）-> mark_scanned，每 --match-every 条写一条 inbox（scanner 的写法）
+- read：fetch_inbox + counters（server /wallet/sync 与 /metrics 的读法）
+不做点乘 / 哈希：量的是去掉密码学之后存储本身能跑多快，内存后端即“没有数据库”时的上限
+
+用法：python3 -m mpc.bench.store_pipeline [--events 20000] [--batch 200] [--backends sqlite,memory] [--json out.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from ..mpc_core import stores
+
+def run(store: "stores.Store", events: int, batch: int, match_every: int, reads: int) -> dict:
+    store.migrate()
+    out = {}
+    t0 = time.perf_counter()
+    for i in range(events):
+        store.insert_event(i // 4, f"0x{i:064x}", os.urandom(32), b"\x02" + os.urandom(32), os.urandom(48), os.urandom(32))
+        if i % 100 == 99:
+            store.set_meta("last_block", i // 4)
+    out["ingest_ev_s"] = events / (time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    done = matched = 0
+    lane = "live"
+    floor = max(0, store.max_event_id() - batch * 5)
+    while done < events:
+        rows = store.claim(lane, floor, batch, "bench", 60)
+        if not rows:
+            other = "backfill" if lane == "live" else "live"
+            rows = store.claim(other, floor, batch, "bench", 60)
+            if not rows:
+                break
+        for eid, tag, R, memo, commitment, _created in rows:
+            hit = eid % match_every == 0
+            if hit:
+                store.insert_inbox("alice", eid, tag, R, memo, commitment, None)
+                matched += 1
+            store.mark_scanned(eid, int(hit))
+        done += len(rows)
+        lane = "backfill" if lane == "live" else "live"
+    out["scan_ev_s"] = done / (time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for _ in range(reads):
+        inbox = store.fetch_inbox("alice", limit=50)
+        c = store.counters()
+    out["read_req_s"] = reads / (time.perf_counter() - t0)
+    assert c["events_done"] == done == events and c["inbox:alice"] == matched and len(inbox) == min(50, matched), c
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="storage backend throughput ceiling (no crypto)")
+    ap.add_argument("--events", type=int, default=20000)
+    ap.add_argument("--batch", type=int, default=200, help="events per claim")
+    ap.add_argument("--match-every", type=int, default=100)
+    ap.add_argument("--reads", type=int, default=2000)
+    ap.add_argument("--backends", default=",".join(stores.BACKENDS))
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="store_bench_")
+    print(f"{'backend':<8} {'ingest ev/s':>12} {'scan ev/s':>12} {'read req/s':>12}")
+    try:
+        for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            path = os.path.join(workdir, "bench.db") if name == "sqlite" else "bench"
+            r = run(stores.open_store(path, backend=name, component="bench"),
+                    args.events, args.batch, args.match_every, args.reads)
+            results[name] = {k: round(v, 1) for k, v in r.items()}
+            print(f"{name:<8} {r['ingest_ev_s']:>12.0f} {r['scan_ev_s']:>12.0f} {r['read_req_s']:>12.0f}", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
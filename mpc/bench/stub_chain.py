@@ -0,0 +1,233 @@
+# bench/stub_chain.py
+"""
+压测用的本地 JSON-RPC 桩链：按固定出块间隔“出块”，返回合成的 Signal / Announce 日志
+
+- 事件全部预先生成（点乘不计入压测时间），出块只是把 head 往前推
+- density：每块事件数；match_rate：命中给定 view 公钥的比例
+- 命中事件与真实发送方一致：R = r·G，S = r·V，tag = keccak(sha256(x32(S)))（comp33 同理），
+  memo = iv || AES-CTR(HKDF(x32(S)))，scanner 命中后能正常解出明文
+- 只实现 watcher / server 用到的方法：eth_blockNumber / eth_getLogs / eth_chainId /
+  net_version / web3_clientVersion / eth_getCode，支持批量请求
+- mined_at(block) 给出每块的出块时刻（time.time()），供驱动算 block -> inbox 延迟
+
+单独运行（配合手动起的 watcher 调试）：
+  python3 -m mpc.bench.stub_chain --view-pub 0x02.. [--events 1000] [--per-block 10] [--block-time 0.2]
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from coincurve import PrivateKey, PublicKey
+from eth_abi import encode as abi_encode
+from web3 import Web3
+
+from ..mpc_core.aggregate import SECP_N
+from ..mpc_core.crypto import encrypt_memo_with_shared
+
+CONTRACT_ADDR = "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+CHAIN_ID = 31337
+
+SIGNAL_TOPIC = Web3.keccak(text="Signal(bytes32,bool,bytes32,bytes)")
+ANNOUNCE_TOPIC = Web3.keccak(text="Announce(bytes,bytes,bytes32,bytes32)")
+
+def _hex(b: bytes) -> str:
+    return "0x" + b.hex()
+
+def _norm(h: str) -> str:
+    h = h.lower()
+    return h[2:] if h.startswith("0x") else h
+
+def _block_arg(v, head: int) -> int:
+    if v is None or v in ("latest", "safe", "finalized", "pending"):
+        return head
+    if v == "earliest":
+        return 0
+    return int(v, 16) if isinstance(v, str) else int(v)
+
+def _shared_tag(S: PublicKey, codec: str) -> bytes:
+    enc = S.format(compressed=False)[1:33] if codec == "x32" else S.format(compressed=True)
+    return Web3.keccak(hashlib.sha256(enc).digest())
+
+def _memo(S: PublicKey, R: bytes, plaintext: bytes) -> bytes:
+    # 与前端 senderAssembleAnnouncement 同一格式：密钥由 x32(r·V) 派生，R 作附加数据
+    return encrypt_memo_with_shared(S.format(compressed=False)[1:33], R, plaintext)
+
+class StubChain:
+    def __init__(self, view_pub: bytes, events: int = 1000, per_block: int = 10, block_time: float = 0.2,
+                 match_rate: float = 0.05, kind: str = "signal", codec: str = "x32", seed: Optional[int] = None):
+        if kind not in ("signal", "announce"):
+            raise ValueError("kind must be signal or announce")
+        if codec not in ("x32", "comp33"):
+            raise ValueError("codec must be x32 or comp33")
+        self.kind = kind
+        self.per_block = max(1, per_block)
+        self.block_time = block_time
+        self.n_blocks = (events + self.per_block - 1) // self.per_block
+        self.t0: Optional[float] = None
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+        rng = random.Random(seed)
+        V = PublicKey(view_pub)
+        self.logs: Dict[int, List[dict]] = {}
+        self.matches: Dict[str, int] = {}  # txhash(无 0x 小写) -> block
+        self.blocks: Dict[str, int] = {}   # 所有事件 txhash -> block
+        for n in range(events):
+            block = 1 + n // self.per_block
+            r = PrivateKey(rng.randrange(1, SECP_N).to_bytes(32, "big"))
+            R = r.public_key.format(compressed=True)
+            txhash = rng.getrandbits(256).to_bytes(32, "big")
+            if rng.random() < match_rate:
+                S = V.multiply(r.secret)
+                tag = _shared_tag(S, codec)
+                memo = _memo(S, R, b"loadtest:%d" % n)
+                self.matches[txhash.hex()] = block
+            else:
+                tag = rng.getrandbits(256).to_bytes(32, "big")
+                memo = rng.getrandbits(8 * 48).to_bytes(48, "big")
+            self.blocks[txhash.hex()] = block
+            self.logs.setdefault(block, []).append(self._log(block, n % self.per_block, txhash, R, tag, memo))
+
+    def _log(self, block: int, idx: int, txhash: bytes, R: bytes, tag: bytes, memo: bytes) -> dict:
+        if self.kind == "signal":
+            topics = [SIGNAL_TOPIC, R[1:], tag]
+            data = abi_encode(["bool", "bytes"], [R[0] == 3, memo])
+        else:
+            commitment = hashlib.sha256(txhash).digest()
+            topics = [ANNOUNCE_TOPIC, commitment, tag]
+            data = abi_encode(["bytes", "bytes"], [R, memo])
+        return {
+            "address": CONTRACT_ADDR,
+            "topics": [_hex(t) for t in topics],
+            "data": _hex(data),
+            "blockNumber": hex(block),
+            "blockHash": _hex(block.to_bytes(32, "big")),
+            "transactionHash": _hex(txhash),
+            "transactionIndex": hex(idx),
+            "logIndex": hex(idx),
+            "removed": False,
+        }
+
+    @property
+    def events(self) -> int:
+        return len(self.blocks)
+
+    @property
+    def offered_rate(self) -> float:
+        return self.per_block / self.block_time if self.block_time > 0 else float("inf")
+
+    # ------------------------------------------------------------------ 出块
+    def head(self) -> int:
+        if self.t0 is None:
+            return 0
+        if self.block_time <= 0:
+            return self.n_blocks
+        return min(self.n_blocks, int((time.time() - self.t0) / self.block_time))
+
+    def mined_at(self, block: int) -> float:
+        return self.t0 + block * self.block_time
+
+    def all_mined(self) -> bool:
+        return self.head() >= self.n_blocks
+
+    # ------------------------------------------------------------------ RPC
+    def _get_logs(self, flt: dict) -> List[dict]:
+        head = self.head()
+        lo = max(1, _block_arg(flt.get("fromBlock"), head))
+        hi = min(head, _block_arg(flt.get("toBlock"), head))
+        topics = flt.get("topics") or []
+        want = _norm(topics[0]) if topics and isinstance(topics[0], str) else None
+        out: List[dict] = []
+        for b in range(lo, hi + 1):
+            for lg in self.logs.get(b, ()):
+                if want is None or _norm(lg["topics"][0]) == want:
+                    out.append(lg)
+        return out
+
+    def handle(self, method: str, params: list):
+        if method == "eth_blockNumber":
+            return hex(self.head())
+        if method == "eth_getLogs":
+            return self._get_logs(params[0] if params else {})
+        if method == "eth_chainId":
+            return hex(CHAIN_ID)
+        if method == "net_version":
+            return str(CHAIN_ID)
+        if method == "web3_clientVersion":
+            return "stub-chain/0.1"
+        if method == "eth_getCode":
+            return "0x6080604052"
+        raise KeyError(method)
+
+    def _dispatch(self, req: dict) -> dict:
+        rid = req.get("id")
+        try:
+            return {"jsonrpc": "2.0", "id": rid, "result": self.handle(req.get("method"), req.get("params") or [])}
+        except KeyError:
+            return {"jsonrpc": "2.0", "id": rid, "error": {"code": -32601, "message": f"method not found: {req.get('method')}"}}
+
+    def start(self, port: int = 0, addr: str = "127.0.0.1") -> str:
+        """起 HTTP 服务并从此刻开始出块；返回 RPC URL"""
+        chain = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+                try:
+                    req = json.loads(body)
+                    resp = [chain._dispatch(r) for r in req] if isinstance(req, list) else chain._dispatch(req)
+                    out, code = json.dumps(resp).encode(), 200
+                except ValueError:
+                    out, code = b'{"jsonrpc":"2.0","id":null,"error":{"code":-32700,"message":"parse error"}}', 400
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((addr, port), _Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name="stub-chain", daemon=True).start()
+        self.t0 = time.time()
+        return f"http://{addr}:{self._httpd.server_address[1]}"
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+def main():
+    ap = argparse.ArgumentParser(description="stub JSON-RPC chain serving synthetic Signal/Announce logs")
+    ap.add_argument("--view-pub", required=True, help="0x.. 33B view public key that matching events target")
+    ap.add_argument("--events", type=int, default=1000)
+    ap.add_argument("--per-block", type=int, default=10)
+    ap.add_argument("--block-time", type=float, default=0.2)
+    ap.add_argument("--match-rate", type=float, default=0.05)
+    ap.add_argument("--kind", default="signal", choices=("signal", "announce"))
+    ap.add_argument("--codec", default="x32", choices=("x32", "comp33"))
+    ap.add_argument("--port", type=int, default=8545)
+    args = ap.parse_args()
+
+    chain = StubChain(bytes.fromhex(_norm(args.view_pub)), args.events, args.per_block, args.block_time,
+                      args.match_rate, args.kind, args.codec)
+    url = chain.start(args.port)
+    print(f"⛓️  stub chain on {url}  contract={CONTRACT_ADDR}  blocks={chain.n_blocks} "
+          f"events={chain.events} matches={len(chain.matches)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        chain.stop()
+
+if __name__ == "__main__":
+    main()
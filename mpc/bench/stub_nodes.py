@@ -0,0 +1,138 @@
+# bench/stub_nodes.py
+"""
+压测用的进程内 MPC 扫描节点（与 node_scan.py 同一套接口，不依赖 uvicorn）
+
+- 把 view_sk 按 t-of-n Shamir 拆给 n 个节点，每个节点一个 ThreadingHTTPServer（HTTP/1.1 keep-alive）
+- 接口：POST /scan_share、/ecdh_share、/session，GET /whoami、/health
+  （没有准入队列，也不校验 auth；要测节点本身请直接起 node_scan.py）
+- delay_ms：每个请求额外 sleep，模拟跨机房 RTT
+
+用法：
+  nodes = StubNodes(view_sk_int, n=3, t=2).start()
+  os.environ["MPC_NODES"] = ",".join(nodes.urls)
+"""
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from coincurve import PublicKey
+
+from ..mpc_core.aggregate import SECP_N, lagrange_coeffs_at_zero
+
+def split_secret(secret: int, n: int, t: int) -> Dict[int, int]:
+    """f(x) = secret + a_1·x + … + a_{t-1}·x^{t-1}，返回 {i: f(i)}"""
+    coeffs = [secret] + [secrets.randbelow(SECP_N - 1) + 1 for _ in range(t - 1)]
+    return {i: sum(c * pow(i, k, SECP_N) for k, c in enumerate(coeffs)) % SECP_N for i in range(1, n + 1)}
+
+class _StubNode:
+    def __init__(self, index: int, share: int, delay_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.index = index
+        self.share = share
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.sessions: Dict[str, bytes] = {}
+        self.served = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def _sleep(self):
+        if self.delay_ms or self.jitter_ms:
+            time.sleep(max(0.0, self.delay_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0)
+
+    def handle(self, method: str, path: str, body: dict):
+        """返回 (status, json)"""
+        if method == "GET" and path == "/whoami":
+            return 200, {"index": self.index}
+        if method == "GET" and path == "/health":
+            return 200, {"ok": True, "index": self.index, "served": self.served}
+        if method == "POST" and path == "/session":
+            participants = sorted(set(int(j) for j in body.get("participants", [])))
+            if self.index not in participants or len(participants) < 2:
+                return 400, {"detail": "bad participants"}
+            lam = lagrange_coeffs_at_zero(participants)[participants.index(self.index)]
+            sid = secrets.token_hex(8)
+            with self._lock:
+                self.sessions[sid] = ((lam * self.share) % SECP_N).to_bytes(32, "big")
+            return 200, {"session": sid, "i": self.index, "participants": participants}
+        if method == "POST" and path in ("/scan_share", "/ecdh_share"):
+            sid = body.get("session")
+            if sid is not None:
+                k = self.sessions.get(sid)
+                if k is None:
+                    return 404, {"detail": "unknown session"}
+            else:
+                k = self.share.to_bytes(32, "big")
+            try:
+                R = PublicKey(bytes.fromhex(body["R"][2:] if body["R"].startswith("0x") else body["R"]))
+            except Exception:
+                return 400, {"detail": "invalid R"}
+            self._sleep()
+            Yi = R.multiply(k).format(compressed=True)
+            with self._lock:
+                self.served += 1
+            return 200, {"i": self.index, "Yi": "0x" + Yi.hex(), "weighted": sid is not None}
+        return 404, {"detail": "not found"}
+
+    def start(self, port: int = 0, addr: str = "127.0.0.1") -> str:
+        node = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, method: str):
+                n = int(self.headers.get("Content-Length", "0") or 0)
+                try:
+                    body = json.loads(self.rfile.read(n)) if n else {}
+                    code, resp = node.handle(method, self.path.split("?")[0], body)
+                except ValueError:
+                    code, resp = 400, {"detail": "invalid json"}
+                out = json.dumps(resp).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def do_GET(self):
+                self._reply("GET")
+
+            def do_POST(self):
+                self._reply("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((addr, port), _Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name=f"stub-node{self.index}", daemon=True).start()
+        return f"http://{addr}:{self._httpd.server_address[1]}"
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+class StubNodes:
+    def __init__(self, view_sk: int, n: int = 3, t: int = 2, delay_ms: float = 0.0, jitter_ms: float = 0.0):
+        if not 2 <= t <= n:
+            raise ValueError("need 2 <= t <= n")
+        self.t = t
+        shares = split_secret(view_sk, n, t)
+        self.nodes = [_StubNode(i, y, delay_ms, jitter_ms) for i, y in shares.items()]
+        self.urls: List[str] = []
+
+    def start(self) -> "StubNodes":
+        self.urls = [node.start() for node in self.nodes]
+        return self
+
+    def stop(self):
+        for node in self.nodes:
+            node.stop()
+
+    def served(self) -> Dict[int, int]:
+        return {node.index: node.served for node in self.nodes}
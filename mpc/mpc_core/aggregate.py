@@ -0,0 +1,67 @@
+# mpc_core/aggregate.py
+"""
+阈值 ECDH 聚合：S = Σ λ_i(0) · Y_i
+
+- 响应节点的索引集合几乎不变，λ_i(0)（含一次模逆）按索引集合缓存，
+  并直接缓存成 coincurve 需要的 32B 大端标量
+- 所有加权点一次 PublicKey.combine_keys 相加，而不是 t-1 次两两相加
+"""
+from functools import lru_cache
+from typing import List, Sequence, Tuple, Union
+
+from coincurve import PublicKey
+
+from .primitives import SECP_N
+
+PointLike = Union[bytes, PublicKey]
+
+@lru_cache(maxsize=256)
+def _lagrange_at_zero(indices: Tuple[int, ...]) -> Tuple[int, ...]:
+    lambdas: List[int] = []
+    for i in indices:
+        num, den = 1, 1
+        for j in indices:
+            if j == i:
+                continue
+            num = (num * (-j % SECP_N)) % SECP_N        # (0 - j)
+            den = (den * ((i - j) % SECP_N)) % SECP_N   # (i - j)
+        lambdas.append((num * pow(den, SECP_N - 2, SECP_N)) % SECP_N)
+    return tuple(lambdas)
+
+@lru_cache(maxsize=256)
+def _lagrange_scalars(indices: Tuple[int, ...]) -> Tuple[bytes, ...]:
+    return tuple(lam.to_bytes(32, "big") for lam in _lagrange_at_zero(indices))
+
+def lagrange_coeffs_at_zero(indices: Sequence[int]) -> List[int]:
+    """λ_i(0) mod n，按索引集合（有序）缓存"""
+    return list(_lagrange_at_zero(tuple(indices)))
+
+def lagrange_scalars_at_zero(indices: Sequence[int]) -> Tuple[bytes, ...]:
+    """同 lagrange_coeffs_at_zero，但直接给出 32B 大端标量"""
+    return _lagrange_scalars(tuple(indices))
+
+def _as_point(p: PointLike) -> PublicKey:
+    return p if isinstance(p, PublicKey) else PublicKey(bytes(p))
+
+def combine_points(points: Sequence[PointLike]) -> PublicKey:
+    """一次性把所有点相加"""
+    if not points:
+        raise ValueError("no points to combine")
+    if len(points) == 1:
+        return _as_point(points[0])
+    return PublicKey.combine_keys([_as_point(p) for p in points])
+
+def aggregate_shares(shares: Sequence[Tuple[int, PointLike]]) -> PublicKey:
+    """
+    shares: [(i, Y_i), ...]，Y_i = y_i·R（33B 压缩点或 PublicKey）
+    返回 S = Σ λ_i(0)·Y_i = v·R
+    """
+    if not shares:
+        raise ValueError("no shares to aggregate")
+    scalars = lagrange_scalars_at_zero([i for (i, _) in shares])
+    weighted = [_as_point(Y).multiply(k) for k, (_, Y) in zip(scalars, shares)]
+    return combine_points(weighted)
+
+def cache_info():
+    """系数缓存命中情况（调试/基准用）"""
+    return _lagrange_at_zero.cache_info()
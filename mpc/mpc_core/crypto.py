@@ -1,10 +1,11 @@
 # mpc_core/crypto.py
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
-from cryptography.exceptions import InvalidKey
+from cryptography.exceptions import InvalidKey, InvalidTag
 import os
 
 # ---- secp256k1 ECIES（ECDH + HKDF + AES-CTR） ----
@@ -54,9 +55,45 @@ def ecies_decrypt_secp256k1(privkey_hex: str, eph_pub_bytes_compressed: bytes, i
     eph_pub = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256K1(), eph_pub_bytes_compressed)
 
     shared = priv.exchange(ec.ECDH(), eph_pub)
-    key = _kdf(shared, info=b"ecies-secp256k1-key", length=32)
+    return ecies_decrypt_with_shared(shared, iv, ciphertext)
 
+def ecies_decrypt_with_shared(shared_x32: bytes, iv: bytes, ciphertext: bytes) -> bytes:
+    """
+    已持有共享点 S = v·R 的 X 坐标（32字节）时直接解密，不需要私钥或 MPC 轮次
+    （scanner 命中时刚聚合出 S）
+    """
+    key = _kdf(shared_x32, info=b"ecies-secp256k1-key", length=32)
     cipher = Cipher(algorithms.AES(key), modes.CTR(iv))
     dec = cipher.decryptor()
-    pt = dec.update(ciphertext) + dec.finalize()
-    return pt
+    return dec.update(ciphertext) + dec.finalize()
+
+# ---- 隐身公告 memo（与 R 同一个 r 派生密钥 + AES-GCM） ----
+# memo = MEMO_V1(1B) || nonce(12B) || ciphertext || gcm_tag(16B)
+# 密钥 = HKDF(x32(r·V), info="stealth-memo-v1")：发送方用生成 R 的 r，接收方用 S = v·R，
+# scanner 命中时 S 已在手里，不需要额外的临时公钥或 MPC 轮次；R 作为附加数据绑定到这条公告
+
+MEMO_V1 = 0x01
+_MEMO_INFO = b"stealth-memo-v1"
+_MEMO_NONCE = 12
+_MEMO_MIN = 1 + _MEMO_NONCE + 16
+
+def encrypt_memo_with_shared(shared_x32: bytes, R: bytes, plaintext: bytes) -> bytes:
+    """发送方：shared_x32 = x32(r·V)，R = r·G（压缩 33 字节）"""
+    nonce = os.urandom(_MEMO_NONCE)
+    key = _kdf(shared_x32, info=_MEMO_INFO, length=32)
+    return bytes([MEMO_V1]) + nonce + AESGCM(key).encrypt(nonce, plaintext, bytes(R))
+
+def decrypt_memo_with_shared(shared_x32: bytes, memo: bytes, R: bytes):
+    """
+    接收方：shared_x32 = x32(v·R)。
+    memo 为空 / 版本不认识 / 认证失败（不是发给我的、被篡改、旧的无 MAC 格式）一律返回 None，
+    调用方据此不落任何明文。
+    """
+    if not memo or len(memo) < _MEMO_MIN or memo[0] != MEMO_V1:
+        return None
+    memo = bytes(memo)
+    key = _kdf(shared_x32, info=_MEMO_INFO, length=32)
+    try:
+        return AESGCM(key).decrypt(memo[1:1 + _MEMO_NONCE], memo[1 + _MEMO_NONCE:], bytes(R))
+    except InvalidTag:
+        return None
@@ -0,0 +1,369 @@
+# mpc_core/ecdh_client.py
+"""
+阈值 ECDH 客户端：scanner / payment / mpc_decrypt 共用同一份
+“收集分片 -> 拉格朗日聚合 -> S = v·R” 逻辑
+
+- 连接池：每个客户端一个 requests.Session（keep-alive），不再每次新建连接
+- 请求合并：同一 R 已有请求在途时，后来的调用方直接等待同一结果，节点只算一次
+- 节点 503 时按 Retry-After 退避（见 node_scan 准入控制）
+- 每节点 AIMD 并发上限（mpc_core.limiter）：延迟平稳时加并发，延迟升高/出错时减半
+- 可选两阶段会话（session=True）：节点直接返回 λ_i·y_i·R，协调端只做一次 combine
+- 同步 / 异步 API；stats() 给出请求、失败、合并、退避计数与各节点平均延迟
+- 追踪（mpc_core.tracing）：每次节点请求一个 span，并通过 traceparent 头传给节点
+- 录制 / 回放（mpc_core.replay）：REPLAY_MODE=record|replay 时节点请求写入 / 读自 fixture
+
+请求：POST /scan_share { "R": "0x..33B", "lane": "live|backfill", "auth": "0xkeccak(auth||R)", "session": "..." }
+响应：{ "i": <int>, "Yi": "0x02/03..33B", "weighted": bool }
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from requests.adapters import HTTPAdapter
+from coincurve import PublicKey
+
+from .aggregate import aggregate_shares, combine_points
+from .crypto import ecies_decrypt_with_shared
+from .limiter import AIMDLimiter
+from .primitives import keccak256
+from .metrics import AGGREGATE_SECONDS, NODE_REQUEST_SECONDS
+from .profiling import stage
+from . import replay, tracing
+
+Share = Tuple[int, bytes]
+
+def _b2h(b: bytes) -> str:
+    return "0x" + b.hex()
+
+def _as_bytes(x) -> bytes:
+    if isinstance(x, str):
+        s = x.strip()
+        if s.lower().startswith("0x"):
+            s = s[2:]
+        return bytes.fromhex(s)
+    return bytes(x)
+
+def _valid_point(Yi: bytes) -> bool:
+    # 基本健全性：压缩点 33B，首字节 0x02/0x03；on-curve 校验由构造 PublicKey 触发
+    if len(Yi) != 33 or Yi[0] not in (2, 3):
+        return False
+    try:
+        PublicKey(Yi)
+    except Exception:
+        return False
+    return True
+
+class ThresholdECDHClient:
+    def __init__(self, nodes: Sequence[str], threshold: int, timeout: float = 1.5,
+                 auth: bytes = b"", session: bool = False, log_prefix: str = "[mpc]"):
+        self.nodes = [u.rstrip("/") for u in nodes]
+        self.threshold = threshold
+        self.timeout = timeout
+        self.auth = auth
+        self.session_mode = session
+        self.log_prefix = log_prefix
+
+        self._limiters: Dict[str, AIMDLimiter] = {u: AIMDLimiter.from_env() for u in self.nodes}
+
+        self._http = replay.http_session("nodes")  # REPLAY_MODE=record|replay 时录制 / 回放节点请求
+        max_conns = max([32] + [lim.max_limit for lim in self._limiters.values()])
+        adapter = HTTPAdapter(pool_connections=max(1, len(self.nodes)), pool_maxsize=max_conns)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._session_lock = threading.Lock()  # 会话协商单飞：只持有它做网络往返，_lock 只护字段
+        self._inflight: Dict[bytes, Future] = {}
+        self._backoff_until: Dict[str, float] = {}
+        self._session: Optional[List[Tuple[str, int, str]]] = None
+        self._stats = {"calls": 0, "coalesced": 0, "errors": 0, "backoffs": 0, "sessions_opened": 0,
+                       "throttled": 0}
+        self._node_stats: Dict[str, Dict[str, float]] = {
+            u: {"ok": 0, "err": 0, "latency_s": 0.0} for u in self.nodes
+        }
+
+    @classmethod
+    def from_env(cls, log_prefix: str = "[mpc]") -> "ThresholdECDHClient":
+        """与 scanner 相同的环境变量：MPC_NODES / MPC_THRESHOLD / HTTP_TIMEOUT_S / MPC_AUTH / MPC_SESSION"""
+        nodes = [x.strip() for x in os.getenv("MPC_NODES", "http://127.0.0.1:7001,http://127.0.0.1:7002,http://127.0.0.1:7003").split(",") if x.strip()]
+        return cls(
+            nodes,
+            int(os.getenv("MPC_THRESHOLD", "2")),
+            timeout=float(os.getenv("HTTP_TIMEOUT_S", "1.5")),
+            auth=os.getenv("MPC_AUTH", "").encode("utf-8"),
+            session=os.getenv("MPC_SESSION", "false").lower() in ("1", "true", "yes"),
+            log_prefix=log_prefix,
+        )
+
+    # -------------------------------------------------------------------------
+    # HTTP
+    # -------------------------------------------------------------------------
+    def _payload(self, R_bytes: bytes, lane: str) -> dict:
+        payload = {"R": _b2h(R_bytes), "lane": lane}
+        if self.auth:
+            payload["auth"] = keccak256(self.auth + R_bytes).hex()
+        return payload
+
+    def _backoff(self, url: str, resp) -> None:
+        try:
+            delay = float(resp.headers.get("Retry-After", "1"))
+        except ValueError:
+            delay = 1.0
+        with self._lock:
+            self._backoff_until[url] = time.monotonic() + delay
+            self._stats["backoffs"] += 1
+        print(f"{self.log_prefix} ⏸️ node {url} saturated, backing off {delay:.1f}s")
+
+    def _post(self, url: str, path: str, payload: dict) -> dict:
+        with tracing.span("node.request", node=url, path=path) as sp:
+            return self._post_limited(url, path, payload, sp)
+
+    def _post_limited(self, url: str, path: str, payload: dict, sp) -> dict:
+        limiter = self._limiters[url]
+        t_wait = time.perf_counter()
+        if not limiter.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["throttled"] += 1
+            raise RuntimeError(f"node {url} at concurrency limit {limiter.limit}")
+        t0 = time.perf_counter()
+        sp.set(limit_wait_ms=round((t0 - t_wait) * 1000, 3))
+        ok = False
+        try:
+            resp = self._http.post(f"{url}{path}", json=payload, timeout=self.timeout,
+                                   headers=tracing.inject({}))
+            sp.set(status=resp.status_code)
+            if resp.status_code == 503:
+                self._backoff(url, resp)
+            resp.raise_for_status()
+            data = resp.json()
+            ok = True
+        except Exception:
+            with self._lock:
+                self._node_stats[url]["err"] += 1
+            raise
+        finally:
+            dt = time.perf_counter() - t0
+            limiter.release(dt, ok)
+            NODE_REQUEST_SECONDS.labels(node=url, outcome="ok" if ok else "error").observe(dt)
+        with self._lock:
+            st = self._node_stats[url]
+            st["ok"] += 1
+            st["latency_s"] += time.perf_counter() - t0
+        return data
+
+    # -------------------------------------------------------------------------
+    # 经典模式：每个事件收集 y_i·R，协调端插值
+    # -------------------------------------------------------------------------
+    def collect_shares(self, R_bytes: bytes, need: Optional[int] = None, lane: str = "live") -> List[Share]:
+        """收集至少 need 份不同索引的 (i, Yi)；节点 503 时在 Retry-After 内跳过该节点"""
+        need = need or self.threshold
+        payload = self._payload(R_bytes, lane)
+        shares: List[Share] = []
+        seen = set()
+        now = time.monotonic()
+        for url in self.nodes:
+            if self._backoff_until.get(url, 0.0) > now:
+                continue
+            try:
+                data = self._post(url, "/scan_share", payload)
+                i = int(data["i"])
+                if i in seen:
+                    continue
+                Yi = _as_bytes(data["Yi"])
+                if not _valid_point(Yi):
+                    print(f"{self.log_prefix} ⚠️ bad Yi from {url}: len={len(Yi)} head={Yi[:1].hex()}")
+                    continue
+                shares.append((i, Yi))
+                seen.add(i)
+                if len(shares) >= need:
+                    break
+            except Exception as e:
+                print(f"{self.log_prefix} ⚠️ share from {url} failed: {e}")
+        return shares
+
+    # -------------------------------------------------------------------------
+    # 两阶段会话：固定参与集合，节点返回 λ_i·y_i·R
+    # -------------------------------------------------------------------------
+    def open_session(self) -> List[Tuple[str, int, str]]:
+        """
+        阶段一：探测节点索引，选出前 threshold 个可用节点作为参与集合，
+        并在每个节点上 POST /session { "participants": [...] } 注册。
+        总是新开一个会话；同一时刻只有一个线程在协商
+        """
+        with self._session_lock:
+            return self._open_session()
+
+    def _current_session(self) -> List[Tuple[str, int, str]]:
+        """已有会话直接用；没有时单飞协商，并发的调用方等同一次结果"""
+        with self._lock:
+            session = self._session
+        if session is not None:
+            return session
+        with self._session_lock:
+            with self._lock:
+                session = self._session
+            return session if session is not None else self._open_session()
+
+    def _open_session(self) -> List[Tuple[str, int, str]]:
+        picked: List[Tuple[str, int]] = []
+        seen = set()
+        for url in self.nodes:
+            try:
+                resp = self._http.get(f"{url}/whoami", timeout=self.timeout)
+                resp.raise_for_status()
+                i = int(resp.json()["index"])
+            except Exception as e:
+                print(f"{self.log_prefix} ⚠️ whoami {url} failed: {e}")
+                continue
+            if i in seen:
+                continue
+            picked.append((url, i))
+            seen.add(i)
+            if len(picked) >= self.threshold:
+                break
+        if len(picked) < self.threshold:
+            raise RuntimeError(f"not enough MPC nodes for session: got {len(picked)}/{self.threshold}")
+
+        participants = [i for (_, i) in picked]
+        session = [(url, i, self._post(url, "/session", {"participants": participants})["session"])
+                   for url, i in picked]
+        with self._lock:
+            self._session = session
+            self._stats["sessions_opened"] += 1
+        print(f"{self.log_prefix} 🤝 MPC session opened with participants={participants}")
+        return session
+
+    def _drop_session(self, session: List[Tuple[str, int, str]]) -> None:
+        """只作废失败的那个会话：别的线程可能已经换上了新会话，不能把它一起清掉"""
+        with self._lock:
+            if self._session is session:
+                self._session = None
+
+    def collect_weighted_shares(self, R_bytes: bytes, lane: str = "live") -> List[bytes]:
+        """阶段二：向会话内每个节点取 λ_i·y_i·R；任一失败则会话作废并抛出"""
+        session = self._current_session()
+        payload = self._payload(R_bytes, lane)
+        points: List[bytes] = []
+        for url, i, sid in session:
+            try:
+                data = self._post(url, "/scan_share", dict(payload, session=sid))
+                Yi = _as_bytes(data["Yi"])
+                if int(data["i"]) != i or not data.get("weighted") or not _valid_point(Yi):
+                    raise RuntimeError(f"unexpected session share from {url}")
+                points.append(Yi)
+            except Exception:
+                self._drop_session(session)  # 参与方缺席：下次重新协商参与集合
+                raise
+        return points
+
+    # -------------------------------------------------------------------------
+    # S = v·R
+    # -------------------------------------------------------------------------
+    def _shared_point(self, R_bytes: bytes, lane: str) -> Tuple[PublicKey, str]:
+        if self.session_mode:
+            try:
+                # 会话模式：S = Σ (λ_i·y_i·R)，一次 combine 即可
+                with stage("share_collection"), tracing.span("mpc.collect_shares", mode="session"):
+                    points = self.collect_weighted_shares(R_bytes, lane)
+                with stage("aggregation"), tracing.span("mpc.aggregate", mode="session"), \
+                        AGGREGATE_SECONDS.labels(mode="session").time():
+                    return combine_points(points), "mpc-session"
+            except Exception as e:
+                print(f"{self.log_prefix} ⚠️ MPC session failed: {e} -> per-event interpolation")
+
+        with stage("share_collection"), tracing.span("mpc.collect_shares", mode="lagrange"):
+            shares = self.collect_shares(R_bytes, lane=lane)
+        if len(shares) < self.threshold:
+            raise RuntimeError(f"not enough MPC shares: got {len(shares)}/{self.threshold}")
+        # 聚合 S = Σ λ_i * Yi（系数按索引集合缓存，一次 combine）
+        with stage("aggregation"), tracing.span("mpc.aggregate", mode="lagrange"), \
+                AGGREGATE_SECONDS.labels(mode="lagrange").time():
+            return aggregate_shares(shares), "mpc"
+
+    def shared_point(self, R_bytes: bytes, lane: str = "live") -> Tuple[PublicKey, str]:
+        """阈值 ECDH：返回 (S = v·R, 说明前缀)。同一 R 的并发调用合并为一次节点往返"""
+        R_bytes = bytes(R_bytes)
+        with self._lock:
+            self._stats["calls"] += 1
+            fut = self._inflight.get(R_bytes)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._inflight[R_bytes] = fut
+            else:
+                self._stats["coalesced"] += 1
+        if not owner:
+            with tracing.span("mpc.coalesced_wait"):
+                return fut.result()
+
+        try:
+            result = self._shared_point(R_bytes, lane)
+        except BaseException as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(R_bytes, None)
+
+    def ecies_decrypt(self, eph_pub, iv, ct, lane: str = "live") -> bytes:
+        """ECIES 解密：S = v·eph_pub 的 X 坐标 -> HKDF -> AES-CTR"""
+        S, _ = self.shared_point(_as_bytes(eph_pub), lane)
+        return ecies_decrypt_with_shared(S.format(compressed=False)[1:33], _as_bytes(iv), _as_bytes(ct))
+
+    # -------------------------------------------------------------------------
+    # 异步 API：在线程池里跑同步实现，合并/连接池对两者同样生效
+    # -------------------------------------------------------------------------
+    async def ashared_point(self, R_bytes: bytes, lane: str = "live") -> Tuple[PublicKey, str]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.shared_point, R_bytes, lane)
+
+    async def aecies_decrypt(self, eph_pub, iv, ct, lane: str = "live") -> bytes:
+        return await asyncio.get_running_loop().run_in_executor(None, self.ecies_decrypt, eph_pub, iv, ct, lane)
+
+    # -------------------------------------------------------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            nodes = {
+                u: {"ok": int(st["ok"]), "err": int(st["err"]),
+                    "avg_latency_ms": round(st["latency_s"] / st["ok"] * 1000, 3) if st["ok"] else None,
+                    "concurrency": self._limiters[u].snapshot()}
+                for u, st in self._node_stats.items()
+            }
+            return dict(self._stats, inflight=len(self._inflight), nodes=nodes)
+
+    def limits(self) -> Dict[str, int]:
+        """各节点当前生效的并发上限"""
+        return {u: lim.limit for u, lim in self._limiters.items()}
+
+    def capacity(self, window_s: float) -> int:
+        """
+        window_s 内还能再处理多少个事件：每个事件要 threshold 个节点各答一次，
+        所以取各节点余量（AIMD headroom）中第 threshold 大的；退避中的节点记 0
+        """
+        now = time.monotonic()
+        with self._lock:
+            backing_off = {u for u, t in self._backoff_until.items() if t > now}
+        room = sorted((0 if u in backing_off else lim.headroom(window_s)
+                       for u, lim in self._limiters.items()), reverse=True)
+        return room[self.threshold - 1] if len(room) >= self.threshold else 0
+
+    def close(self):
+        self._http.close()
+
+_default_client: Optional[ThresholdECDHClient] = None
+_default_lock = threading.Lock()
+
+def default_client() -> ThresholdECDHClient:
+    """进程内共享的客户端（按环境变量构造一次）"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = ThresholdECDHClient.from_env()
+        return _default_client
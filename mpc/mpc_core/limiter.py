@@ -0,0 +1,115 @@
+# mpc_core/limiter.py
+"""
+每节点自适应并发（AIMD）
+
+- 每个节点一个 AIMDLimiter，限制同时在途的 /scan_share 请求数
+- 加性增：延迟仍接近基线、且并发上限确实被用满时，每个“窗口”（约 limit 个成功请求）上限 +1
+- 乘性减：出错 / 503 / 超时，或平滑延迟超过基线 tolerance 倍时，上限 × backoff（每个 RTT 至多减一次）
+- 基线 = 观测到的最小延迟，每个样本缓慢上浮，节点换硬件/负载后能重新学习
+最终在各节点的吞吐拐点附近来回收敛；snapshot() 给出当前生效的上限，
+headroom(window_s) 给出 window_s 内还能再发多少请求（scanner 据此给 backfill 车道定额）
+
+环境变量（可选）：
+  MPC_CONCURRENCY_INITIAL=4
+  MPC_CONCURRENCY_MIN=1
+  MPC_CONCURRENCY_MAX=64
+  MPC_LATENCY_TOLERANCE=2.0   # 平滑延迟 / 基线延迟 超过该倍数视为拥塞
+  MPC_CONCURRENCY_BACKOFF=0.5 # 乘性减因子
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+class AIMDLimiter:
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 tolerance: float = 2.0, backoff: float = 0.5, alpha: float = 0.1):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.alpha = alpha
+
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._inflight = 0
+        self._cond = threading.Condition()
+        self._rtt_min: Optional[float] = None
+        self._rtt_ewma: Optional[float] = None
+        self._last_decrease = 0.0
+        self._stats = {"increases": 0, "decreases": 0, "rejected": 0}
+
+    @classmethod
+    def from_env(cls) -> "AIMDLimiter":
+        return cls(
+            initial=int(os.getenv("MPC_CONCURRENCY_INITIAL", "4")),
+            min_limit=int(os.getenv("MPC_CONCURRENCY_MIN", "1")),
+            max_limit=int(os.getenv("MPC_CONCURRENCY_MAX", "64")),
+            tolerance=float(os.getenv("MPC_LATENCY_TOLERANCE", "2.0")),
+            backoff=float(os.getenv("MPC_CONCURRENCY_BACKOFF", "0.5")),
+        )
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """占一个并发名额；timeout 内拿不到返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._inflight >= int(self._limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._stats["rejected"] += 1
+                    return False
+                self._cond.wait(remaining)
+            self._inflight += 1
+            return True
+
+    def release(self, latency_s: float, ok: bool = True):
+        """归还名额并根据本次结果调整上限；ok=False 表示出错 / 503 / 超时"""
+        with self._cond:
+            saturated = self._inflight >= int(self._limit)  # 上限是否真的在起作用
+            self._inflight -= 1
+            if ok:
+                self._rtt_min = latency_s if self._rtt_min is None else min(self._rtt_min * 1.001, latency_s)
+                self._rtt_ewma = latency_s if self._rtt_ewma is None else \
+                    (1 - self.alpha) * self._rtt_ewma + self.alpha * latency_s
+
+            if not ok or self._rtt_ewma > self._rtt_min * self.tolerance:
+                self._decrease()
+            elif saturated and self._limit < self.max_limit:
+                self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+                self._stats["increases"] += 1
+            self._cond.notify_all()
+
+    def _decrease(self):
+        now = time.monotonic()
+        # 同一拥塞事件里的多个失败只算一次：两次减小至少间隔一个平滑 RTT
+        if now - self._last_decrease < (self._rtt_ewma or 0.0):
+            return
+        self._last_decrease = now
+        self._limit = max(float(self.min_limit), self._limit * self.backoff)
+        self._stats["decreases"] += 1
+        if self._rtt_ewma is not None and self._rtt_min is not None:
+            # 降速后从基线重新估计，否则高延迟的 EWMA 会连续触发减小
+            self._rtt_ewma = (self._rtt_ewma + self._rtt_min) / 2
+
+    def headroom(self, window_s: float) -> int:
+        """
+        window_s 内还能再放行的请求数：空闲名额 × 窗口内的往返次数（按平滑 RTT）。
+        还没有延迟样本时只算一轮；上限被乘性减小后额度随之缩小
+        """
+        with self._cond:
+            free = max(0, int(self._limit) - self._inflight)
+            rounds = max(1.0, window_s / self._rtt_ewma) if self._rtt_ewma else 1.0
+            return int(free * rounds)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return dict(
+                self._stats,
+                limit=int(self._limit),
+                inflight=self._inflight,
+                rtt_min_ms=round(self._rtt_min * 1000, 3) if self._rtt_min is not None else None,
+                rtt_ewma_ms=round(self._rtt_ewma * 1000, 3) if self._rtt_ewma is not None else None,
+            )
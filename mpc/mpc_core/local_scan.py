@@ -0,0 +1,109 @@
+# mpc_core/local_scan.py
+"""
+本地（非 MPC）扫描引擎：MPC 关闭或回退时使用
+
+- view_sk 只解析一次；每个 R 只做一次点乘，x32 / comp33 两种口径都从同一个共享点导出
+- 点乘只走 coincurve（libsecp256k1，常数时间）：标量是 view_sk，不在 Python 里做点乘
+- tags_batch 按块分发到进程池（每个 worker 进程各自持有一份引擎）；
+  池在第一次需要时建立并挂在引擎上，之后每批复用，close() 释放
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from coincurve import PrivateKey, PublicKey
+
+from .primitives import tag_hash
+
+TagResult = Tuple[bytes, Optional[bytes], str]
+
+CODECS = ("x32", "comp33", "auto")
+
+def _strip0x(s: str) -> str:
+    return s[2:] if isinstance(s, str) and s.lower().startswith("0x") else s
+
+def _tag(data: bytes) -> bytes:
+    return tag_hash(data)
+
+# =============================================================================
+# 引擎
+# =============================================================================
+class LocalScanEngine:
+    def __init__(self, view_sk_hex: str, codec: str = "x32"):
+        if codec not in CODECS:
+            raise ValueError(f"codec must be one of {CODECS}")
+        self.view_sk_hex = view_sk_hex
+        self.codec = codec
+        self._k = PrivateKey.from_hex(_strip0x(view_sk_hex)).secret  # 32B，只解析一次
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_workers = 0
+
+    def _tags_from_encodings(self, x32: bytes, comp33: bytes) -> TagResult:
+        label = f"local:{self.codec}"
+        if self.codec == "x32":
+            return _tag(x32), None, label
+        if self.codec == "comp33":
+            return _tag(comp33), None, label
+        return _tag(x32), _tag(comp33), label
+
+    def shared_point(self, R_bytes: bytes) -> PublicKey:
+        return PublicKey(R_bytes).multiply(self._k)
+
+    def tags(self, R_bytes: bytes) -> TagResult:
+        """单个 R：(主口径tag, 备选tag或None, 说明)，与 scanner.derive_tag_local 同口径"""
+        S = self.shared_point(R_bytes)
+        comp33 = S.format(compressed=True)
+        return self._tags_from_encodings(comp33[1:], comp33)
+
+    def _tags_chunk(self, Rs: Sequence[bytes]) -> List[Optional[TagResult]]:
+        out: List[Optional[TagResult]] = []
+        for R in Rs:
+            try:
+                out.append(self.tags(R))
+            except Exception:
+                out.append(None)
+        return out
+
+    def make_pool(self, workers: int) -> ProcessPoolExecutor:
+        """预热好的进程池（每个 worker 已构造本引擎），调用方自己管理生命周期"""
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(self.view_sk_hex, self.codec))
+
+    def pool(self, workers: int) -> ProcessPoolExecutor:
+        """引擎自带的进程池：第一次用时创建，worker 数变了才重建"""
+        if self._pool is None or self._pool_workers != workers:
+            self.close()
+            self._pool = self.make_pool(workers)
+            self._pool_workers = workers
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self._pool_workers = 0
+
+    def tags_batch(self, Rs: Sequence[bytes], workers: int = 1, chunk: int = 512,
+                   executor: Optional[ProcessPoolExecutor] = None) -> List[Optional[TagResult]]:
+        """
+        一批 R 的 tag；无效 R 对应位置为 None。
+        workers > 1 时按 chunk 分块交给进程池：传入 executor（make_pool 创建）则用它，否则用引擎自带的池。
+        """
+        Rs = [bytes(R) for R in Rs]
+        if executor is None and (workers <= 1 or len(Rs) <= chunk):
+            return self._tags_chunk(Rs)
+        pool = executor if executor is not None else self.pool(workers)
+        chunks = [Rs[i:i + chunk] for i in range(0, len(Rs), chunk)]
+        out: List[Optional[TagResult]] = []
+        for part in pool.map(_worker_tags_chunk, chunks):
+            out.extend(part)
+        return out
+
+# 进程池 worker：每个进程只构造一次引擎
+_worker_engine: Optional[LocalScanEngine] = None
+
+def _init_worker(view_sk_hex: str, codec: str):
+    global _worker_engine
+    _worker_engine = LocalScanEngine(view_sk_hex, codec)
+
+def _worker_tags_chunk(Rs: List[bytes]) -> List[Optional[TagResult]]:
+    return _worker_engine._tags_chunk(Rs)
@@ -0,0 +1,76 @@
+# mpc_core/metrics.py
+"""
+Prometheus 指标（prometheus_client）
+
+- counter / gauge / histogram：同名指标只建一次，登记在 prometheus_client 的默认 REGISTRY
+  （同时带上进程 CPU / 内存 / fd 等默认 collector）
+- render() 输出文本格式；CONTENT_TYPE 与之配套
+- scanner / watcher 这类脚本用 start_http_server(port) 在本地端口起 /metrics；
+  FastAPI 应用（node_scan / server）直接挂一个 /metrics 路由返回 render()
+- 每秒速率交给 Prometheus：rate(mpc_scanner_events_scanned_total[1m])
+
+依赖：pip install prometheus_client
+
+环境变量：
+  METRICS_PORT=<port>   # scanner / watcher 的指标端口；0 = 不启动
+"""
+import threading
+from typing import Dict, Sequence
+
+import prometheus_client
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# 秒级延迟的默认桶：覆盖 0.5ms（本地点乘）到 10s（get_logs 慢节点）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics: Dict[str, object] = {}
+_lock = threading.Lock()
+
+def _get_or_create(cls, name: str, help: str, labelnames: Sequence[str] = (), **kw):
+    """同名指标只建一次（入口模块被重复导入 / reload 时不会在 REGISTRY 上重复注册）"""
+    with _lock:
+        m = _metrics.get(name)
+        if m is None:
+            m = _metrics[name] = cls(name, help, tuple(labelnames), **kw)
+        return m
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _get_or_create(Counter, name, help, labelnames)
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return _get_or_create(Gauge, name, help, labelnames)
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+def render() -> str:
+    return prometheus_client.generate_latest(REGISTRY).decode("utf-8")
+
+# -----------------------------------------------------------------------------
+# 共享指标：ECDH 客户端（scanner / payment / mpc_decrypt）与各入口的 DB 提交
+# -----------------------------------------------------------------------------
+NODE_REQUEST_SECONDS = histogram("mpc_node_request_seconds",
+                                 "Latency of share requests to each MPC node", ("node", "outcome"))
+AGGREGATE_SECONDS = histogram("mpc_aggregate_seconds",
+                              "Time to combine node shares into S = v*R", ("mode",))
+DB_COMMIT_SECONDS = histogram("mpc_db_commit_seconds",
+                              "SQLite commit latency", ("component",))
+
+def timed_commit(con, component: str):
+    """con.commit() 并记录耗时"""
+    with DB_COMMIT_SECONDS.labels(component=component).time():
+        con.commit()
+
+# -----------------------------------------------------------------------------
+# 本地 /metrics HTTP 服务（脚本类进程用）
+# -----------------------------------------------------------------------------
+def start_http_server(port: int, addr: str = "127.0.0.1"):
+    """后台线程起 /metrics；port<=0 不启动"""
+    if port <= 0:
+        return None
+    server = prometheus_client.start_http_server(port, addr=addr)
+    print(f"📊 metrics on http://{addr}:{port}/metrics")
+    return server
@@ -0,0 +1,106 @@
+# mpc_core/primitives.py
+"""
+扫描 / 节点路径用到的最小原语：keccak256、tag 哈希、secp256k1 常量与共享点编码
+
+- 不导入 web3（冷启动 ~1.4s、RSS +50MB）；scanner 子进程、进程池 worker 与节点只需要这里
+- keccak256 后端按可用性选择：pycryptodome（web3 自身也依赖）> eth_hash > 纯 Python
+  纯 Python 版本只为没有 C 扩展的环境兜底，单次约数十微秒
+- 与 Web3.keccak 的区别：返回普通 bytes（不是 HexBytes），.hex() 不带 0x
+"""
+import hashlib
+from typing import Tuple
+
+# secp256k1 曲线阶
+SECP_N = int("0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141", 16)
+
+# =============================================================================
+# keccak256
+# =============================================================================
+_RC = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+]
+_ROT = [0, 1, 62, 28, 27, 36, 44, 6, 55, 20, 3, 10, 43, 25, 39, 41, 45, 15, 21, 8, 18, 2, 61, 56, 14]
+_M64 = (1 << 64) - 1
+
+def _keccak_f(s):
+    for rc in _RC:
+        # θ
+        c = [s[x] ^ s[x + 5] ^ s[x + 10] ^ s[x + 15] ^ s[x + 20] for x in range(5)]
+        d = [c[(x - 1) % 5] ^ (((c[(x + 1) % 5] << 1) | (c[(x + 1) % 5] >> 63)) & _M64) for x in range(5)]
+        s = [s[i] ^ d[i % 5] for i in range(25)]
+        # ρ + π
+        b = [0] * 25
+        for x in range(5):
+            for y in range(5):
+                i = x + 5 * y
+                r = _ROT[i]
+                v = ((s[i] << r) | (s[i] >> (64 - r))) & _M64 if r else s[i]
+                b[y + 5 * ((2 * x + 3 * y) % 5)] = v
+        # χ + ι
+        s = [b[i] ^ (~b[(i % 5 + 1) % 5 + 5 * (i // 5)] & b[(i % 5 + 2) % 5 + 5 * (i // 5)]) for i in range(25)]
+        s[0] ^= rc
+    return s
+
+def _keccak256_pure(data: bytes) -> bytes:
+    rate = 136
+    pad = rate - len(data) % rate
+    # pad10*1：只差一个字节时 0x01 与 0x80 合并成 0x81
+    msg = bytes(data) + (b"\x81" if pad == 1 else b"\x01" + b"\x00" * (pad - 2) + b"\x80")
+    s = [0] * 25
+    for off in range(0, len(msg), rate):
+        block = msg[off:off + rate]
+        for i in range(rate // 8):
+            s[i] ^= int.from_bytes(block[8 * i:8 * i + 8], "little")
+        s = _keccak_f(s)
+    return b"".join(s[i].to_bytes(8, "little") for i in range(4))
+
+try:
+    from Crypto.Hash import keccak as _ck
+
+    def keccak256(data: bytes) -> bytes:
+        return _ck.new(data=data, digest_bits=256).digest()
+
+    KECCAK_BACKEND = "pycryptodome"
+except ImportError:
+    try:
+        from eth_hash.auto import keccak as _eh
+
+        def keccak256(data: bytes) -> bytes:
+            return _eh(data)
+
+        KECCAK_BACKEND = "eth_hash"
+    except ImportError:
+        keccak256 = _keccak256_pure
+        KECCAK_BACKEND = "pure"
+
+def keccak_text(text: str) -> bytes:
+    """等价于 Web3.keccak(text=...)"""
+    return keccak256(text.encode("utf-8"))
+
+# =============================================================================
+# tag 与共享点编码
+# =============================================================================
+def tag_hash(data: bytes) -> bytes:
+    """链上 tag = keccak256(sha256(S 的编码))"""
+    return keccak256(hashlib.sha256(data).digest())
+
+def shared_encodings(S) -> Tuple[bytes, bytes]:
+    """coincurve PublicKey -> (x32, comp33)"""
+    return S.format(compressed=False)[1:33], S.format(compressed=True)
+
+# =============================================================================
+# hex
+# =============================================================================
+def strip0x(s: str) -> str:
+    return s[2:] if isinstance(s, str) and s.lower().startswith("0x") else s
+
+def h2b(h: str) -> bytes:
+    return bytes.fromhex(strip0x(h))
+
+def b2h(b: bytes) -> str:
+    return "0x" + bytes(b).hex()
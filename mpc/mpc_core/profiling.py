@@ -0,0 +1,273 @@
+# mpc_core/profiling.py
+"""
+运行时可开关的分阶段计时与剖析（关闭时几乎零开销）
+
+- stage("name")：上下文管理器。关闭时返回同一个空上下文（一次全局变量判断）；
+  打开时累计每个阶段的次数 / 总耗时 / 最大耗时，并写入 mpc_stage_seconds 直方图；
+  @timed("name") 是整函数的装饰器版本
+- 剖析会话：cProfile（只覆盖开启它的线程）或采样（后台线程定时抓所有线程的栈，
+  输出 folded 格式，可直接喂给 flamegraph.pl / speedscope）
+- 开关方式：
+    脚本（scanner / watcher）：install_signal_handler()，kill -USR1 <pid> 开始，再发一次停止并落盘
+    FastAPI（node_scan / server）：add_admin_routes(app)，
+      POST /admin/profile/start?mode=sample|cprofile、POST /admin/profile/stop、GET /admin/stages
+
+环境变量（可选）：
+  PROFILE_DIR=.               # 剖析结果输出目录
+  PROFILE_MODE=sample         # 信号触发时的剖析方式：sample（所有线程，含 scanner 的 mpc 线程池）|
+                              # cprofile（只覆盖收到信号的主线程，看不到线程池里的节点请求 / 聚合）
+  PROFILE_SAMPLE_MS=5         # 采样间隔
+  PROFILE_STAGES=false        # 启动即打开分阶段计时
+  PROFILE_ADMIN=false         # FastAPI 应用是否挂 /admin/profile 路由
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter as _Counter
+from typing import Dict, Optional
+
+from .metrics import histogram
+
+PROFILE_DIR       = os.getenv("PROFILE_DIR", ".")
+PROFILE_MODE      = os.getenv("PROFILE_MODE", "sample").lower()
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+PROFILE_ADMIN     = os.getenv("PROFILE_ADMIN", "false").lower() in ("1", "true", "yes")
+
+M_STAGE = histogram("mpc_stage_seconds", "Per-stage time (only while stage timing is on)", ("stage",))
+
+# =============================================================================
+# 分阶段计时
+# =============================================================================
+_stages_on = os.getenv("PROFILE_STAGES", "false").lower() in ("1", "true", "yes")
+_stage_lock = threading.Lock()
+_stage_stats: Dict[str, list] = {}  # name -> [count, total_s, max_s]
+
+class _Noop:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _Noop()
+
+class _Timer:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        with _stage_lock:
+            st = _stage_stats.get(self.name)
+            if st is None:
+                _stage_stats[self.name] = [1, dt, dt]
+            else:
+                st[0] += 1
+                st[1] += dt
+                if dt > st[2]:
+                    st[2] = dt
+        M_STAGE.labels(stage=self.name).observe(dt)
+        return False
+
+def stage(name: str):
+    """with stage("db_write"): ...  —— 计时关闭时不做任何事"""
+    if not _stages_on:
+        return _NOOP
+    return _Timer(name)
+
+def timed(name: str):
+    """装饰器版 stage：整个函数算作一个阶段"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _stages_on:
+                return fn(*args, **kwargs)
+            with _Timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def enable_stages(on: bool = True):
+    global _stages_on
+    _stages_on = on
+
+def stages_enabled() -> bool:
+    return _stages_on
+
+def stage_report(reset: bool = False) -> Dict[str, dict]:
+    """{stage: {count, total_ms, avg_ms, max_ms}}，按总耗时降序"""
+    with _stage_lock:
+        items = sorted(_stage_stats.items(), key=lambda kv: -kv[1][1])
+        if reset:
+            _stage_stats.clear()
+    return {
+        name: {"count": c, "total_ms": round(t * 1000, 3), "avg_ms": round(t / c * 1000, 3),
+               "max_ms": round(m * 1000, 3)}
+        for name, (c, t, m) in items
+    }
+
+def format_stage_report(report: Dict[str, dict]) -> str:
+    lines = [f"{'stage':<20} {'count':>8} {'total_ms':>12} {'avg_ms':>10} {'max_ms':>10}"]
+    for name, st in report.items():
+        lines.append(f"{name:<20} {st['count']:>8} {st['total_ms']:>12.1f} {st['avg_ms']:>10.3f} {st['max_ms']:>10.3f}")
+    return "\n".join(lines)
+
+# =============================================================================
+# 剖析会话
+# =============================================================================
+class _Sampler:
+    """后台线程按固定间隔抓取所有线程的调用栈，累计成 folded stacks"""
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self.counts: _Counter = _Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval_s):
+            names.update({t.ident: t.name for t in threading.enumerate()})
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            for stack, n in self.counts.most_common():
+                f.write(f"{stack} {n}\n")
+
+_session_lock = threading.Lock()
+_session: Optional[dict] = None
+
+def profiling_active() -> bool:
+    return _session is not None
+
+def start_profile(mode: Optional[str] = None, with_stages: bool = True) -> dict:
+    """开始剖析（已在进行中则原样返回当前会话信息）；顺带打开分阶段计时"""
+    global _session
+    mode = (mode or PROFILE_MODE).lower()
+    if mode not in ("cprofile", "sample"):
+        raise ValueError("mode must be cprofile or sample")
+    with _session_lock:
+        if _session is not None:
+            return {"mode": _session["mode"], "started_at": _session["started_at"], "already_running": True}
+        if mode == "cprofile":
+            prof = cProfile.Profile()
+            prof.enable()
+        else:
+            prof = _Sampler(PROFILE_SAMPLE_MS / 1000.0)
+            prof.start()
+        _session = {"mode": mode, "prof": prof, "started_at": time.time(),
+                    "stages_were_on": _stages_on}
+        if with_stages:
+            enable_stages(True)
+            stage_report(reset=True)
+    return {"mode": mode, "started_at": _session["started_at"], "already_running": False}
+
+def stop_profile(tag: str = "profile") -> Optional[dict]:
+    """
+    停止剖析并落盘：
+      cprofile -> <PROFILE_DIR>/<tag>-<ts>.pstats + .txt（按累计时间前 50 项）
+      sample   -> <PROFILE_DIR>/<tag>-<ts>.folded
+    返回 {mode, path, duration_s, stages}；没有进行中的会话返回 None
+    """
+    global _session
+    with _session_lock:
+        sess, _session = _session, None
+    if sess is None:
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{tag}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+    prof = sess["prof"]
+    if sess["mode"] == "cprofile":
+        prof.disable()
+        path = base + ".pstats"
+        prof.dump_stats(path)
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(50)
+        with open(base + ".txt", "w") as f:
+            f.write(buf.getvalue())
+    else:
+        prof.stop()
+        path = base + ".folded"
+        prof.dump(path)
+    report = stage_report()
+    if not sess["stages_were_on"]:
+        enable_stages(False)
+    return {"mode": sess["mode"], "path": os.path.abspath(path),
+            "duration_s": round(time.time() - sess["started_at"], 3), "stages": report}
+
+# =============================================================================
+# 开关入口
+# =============================================================================
+def install_signal_handler(tag: str, sig: int = getattr(signal, "SIGUSR1", 0), log_prefix: str = ""):
+    """kill -USR1 <pid>：开始 / 停止（交替）；停止时打印分阶段报告与输出文件路径"""
+    if not sig:
+        return  # Windows 没有 SIGUSR1
+
+    def _toggle(_signum, _frame):
+        if profiling_active():
+            res = stop_profile(tag)
+            print(f"{log_prefix} 🧪 profile ({res['mode']}, {res['duration_s']}s) -> {res['path']}")
+            print(format_stage_report(res["stages"]))
+        else:
+            start_profile()
+            print(f"{log_prefix} 🧪 profiling started ({PROFILE_MODE}); send the signal again to stop")
+
+    signal.signal(sig, _toggle)
+
+def add_admin_routes(app, tag: str):
+    """给 FastAPI 应用挂 /admin/profile/*（PROFILE_ADMIN=true 时才挂）"""
+    if not PROFILE_ADMIN:
+        return
+    from fastapi import HTTPException
+
+    # async 路由：在事件循环线程里开关；cProfile 只覆盖该线程，要看线程池里的点乘请用 sample
+    @app.post("/admin/profile/start")
+    async def _profile_start(mode: str = "sample"):
+        try:
+            return start_profile(mode)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @app.post("/admin/profile/stop")
+    async def _profile_stop():
+        res = stop_profile(tag)
+        if res is None:
+            raise HTTPException(status_code=409, detail="no profiling session running")
+        return res
+
+    @app.get("/admin/stages")
+    async def _stages(reset: bool = False):
+        return {"enabled": stages_enabled(), "stages": stage_report(reset=reset)}
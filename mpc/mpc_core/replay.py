@@ -0,0 +1,264 @@
+# mpc_core/replay.py
+"""
+录制 / 回放外部调用，让性能回归在一台机器上可复现
+
+- watcher 的 JSON-RPC（web3 provider）与 ECDH 客户端的节点请求（requests.Session）都可以：
+    record：照常访问真实 RPC / 节点，同时把请求、响应、耗时写进 <REPLAY_DIR>/<name>.jsonl
+    replay：不联网，按请求内容匹配录制的响应返回；可按录制耗时（乘系数）sleep 模拟真实延迟
+- 匹配键：RPC 为 method + params，HTTP 为 method + URL + JSON body（忽略 traceparent 等请求头）；
+  同一个键录到多次时按录制顺序依次返回，用完后一直返回最后一次（例如 eth_blockNumber 停在链头）
+- 回放时找不到键：RPC 返回 JSON-RPC error，HTTP 抛 ConnectionError —— 与真实故障走同一条路径，
+  并计入 misses()，说明输入（DB / 区块范围）和录制时不一致
+- 查看录制内容：python3 -m mpc.mpc_core.replay <REPLAY_DIR>   # 每个文件按方法/路径汇总次数与耗时
+
+环境变量：
+  REPLAY_MODE=off|record|replay   # 默认 off：不包装，零开销
+  REPLAY_DIR=fixtures             # fixture 目录（watcher: rpc.jsonl，scanner: nodes.jsonl）
+  REPLAY_TAG=                     # 文件名后缀：<name>-<tag>.jsonl；同时录制多个进程（多个 scanner worker、
+                                  # server + scanner 都用 ECDH 客户端）时各给一个，回放时用同一个
+  录制不会覆盖已有 fixture：文件已存在时直接报错（删掉或换 REPLAY_TAG）；同一进程里多个客户端共用一个文件
+  REPLAY_DELAY_SCALE=0            # 回放时按录制耗时 × 该系数 sleep；0 = 不等待，1 = 原速
+
+fixture 行格式：
+  {"key": "...", "kind": "rpc|http", "t_ms": <距录制开始>, "dur_ms": <耗时>, "status": <HTTP 码>, "body": <响应>, "headers": {...}}
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+REPLAY_MODE        = os.getenv("REPLAY_MODE", "off").lower()
+REPLAY_DIR         = os.getenv("REPLAY_DIR", "fixtures")
+REPLAY_DELAY_SCALE = float(os.getenv("REPLAY_DELAY_SCALE", "0"))
+REPLAY_TAG         = os.getenv("REPLAY_TAG", "").strip()
+
+_KEEP_HEADERS = ("content-type", "retry-after")
+
+def _json_default(o):
+    if isinstance(o, (bytes, bytearray)):
+        return "0x" + bytes(o).hex()
+    if hasattr(o, "hex"):
+        return o.hex()
+    return str(o)
+
+def _canon(obj) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=_json_default)
+
+def fixture_path(name: str, directory: Optional[str] = None, tag: Optional[str] = None) -> str:
+    tag = REPLAY_TAG if tag is None else tag
+    return os.path.join(directory or REPLAY_DIR, f"{name}-{tag}.jsonl" if tag else f"{name}.jsonl")
+
+# =============================================================================
+# 录制 / 回放存储
+# =============================================================================
+class Recorder:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        try:
+            self._f = open(path, "x", buffering=1)  # 独占创建：另一个进程的录制 / 旧 fixture 不会被截断
+        except FileExistsError:
+            raise RuntimeError(f"replay: fixture {path} already exists; remove it or set REPLAY_TAG "
+                               f"to record this process separately") from None
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self.count = 0
+
+    def now_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    def write(self, key: str, kind: str, t_ms: float, dur_ms: float, body, status: int = 200,
+              headers: Optional[Dict[str, str]] = None):
+        line = _canon({"key": key, "kind": kind, "t_ms": round(t_ms, 3), "dur_ms": round(dur_ms, 3),
+                       "status": status, "body": body, "headers": headers or {}})
+        with self._lock:
+            self._f.write(line + "\n")
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+class Player:
+    def __init__(self, path: str, delay_scale: float = 0.0):
+        self.path = path
+        self.delay_scale = delay_scale
+        self._entries: Dict[str, List[dict]] = {}
+        self._pos: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.missed: List[str] = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    rec = json.loads(line)
+                    self._entries.setdefault(rec["key"], []).append(rec)
+
+    def take(self, key: str) -> Optional[dict]:
+        with self._lock:
+            recs = self._entries.get(key)
+            if not recs:
+                self.missed.append(key)
+                return None
+            i = self._pos.get(key, 0)
+            self._pos[key] = min(i + 1, len(recs) - 1)
+            self.hits += 1
+            rec = recs[i]
+        if self.delay_scale > 0:
+            time.sleep(rec["dur_ms"] / 1000.0 * self.delay_scale)
+        return rec
+
+_players: List[Player] = []
+_recorders: Dict[str, Recorder] = {}
+_recorders_lock = threading.Lock()
+
+def recorder(name: str) -> Recorder:
+    """同一进程里同名 fixture 只开一次（scanner 的客户端和 default_client() 写同一个文件）"""
+    path = os.path.abspath(fixture_path(name))
+    with _recorders_lock:
+        rec = _recorders.get(path)
+        if rec is None:
+            rec = _recorders[path] = Recorder(path)
+        return rec
+
+def misses() -> List[str]:
+    """本进程回放时没有匹配上的键"""
+    return [k for p in _players for k in p.missed]
+
+# =============================================================================
+# HTTP（ECDH 客户端的节点请求）
+# =============================================================================
+def _http_key(method: str, url: str, kw: dict) -> str:
+    body = kw.get("json")
+    if body is None and kw.get("data") is not None:
+        data = kw["data"]
+        body = data.decode() if isinstance(data, (bytes, bytearray)) else data
+    return f"{method.upper()} {url} {_canon(body)}"
+
+class RecordingSession(requests.Session):
+    def __init__(self, recorder: Recorder):
+        super().__init__()
+        self._rec = recorder
+
+    def request(self, method, url, **kw):
+        key = _http_key(method, url, kw)
+        t_ms = self._rec.now_ms()
+        t0 = time.perf_counter()
+        resp = super().request(method, url, **kw)
+        dur = (time.perf_counter() - t0) * 1000
+        try:
+            body = resp.json()
+        except ValueError:
+            body = resp.text
+        headers = {k: v for k, v in resp.headers.items() if k.lower() in _KEEP_HEADERS}
+        self._rec.write(key, "http", t_ms, dur, body, resp.status_code, headers)
+        return resp
+
+class ReplaySession(requests.Session):
+    def __init__(self, player: Player):
+        super().__init__()
+        self._player = player
+
+    def request(self, method, url, **kw):
+        rec = self._player.take(_http_key(method, url, kw))
+        if rec is None:
+            raise requests.ConnectionError(f"replay: no recorded response for {method} {url}")
+        resp = requests.Response()
+        resp.status_code = rec["status"]
+        body = rec["body"]
+        resp._content = (body if isinstance(body, str) else json.dumps(body)).encode()
+        resp.headers.update(rec.get("headers") or {})
+        resp.url = url
+        resp.encoding = "utf-8"
+        return resp
+
+def http_session(name: str = "nodes") -> requests.Session:
+    """按 REPLAY_MODE 返回普通 / 录制 / 回放的 requests.Session"""
+    if REPLAY_MODE == "record":
+        return RecordingSession(recorder(name))
+    if REPLAY_MODE == "replay":
+        player = Player(fixture_path(name), REPLAY_DELAY_SCALE)
+        _players.append(player)
+        return ReplaySession(player)
+    return requests.Session()
+
+# =============================================================================
+# JSON-RPC（watcher 的 web3 provider）
+# =============================================================================
+def _rpc_key(method: str, params) -> str:
+    return f"{method} {_canon(params)}"
+
+def provider(url: str, name: str = "rpc"):
+    """按 REPLAY_MODE 返回 HTTPProvider / 录制 provider / 回放 provider（web3 只在这里导入）"""
+    from web3 import HTTPProvider
+    from web3.providers import JSONBaseProvider
+
+    if REPLAY_MODE == "record":
+        rec = recorder(name)
+
+        class RecordingHTTPProvider(HTTPProvider):
+            def make_request(self, method, params):
+                t_ms = rec.now_ms()
+                t0 = time.perf_counter()
+                resp = super().make_request(method, params)
+                rec.write(_rpc_key(method, params), "rpc", t_ms, (time.perf_counter() - t0) * 1000, resp)
+                return resp
+
+        return RecordingHTTPProvider(url)
+
+    if REPLAY_MODE == "replay":
+        player = Player(fixture_path(name), REPLAY_DELAY_SCALE)
+        _players.append(player)
+
+        class ReplayProvider(JSONBaseProvider):
+            def make_request(self, method, params):
+                rec = player.take(_rpc_key(method, params))
+                if rec is None:
+                    return {"jsonrpc": "2.0", "id": 0,
+                            "error": {"code": -32000, "message": f"replay: no recorded response for {method}"}}
+                return rec["body"]
+
+        return ReplayProvider()
+
+    return HTTPProvider(url)
+
+# =============================================================================
+# 汇总
+# =============================================================================
+def summarize(directory: str) -> str:
+    out: List[str] = []
+    for fn in sorted(os.listdir(directory)):
+        if not fn.endswith(".jsonl"):
+            continue
+        groups: Dict[str, List[float]] = {}
+        span_ms = 0.0
+        with open(os.path.join(directory, fn)) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                head = rec["key"].split(" ")
+                # rpc: 方法名；http: METHOD + 路径（去掉节点地址）
+                label = head[0] if rec["kind"] == "rpc" else f"{head[0]} /{head[1].split('/', 3)[-1]}"
+                groups.setdefault(label, []).append(rec["dur_ms"])
+                span_ms = max(span_ms, rec["t_ms"] + rec["dur_ms"])
+        out.append(f"== {fn}  ({sum(len(v) for v in groups.values())} calls over {span_ms / 1000:.1f}s)")
+        for label, durs in sorted(groups.items(), key=lambda kv: -len(kv[1])):
+            durs.sort()
+            pct = lambda q: durs[min(len(durs) - 1, int(q * len(durs)))]
+            out.append(f"  {label:<28} n={len(durs):<7} p50={pct(0.5):8.3f}ms  p99={pct(0.99):8.3f}ms  max={durs[-1]:8.3f}ms")
+    return "\n".join(out)
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="summarize recorded RPC / node fixtures")
+    ap.add_argument("directory", nargs="?", default=REPLAY_DIR)
+    args = ap.parse_args()
+    print(summarize(args.directory))
+
+if __name__ == "__main__":
+    main()
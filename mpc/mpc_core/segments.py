@@ -0,0 +1,304 @@
+# mpc_core/segments.py
+"""
+公告段文件：events 的定长、只追加副本，供历史扫描 mmap 零拷贝读取
+
+- 扫描只需要 (id, block, R, tag)；这里把它们写成 88 字节定长记录，按 id 递增追加：
+    <Q id> <Q block> <33s R> <32s tag> <7x 填充>
+  每个段文件 32 字节头（MAGIC / 记录长度 / 首 id）+ 最多 SEGMENT_RECORDS 条记录，写满换新文件
+- 段是派生数据：SegmentWriter.sync_from_db() 把 id 大于段尾的事件（热表 + 冷库）追加进来，
+  可以随时删掉重建。SQLite 同一时刻只有一个写者，读到 id=N 时更小的 id 都已提交或回滚，
+  所以段里的 id 到 last_id 为止是完整的
+- 读者各自 mmap（只读、共享页缓存），slice() 给出记录区的 memoryview，不经过 SQLite、不抢锁；
+  多个进程可以同时扫历史。文件尾部不足一条记录的部分（写到一半）读者看不到，写者重开时截掉
+- 长度不对的 R / tag 写成全 0：R 前缀为 0 在扫描里必然是无效点，等同于 SQLite 里的“不匹配”
+
+环境变量：
+  SEGMENT_DIR=<DB_PATH 去扩展名>_segments   # 段目录
+  SEGMENT_RECORDS=1048576                   # 每个段文件的记录数（约 88MB）
+
+用法：
+  python3 -m mpc.mpc_core.segments build    # 从 DB_PATH 补齐段文件
+  python3 -m mpc.mpc_core.segments info
+  python3 -m mpc.mpc_core.segments bench [--procs 4]   # SQLite 分页 vs 段文件读取吞吐
+"""
+import bisect
+import mmap
+import os
+import struct
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+MAGIC = b"MPCSEG1\n"
+HEADER = struct.Struct("<8sIIQQ")      # magic, 记录长度, 版本, 首 id, 保留
+RECORD = struct.Struct("<QQ33s32s7x")  # id, block, R, tag
+REC_SIZE = RECORD.size                 # 88
+_ID = struct.Struct("<Q")
+_ZERO_R, _ZERO_TAG = b"\x00" * 33, b"\x00" * 32
+
+SEGMENT_RECORDS = max(1, int(os.getenv("SEGMENT_RECORDS", str(1 << 20))))
+
+def segment_dir(db_path: Optional[str] = None) -> str:
+    if os.getenv("SEGMENT_DIR"):
+        return os.environ["SEGMENT_DIR"]
+    root, _ = os.path.splitext(db_path or os.getenv("DB_PATH", "mpc_index.db"))
+    return f"{root}_segments"
+
+def _segment_files(directory: str) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                  if f.startswith("seg-") and f.endswith(".ann"))
+
+# =============================================================================
+# 写
+# =============================================================================
+class SegmentWriter:
+    """单写者（watcher）；append 的 id 必须递增，不大于 last_id 的记录直接跳过"""
+    def __init__(self, directory: str, records_per_segment: int = SEGMENT_RECORDS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.records_per_segment = records_per_segment
+        self.last_id = 0
+        self._f = None
+        self._count = 0
+        files = _segment_files(directory)
+        if files:
+            self._open_tail(files[-1])
+
+    def _open_tail(self, path: str):
+        size = os.path.getsize(path)
+        n = max(0, (size - HEADER.size) // REC_SIZE)
+        f = open(path, "r+b")
+        if size != HEADER.size + n * REC_SIZE:
+            f.truncate(HEADER.size + n * REC_SIZE)  # 上次写到一半的记录
+        if n:
+            f.seek(HEADER.size + (n - 1) * REC_SIZE)
+            self.last_id = _ID.unpack(f.read(_ID.size))[0]
+        f.seek(0, os.SEEK_END)
+        self._f, self._count = f, n
+
+    def _roll(self, first_id: int):
+        if self._f is not None:
+            self._f.close()
+        path = os.path.join(self.directory, f"seg-{first_id:012d}.ann")
+        self._f = open(path, "w+b")
+        self._f.write(HEADER.pack(MAGIC, REC_SIZE, 1, first_id, 0))
+        self._count = 0
+
+    def append(self, records: Iterable[Tuple[int, int, bytes, bytes]]) -> int:
+        """records: (id, block, R, tag)；返回写入条数（写进页缓存即对读者可见，不 fsync：段可从库重建）"""
+        buf = bytearray()
+        n = total = 0
+        for eid, block, R, tag in records:
+            if eid <= self.last_id:
+                continue
+            if self._f is None or self._count + n >= self.records_per_segment:
+                if buf:
+                    self._f.write(buf)
+                    self._count += n
+                    buf, n = bytearray(), 0
+                self._roll(eid)
+            R, tag = bytes(R or b""), bytes(tag or b"")
+            buf += RECORD.pack(eid, block or 0, R if len(R) == 33 else _ZERO_R, tag if len(tag) == 32 else _ZERO_TAG)
+            self.last_id = eid
+            n += 1
+            total += 1
+        if buf:
+            self._f.write(buf)
+            self._count += n
+        if self._f is not None:
+            self._f.flush()
+        return total
+
+    def sync_from_db(self, con, batch: int = 20000) -> int:
+        """把库里 id > last_id 的事件（热表 + 冷库）追加进段，返回追加条数"""
+        from . import storage
+        total = 0
+        while True:
+            rows = storage.events_page(con, self.last_id, 2**62, batch, cols="id, block, R, tag")
+            if not rows:
+                return total
+            n = self.append(rows)
+            total += n
+            if n == 0:
+                return total
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+# =============================================================================
+# 读
+# =============================================================================
+class _Mapped:
+    __slots__ = ("path", "first_id", "size", "count", "mm", "view")
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            self.count = max(0, (self.size - HEADER.size) // REC_SIZE)
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        if self.mm is None or self.size < HEADER.size:
+            raise ValueError(f"empty segment {path}")
+        magic, rec_size, _ver, self.first_id, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or rec_size != REC_SIZE:
+            raise ValueError(f"not a segment file: {path}")
+        self.view = memoryview(self.mm)[HEADER.size:HEADER.size + self.count * REC_SIZE]
+
+    def id_at(self, i: int) -> int:
+        return _ID.unpack_from(self.view, i * REC_SIZE)[0]
+
+    def index_after(self, after_id: int) -> int:
+        """第一个 id > after_id 的记录下标"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.id_at(mid) <= after_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+class Slice:
+    """一段连续记录；buf 是 mmap 上的 memoryview，字段在访问时才解包"""
+    __slots__ = ("buf", "count")
+
+    def __init__(self, buf: memoryview):
+        self.buf = buf
+        self.count = len(buf) // REC_SIZE
+
+    def records(self) -> Iterator[Tuple[int, int, bytes, bytes]]:
+        return RECORD.iter_unpack(self.buf)
+
+    def ids(self) -> List[int]:
+        return [_ID.unpack_from(self.buf, i * REC_SIZE)[0] for i in range(self.count)]
+
+    def Rs(self) -> List[bytes]:
+        b = self.buf
+        return [bytes(b[o:o + 33]) for o in range(16, self.count * REC_SIZE, REC_SIZE)]
+
+    @property
+    def last_id(self) -> int:
+        return _ID.unpack_from(self.buf, (self.count - 1) * REC_SIZE)[0]
+
+class SegmentReader:
+    """只读 mmap；refresh() 跟上写者新追加的记录 / 新段"""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._segs: List[_Mapped] = []
+        self._firsts: List[int] = []
+        self.refresh()
+
+    def refresh(self):
+        known = {s.path: s for s in self._segs}
+        segs = []
+        for path in _segment_files(self.directory):
+            old = known.get(path)
+            if old is not None and old.size == os.path.getsize(path):
+                segs.append(old)
+                continue
+            try:
+                segs.append(_Mapped(path))  # 变长了就重新映射；旧映射随引用释放
+            except ValueError:
+                continue
+        self._segs = [s for s in segs if s.count]
+        self._firsts = [s.first_id for s in self._segs]
+
+    @property
+    def count(self) -> int:
+        return sum(s.count for s in self._segs)
+
+    @property
+    def last_id(self) -> int:
+        return self._segs[-1].id_at(self._segs[-1].count - 1) if self._segs else 0
+
+    def slice(self, after_id: int, to_id: int, limit: int) -> Optional[Slice]:
+        """id 在 (after_id, to_id] 内的下一段连续记录（最多 limit 条，不跨段文件）"""
+        k = max(0, bisect.bisect_right(self._firsts, after_id + 1) - 1)
+        for seg in self._segs[k:]:
+            i = seg.index_after(after_id)
+            if i >= seg.count:
+                continue
+            j = min(seg.count, i + limit)
+            if seg.id_at(j - 1) > to_id:
+                j = seg.index_after(to_id)
+            if j <= i:
+                return None
+            return Slice(seg.view[i * REC_SIZE:j * REC_SIZE])
+        return None
+
+    def rows(self, after_id: int, to_id: int, limit: int) -> List[Tuple]:
+        """与 storage.events_page 同形状的 (id, tag, R, memo, commitment)；memo / commitment 为 None，命中后再回库取"""
+        out: List[Tuple] = []
+        while len(out) < limit:
+            s = self.slice(after_id, to_id, limit - len(out))
+            if s is None:
+                break
+            out.extend((eid, tag, R, None, None) for eid, _block, R, tag in s.records())
+            after_id = out[-1][0]
+        return out
+
+# =============================================================================
+# CLI
+# =============================================================================
+def _bench_read(directory: str, db_path: str, source: str, page: int) -> Tuple[int, float]:
+    import time
+    t0 = time.perf_counter()
+    n, cursor = 0, 0
+    if source == "segments":
+        reader = SegmentReader(directory)
+        while True:
+            rows = reader.rows(cursor, 2**62, page)
+            if not rows:
+                break
+            n += len(rows)
+            cursor = rows[-1][0]
+    else:
+        from . import storage
+        con = storage.connect(db_path, migrate_schema=False)
+        while True:
+            rows = storage.events_page(con, cursor, 2**62, page, cols="id, tag, R")
+            if not rows:
+                break
+            n += len(rows)
+            cursor = rows[-1][0]
+        con.close()
+    return n, time.perf_counter() - t0
+
+def main():
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor
+    ap = argparse.ArgumentParser(description="fixed-width announcement segment files")
+    ap.add_argument("command", choices=("build", "info", "bench"))
+    ap.add_argument("--db", default=os.getenv("DB_PATH", "mpc_index.db"))
+    ap.add_argument("--dir", default=None)
+    ap.add_argument("--page", type=int, default=20000)
+    ap.add_argument("--procs", type=int, default=1, help="bench: concurrent reader processes")
+    args = ap.parse_args()
+    directory = args.dir or segment_dir(args.db)
+
+    if args.command == "build":
+        from . import storage
+        w = SegmentWriter(directory)
+        con = storage.connect(args.db)
+        n = w.sync_from_db(con)
+        con.close()
+        w.close()
+        print(f"[segments] appended {n} record(s); last_id={w.last_id} dir={directory}")
+    elif args.command == "info":
+        r = SegmentReader(directory)
+        for s in r._segs:
+            print(f"{os.path.basename(s.path)}  first_id={s.first_id}  records={s.count}  {s.size / 1e6:.1f}MB")
+        print(f"total records={r.count} last_id={r.last_id}")
+    else:
+        for source in ("sqlite", "segments"):
+            with ProcessPoolExecutor(args.procs) as pool:
+                res = list(pool.map(_bench_read, [directory] * args.procs, [args.db] * args.procs,
+                                    [source] * args.procs, [args.page] * args.procs))
+            n = sum(r[0] for r in res)
+            wall = max(r[1] for r in res)
+            print(f"{source:<9} procs={args.procs}  {n} records in {wall:.2f}s  {n / wall / 1e6:.2f}M rec/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,588 @@
+# mpc_core/storage.py
+"""
+SQLite 存储：唯一的建表 / 迁移入口 + 调优过的可复用连接 + 热路径查询
+
+- 迁移链：MIGRATIONS 按版本号递增，当前版本记在 PRAGMA user_version；
+  每个进程第一次打开某个库时在 BEGIN IMMEDIATE 里补齐缺的版本（多进程同时启动也只会执行一次）
+  旧库（user_version=0，由以前各脚本的 CREATE TABLE IF NOT EXISTS 建出来）同样适用：v1 只补缺的表/列
+- connection(path)：每个线程每个库一条长连接，复用 sqlite3 的语句缓存；不要 close()
+  connect(path)：新开一条调优连接（需要独占事务 / 短命脚本时用），用完自己关
+- 调优：WAL + synchronous=NORMAL、busy_timeout、页缓存、mmap 读、临时表放内存
+- 查询：各入口共用的读写放在这里（insert_event / insert_inbox / mark_scanned / fetch_inbox / meta），
+  只执行不提交 —— 提交由调用方用 metrics.timed_commit 或 transaction() 完成
+- 状态计数：counters 表由触发器随 events / inbox 写入维护，counters() / event_state_counts() 不随表变大
+- 冷热分区：events 只留工作集；终局后已扫未命中的事件搬进冷库 cold.events_archive（id 不变），
+  需要全量历史的读（rescan / 审计）走 events_page()（分页归并）或临时视图 all_events = events ∪ cold.events_archive
+- 查询计划：HOT_QUERIES 列出热路径查询与应走的索引，
+  python3 -m mpc.mpc_core.storage <db> --check-plans   # 有全表扫描 / 临时排序 / 没走索引即退出码 1
+
+环境变量：
+  SQLITE_BUSY_TIMEOUT_MS=5000   # 写锁等待
+  SQLITE_CACHE_MB=64            # 每条连接的页缓存
+  SQLITE_MMAP_MB=256            # mmap 读；0 = 关闭
+  SQLITE_STMT_CACHE=256         # 每条连接缓存的预编译语句数
+
+冷热分区（见 archive_finalized()，由 watcher 定期执行或 python3 -m mpc.archive）：
+  ARCHIVE_DB_PATH=<db>_cold.db  # 冷库文件，ATTACH 为 cold；只存已扫、未命中、已终局的事件
+  ARCHIVE_FINALITY_BLOCKS=64    # 块号 <= meta.last_block - 该值才算终局
+  ARCHIVE_BATCH=5000            # 每个写事务搬的行数（控制持锁时间）
+  ARCHIVE_VACUUM_PAGES=2000     # 每轮 incremental_vacuum 归还的页数上限
+"""
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+
+DB_PATH              = os.getenv("DB_PATH", "mpc_index.db")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_MB      = int(os.getenv("SQLITE_CACHE_MB", "64"))
+SQLITE_MMAP_MB       = int(os.getenv("SQLITE_MMAP_MB", "256"))
+SQLITE_STMT_CACHE    = int(os.getenv("SQLITE_STMT_CACHE", "256"))
+ARCHIVE_DB_PATH      = os.getenv("ARCHIVE_DB_PATH", "")
+ARCHIVE_FINALITY_BLOCKS = int(os.getenv("ARCHIVE_FINALITY_BLOCKS", "64"))
+ARCHIVE_BATCH        = max(1, int(os.getenv("ARCHIVE_BATCH", "5000")))
+ARCHIVE_VACUUM_PAGES = int(os.getenv("ARCHIVE_VACUUM_PAGES", "2000"))
+
+# =============================================================================
+# 迁移链
+# =============================================================================
+def _ensure_column(cur, table: str, column: str, decl: str):
+    """老库补列（CREATE TABLE IF NOT EXISTS 不会给已有表加列）"""
+    cols = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _v1_base_schema(cur):
+    """合并 watcher / scanner / server / rescan 各自的 DDL"""
+    cur.execute("""CREATE TABLE IF NOT EXISTS meta(
+      k TEXT PRIMARY KEY,
+      v TEXT
+    )""")
+    cur.execute("INSERT OR IGNORE INTO meta(k,v) VALUES('last_block','0')")
+    cur.execute("""CREATE TABLE IF NOT EXISTS events(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      block INTEGER,
+      txhash TEXT,
+      tag BLOB,
+      R   BLOB,
+      memo BLOB,
+      commitment BLOB,
+      scanned INTEGER DEFAULT 0,
+      matched INTEGER DEFAULT 0,
+      created_at INTEGER
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS inbox(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      user_id TEXT,
+      event_id INTEGER,
+      tag BLOB,
+      R   BLOB,
+      memo BLOB,
+      commitment BLOB,
+      status TEXT DEFAULT 'unread',
+      detected_at INTEGER
+    )""")
+    _ensure_column(cur, "inbox", "memo_plain", "BLOB")         # 命中时解出的 memo 明文
+    _ensure_column(cur, "events", "lease_owner", "TEXT")       # 认领该事件的 scanner worker
+    _ensure_column(cur, "events", "lease_until", "INTEGER")    # 租约到期（unix 秒）
+    _ensure_column(cur, "events", "attempts", "INTEGER DEFAULT 0")  # 失败次数
+    _ensure_column(cur, "events", "retry_at", "INTEGER")       # 下次可重试时间（unix 秒）
+    _ensure_column(cur, "events", "last_error", "TEXT")
+    # 每个 (用户, key) 一条重扫任务；key_fp 是 key 的指纹，不落明文
+    cur.execute("""CREATE TABLE IF NOT EXISTS rescan_progress(
+      user_id TEXT,
+      key_fp TEXT,
+      engine TEXT,
+      from_id INTEGER,
+      to_id INTEGER,
+      cursor INTEGER,
+      scanned INTEGER DEFAULT 0,
+      matched INTEGER DEFAULT 0,
+      done INTEGER DEFAULT 0,
+      started_at INTEGER,
+      updated_at INTEGER,
+      PRIMARY KEY(user_id, key_fp)
+    )""")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_inbox_event ON inbox(event_id)")
+
+def _v2_hot_indexes(cur):
+    # scanner 两条车道按 id 认领待扫
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_events_scanned_id ON events(scanned, id)")
+    # lag_blocks 的 MIN(block) WHERE scanned=0，以及 rescan / 面板的块号范围、MAX(block)
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_events_scanned_block ON events(scanned, block)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_events_block ON events(block)")
+
+# 物化计数：counters(name, n) 由触发器随写入维护，状态查询 O(1)，不再全表 COUNT(*)
+# events 按 (scanned, matched) 分桶计数（'ev:<scanned>:<matched>'），每次写只动一两行；
+# pending / matched / dead 等口径在读取时由几个桶相加（见 counters()）
+_EV_BUCKET = "'ev:' || IFNULL({r}.scanned, '') || ':' || IFNULL({r}.matched, '')"
+
+def _v3_inbox_index_and_counters(cur):
+    # fetch_inbox：按 user_id 取、detected_at 倒序；inbox 侧需要的列都在索引里（id 是 rowid），
+    # 只剩按主键回 events 取 R/tag/memo
+    cur.execute("""CREATE INDEX IF NOT EXISTS ix_inbox_user_detected
+                   ON inbox(user_id, detected_at, event_id, status)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS counters(
+      name TEXT PRIMARY KEY,
+      n INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID""")
+    new, old = _EV_BUCKET.format(r="NEW"), _EV_BUCKET.format(r="OLD")
+    inc = "INSERT INTO counters(name, n) VALUES({key}, 1) ON CONFLICT(name) DO UPDATE SET n = n + 1;"
+    dec = "UPDATE counters SET n = n - 1 WHERE name = {key};"
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_events_count_ins AFTER INSERT ON events
+                    BEGIN {inc.format(key=new)} END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_events_count_del AFTER DELETE ON events
+                    BEGIN {dec.format(key=old)} END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_events_count_upd AFTER UPDATE OF scanned, matched ON events
+                    WHEN OLD.scanned IS NOT NEW.scanned OR OLD.matched IS NOT NEW.matched
+                    BEGIN {dec.format(key=old)} {inc.format(key=new)} END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_inbox_count_ins AFTER INSERT ON inbox BEGIN
+                     {inc.format(key="'inbox'")}
+                     {inc.format(key="'inbox:' || IFNULL(NEW.user_id, '')")}
+                   END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS trg_inbox_count_del AFTER DELETE ON inbox BEGIN
+                     UPDATE counters SET n = n - 1 WHERE name IN ('inbox', 'inbox:' || IFNULL(OLD.user_id, ''));
+                   END""")
+    # 按现有数据回填一次（之后只靠触发器增量维护）
+    cur.execute(f"""INSERT OR REPLACE INTO counters(name, n)
+                    SELECT {_EV_BUCKET.format(r='events')}, COUNT(*) FROM events GROUP BY scanned, matched""")
+    cur.execute("INSERT OR REPLACE INTO counters(name, n) SELECT 'inbox', COUNT(*) FROM inbox")
+    cur.execute("""INSERT OR REPLACE INTO counters(name, n)
+                   SELECT 'inbox:' || IFNULL(user_id, ''), COUNT(*) FROM inbox GROUP BY user_id""")
+
+# (版本, 说明, 迁移函数)；只追加，不改已发布的版本
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "base schema: meta / events / inbox / rescan_progress", _v1_base_schema),
+    (2, "indexes for scan claims, lag and block ranges", _v2_hot_indexes),
+    (3, "covering inbox-by-user index, trigger-maintained counters", _v3_inbox_index_and_counters),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(con) -> int:
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(con) -> Tuple[int, int]:
+    """把 con 所在的库迁到 SCHEMA_VERSION，返回 (迁移前版本, 迁移后版本)"""
+    before = schema_version(con)
+    if before >= SCHEMA_VERSION:
+        return before, before
+    with transaction(con):
+        current = schema_version(con)  # 拿到写锁后再读一次：别的进程可能刚迁完
+        cur = con.cursor()
+        for version, desc, fn in MIGRATIONS:
+            if version > current:
+                fn(cur)
+                cur.execute(f"PRAGMA user_version = {int(version)}")
+                print(f"[storage] 🧱 {_db_name(con)} migrated to v{version}: {desc}")
+    return before, schema_version(con)
+
+def _db_name(con) -> str:
+    row = con.execute("PRAGMA database_list").fetchone()
+    return os.path.basename(row[2]) if row and row[2] else ":memory:"
+
+# =============================================================================
+# 连接
+# =============================================================================
+_migrated = set()
+_migrate_lock = threading.Lock()
+_local = threading.local()
+
+def _tune(con):
+    try:
+        con.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.Error:
+        pass  # 只读介质 / 内存库
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    con.execute(f"PRAGMA cache_size={-SQLITE_CACHE_MB * 1024}")
+    con.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    con.execute("PRAGMA temp_store=MEMORY")
+
+def connect(path: Optional[str] = None, migrate_schema: bool = True) -> sqlite3.Connection:
+    """新开一条调优连接；本进程第一次打开该库时顺带迁移"""
+    path = path or DB_PATH
+    fresh = path == ":memory:" or not os.path.exists(path)
+    con = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+                          cached_statements=SQLITE_STMT_CACHE)
+    if fresh:
+        # 必须在切 WAL、建表之前设置；老库需要一次 enable_incremental_vacuum()
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    _tune(con)
+    if migrate_schema:
+        key = (os.path.abspath(path), os.getpid())
+        if key not in _migrated:
+            with _migrate_lock:
+                if key not in _migrated:
+                    migrate(con)
+                    _migrated.add(key)
+    attach_cold(con)
+    return con
+
+def connection(path: Optional[str] = None) -> sqlite3.Connection:
+    """当前线程复用的连接（按库路径缓存；fork 出的子进程会重新打开）"""
+    path = path or DB_PATH
+    pool: Dict[Any, sqlite3.Connection] = getattr(_local, "pool", None)
+    if pool is None or getattr(_local, "pid", None) != os.getpid():
+        pool = _local.pool = {}
+        _local.pid = os.getpid()
+    con = pool.get(path)
+    if con is None:
+        con = pool[path] = connect(path)
+    return con
+
+def close_thread_connections():
+    """关闭当前线程缓存的连接（进程退出前 / 删库前）"""
+    for con in getattr(_local, "pool", {}).values():
+        con.close()
+    _local.pool = {}
+
+@contextmanager
+def transaction(con, component: Optional[str] = None):
+    """
+    BEGIN IMMEDIATE ... COMMIT：先拿写锁，读-改-写之间不会被别的写者插入
+    component 给定时提交耗时计入 mpc_db_commit_seconds
+    """
+    if con.in_transaction:
+        con.commit()  # 不把调用方之前未提交的隐式事务卷进来
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        yield con
+    except BaseException:
+        con.rollback()
+        raise
+    if component:
+        metrics.timed_commit(con, component)
+    else:
+        con.commit()
+
+# =============================================================================
+# 查询（只执行不提交）
+# =============================================================================
+SQL_INSERT_EVENT = """INSERT INTO events(block, txhash, tag, R, memo, commitment, created_at)
+                      VALUES(?,?,?,?,?,?, strftime('%s','now'))"""
+SQL_INSERT_INBOX = """INSERT OR IGNORE INTO inbox(user_id, event_id, tag, R, memo, commitment, memo_plain, detected_at)
+                      VALUES(?,?,?,?,?,?,?, strftime('%s','now'))"""
+SQL_MARK_SCANNED = """UPDATE events SET scanned=1, matched=?, lease_owner=NULL, lease_until=NULL,
+                                        retry_at=NULL, last_error=NULL WHERE id=?"""
+SQL_FETCH_INBOX = """SELECT i.id, e.block, e.txhash, hex(e.tag), hex(e.R), hex(e.memo), hex(e.commitment),
+                            i.status, i.detected_at
+                     FROM inbox i
+                     JOIN events e ON i.event_id = e.id
+                     WHERE i.user_id=?
+                     ORDER BY i.detected_at DESC"""
+
+def get_meta(con, key: str, default: Optional[str] = None) -> Optional[str]:
+    row = con.execute("SELECT v FROM meta WHERE k=?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_meta(con, key: str, value) -> None:
+    con.execute("INSERT INTO meta(k,v) VALUES(?,?) ON CONFLICT(k) DO UPDATE SET v=excluded.v", (key, str(value)))
+
+def insert_event(con, block, txhash, tag: bytes, R: bytes, memo: bytes, commitment: bytes) -> int:
+    return con.execute(SQL_INSERT_EVENT, (block, txhash, tag, R, memo, commitment)).lastrowid
+
+def insert_inbox(con, user_id: str, event_id: int, tag: bytes, R: bytes, memo: bytes, commitment: bytes,
+                 memo_plain: Optional[bytes] = None) -> None:
+    con.execute(SQL_INSERT_INBOX, (user_id, event_id, tag, R, memo, commitment, memo_plain))
+
+def mark_scanned(con, event_id: int, matched: int, owner: Optional[str] = None) -> bool:
+    """owner 给定时只在租约仍归该 worker 时写入（租约过期后被别人认领则放弃），返回是否写入"""
+    if owner is None:
+        return con.execute(SQL_MARK_SCANNED, (matched, event_id)).rowcount > 0
+    return con.execute(SQL_MARK_SCANNED + " AND lease_owner=?", (matched, event_id, owner)).rowcount > 0
+
+def fetch_inbox(con, user_id: str, limit: Optional[int] = None) -> List[Tuple]:
+    """(inbox_id, block, txhash, tag_hex, R_hex, memo_hex, commitment_hex, status, detected_at)，新到旧"""
+    if limit is None:
+        return con.execute(SQL_FETCH_INBOX, (user_id,)).fetchall()
+    return con.execute(SQL_FETCH_INBOX + " LIMIT ?", (user_id, limit)).fetchall()
+
+def counters(con) -> Dict[str, int]:
+    """
+    物化计数（O(桶数)）：
+      events / events_pending（scanned=0）/ events_done（scanned=1）/ events_scanned（已扫未命中）/
+      events_matched（matched=1）/ events_dead（scanned=-1）/ events_archived（在冷库里）/ inbox / inbox:<user_id>
+    """
+    return fold_counters(con.execute("SELECT name, n FROM counters"))
+
+def fold_counters(rows) -> Dict[str, int]:
+    """(name, n) 原始计数行 -> counters() 的口径；内存后端（mpc_core/stores.py）按同样的桶名计数"""
+    out = {"events": 0, "events_pending": 0, "events_done": 0, "events_scanned": 0,
+           "events_matched": 0, "events_dead": 0, "events_archived": 0}
+    for name, n in rows:
+        if name == "archived":
+            # 冷库里的都是已扫未命中：计入总数，口径与归档前一致
+            out["events_archived"] = n
+            for k in ("events", "events_done", "events_scanned"):
+                out[k] += n
+            continue
+        if not name.startswith("ev:"):
+            out[name] = n
+            continue
+        scanned, matched = name[3:].split(":")
+        out["events"] += n
+        if scanned == "0":
+            out["events_pending"] += n
+        elif scanned == "-1":
+            out["events_dead"] += n
+        elif scanned == "1":
+            out["events_done"] += n
+            if matched != "1":
+                out["events_scanned"] += n
+        if matched == "1":
+            out["events_matched"] += n
+    return out
+
+def counter(con, name: str) -> int:
+    return counters(con).get(name, 0)
+
+def event_state_counts(con) -> Dict[str, int]:
+    """events 按扫描状态计数：pending / scanned（未命中）/ matched / dead（读物化计数）"""
+    c = counters(con)
+    return {state: c[f"events_{state}"] for state in ("pending", "scanned", "matched", "dead")}
+
+def max_block(con) -> Optional[int]:
+    """最新事件块号（走 ix_events_block，O(log n)；热表搬空时取归档过的最大块号）"""
+    hot = con.execute("SELECT MAX(block) FROM events").fetchone()[0]
+    cold = get_meta(con, "archive_max_block")
+    if cold is None:
+        return hot
+    return max(int(cold), hot) if hot is not None else int(cold)
+
+# =============================================================================
+# 冷热分区
+# =============================================================================
+_ALL_EVENTS_COLS = "id, block, txhash, tag, R, memo, commitment, created_at"
+
+def cold_path(con) -> Optional[str]:
+    """主库对应的冷库文件：ARCHIVE_DB_PATH，默认 <主库名>_cold.db；内存库没有冷库"""
+    if ARCHIVE_DB_PATH:
+        return ARCHIVE_DB_PATH
+    main = con.execute("PRAGMA database_list").fetchone()[2]
+    if not main:
+        return None
+    root, ext = os.path.splitext(main)
+    return f"{root}_cold{ext or '.db'}"
+
+def has_cold(con) -> bool:
+    return any(row[1] == "cold" for row in con.execute("PRAGMA database_list"))
+
+def attach_cold(con, create: bool = False) -> bool:
+    """
+    冷库存在（或 create=True）时 ATTACH 为 cold，并（重）建临时视图 all_events；
+    ATTACH 不能在事务里执行，调用前要先提交
+    """
+    attached = has_cold(con)
+    path = cold_path(con)
+    if not attached and path and (create or os.path.exists(path)):
+        con.execute("ATTACH DATABASE ? AS cold", (path,))
+        con.execute("PRAGMA cold.journal_mode=WAL")
+        con.execute("PRAGMA cold.synchronous=NORMAL")
+        # 紧凑：只留重扫需要的列；状态恒为 scanned=1 / matched=0
+        con.execute("""CREATE TABLE IF NOT EXISTS cold.events_archive(
+          id INTEGER PRIMARY KEY,
+          block INTEGER,
+          txhash TEXT,
+          tag BLOB,
+          R   BLOB,
+          memo BLOB,
+          commitment BLOB,
+          created_at INTEGER,
+          archived_at INTEGER
+        )""")
+        con.execute("CREATE INDEX IF NOT EXISTS cold.ix_archive_block ON events_archive(block)")
+        attached = True
+    try:
+        con.execute("DROP VIEW IF EXISTS temp.all_events")
+        # 归档两步之间同一 id 可能两边都有：冷库那份只在热表没有时出现
+        cold_arm = (f" UNION ALL SELECT {_ALL_EVENTS_COLS}, 1 AS scanned, 0 AS matched FROM cold.events_archive a"
+                    f" WHERE NOT EXISTS (SELECT 1 FROM main.events e WHERE e.id = a.id)"
+                    if attached else "")
+        con.execute(f"CREATE TEMP VIEW all_events AS "
+                    f"SELECT {_ALL_EVENTS_COLS}, scanned, matched FROM main.events{cold_arm}")
+    except sqlite3.Error:
+        pass  # 库里还没有 events（migrate_schema=False 打开的空库）
+    return attached
+
+def archive_finalized(con, finality: Optional[int] = None, batch: Optional[int] = None,
+                      max_batches: Optional[int] = None) -> int:
+    """
+    把终局（block <= last_block - finality）、已扫、未命中、没有 inbox 引用的事件从 events 搬到冷库；
+    返回搬走的行数
+
+    WAL 模式下 ATTACH 的两个库不保证一起提交（各自一个 WAL），所以每批分两个事务：
+      1. 复制：候选 id 记进 temp.archive_ids，INSERT OR IGNORE 进 cold.events_archive，提交
+      2. 删除：只删冷库里确实已有、且仍满足归档条件的行（中途被 rescan 写了 inbox 的留在热表，
+         冷库里多出的副本一并删掉），同一事务里累加 archived 计数
+    两步之间崩溃只会让一行同时在两边（读路径按 id 去重，热表优先），下一轮复制是空操作、删除照常进行；
+    不会出现两边都没有的行
+    """
+    finality = ARCHIVE_FINALITY_BLOCKS if finality is None else finality
+    batch = batch or ARCHIVE_BATCH
+    cutoff = int(get_meta(con, "last_block", "0")) - finality
+    if cutoff < 0:
+        return 0
+    if con.in_transaction:
+        con.commit()
+    if not attach_cold(con, create=True):
+        return 0
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS archive_ids(id INTEGER PRIMARY KEY)")
+    eligible = """scanned=1 AND block <= ? AND matched IS NOT 1
+                  AND NOT EXISTS (SELECT 1 FROM main.inbox WHERE event_id = events.id)"""
+    total, rounds = 0, 0
+    while max_batches is None or rounds < max_batches:
+        rounds += 1
+        with transaction(con):  # 1. 复制进冷库并提交
+            con.execute("DELETE FROM temp.archive_ids")
+            con.execute(f"INSERT INTO temp.archive_ids(id) SELECT id FROM main.events WHERE {eligible} LIMIT ?",
+                        (cutoff, batch))
+            n = con.execute("SELECT COUNT(*) FROM temp.archive_ids").fetchone()[0]
+            if n:
+                con.execute(f"""INSERT OR IGNORE INTO cold.events_archive({_ALL_EVENTS_COLS}, archived_at)
+                                SELECT {_ALL_EVENTS_COLS}, strftime('%s','now') FROM main.events
+                                WHERE id IN (SELECT id FROM temp.archive_ids)""")
+        if not n:
+            break
+        with transaction(con):  # 2. 只删冷库里已有的
+            # 复制之后又不再满足条件的（rescan 写了 inbox / 标了命中）留在热表，去掉冷库里的副本
+            con.execute(f"""DELETE FROM cold.events_archive
+                            WHERE id IN (SELECT id FROM temp.archive_ids)
+                              AND id NOT IN (SELECT id FROM main.events WHERE {eligible})""", (cutoff,))
+            con.execute("""DELETE FROM temp.archive_ids
+                           WHERE id NOT IN (SELECT id FROM cold.events_archive)""")
+            top = con.execute("""SELECT MAX(block) FROM main.events
+                                 WHERE id IN (SELECT id FROM temp.archive_ids)""").fetchone()[0]
+            moved = con.execute("DELETE FROM main.events WHERE id IN (SELECT id FROM temp.archive_ids)").rowcount
+            if moved:
+                con.execute("""INSERT INTO counters(name, n) VALUES('archived', ?)
+                               ON CONFLICT(name) DO UPDATE SET n = n + excluded.n""", (moved,))
+            if top is not None and top > int(get_meta(con, "archive_max_block", "-1")):
+                set_meta(con, "archive_max_block", top)
+        total += moved
+        if n < batch:
+            break
+    return total
+
+def events_page(con, after_id: int, to_id: int, limit: int,
+                cols: str = "id, tag, R, memo, commitment") -> List[Tuple]:
+    """
+    id 在 (after_id, to_id] 内按 id 升序的下一页（热表 + 冷库），cols 第一列必须是 id
+    两边各自走主键范围扫描 + LIMIT 再归并；直接对 all_events 视图 ORDER BY ... LIMIT 会把整段范围排序
+    """
+    sql = "SELECT {cols} FROM {table} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?"
+    rows = con.execute(sql.format(cols=cols, table="main.events"), (after_id, to_id, limit)).fetchall()
+    if has_cold(con):
+        cold = con.execute(sql.format(cols=cols, table="cold.events_archive"), (after_id, to_id, limit)).fetchall()
+        if cold:
+            # 同 id 两边都有（归档复制后、删除前）时只留热表那份；merge 稳定，相等时先出 rows
+            merged = heapq.merge(rows, cold, key=lambda r: r[0])
+            firsts = (next(group) for _id, group in itertools.groupby(merged, key=lambda r: r[0]))
+            rows = list(itertools.islice(firsts, limit))
+    return rows
+
+def restore_archived(con, event_id: int) -> bool:
+    """冷库里的事件搬回热表（rescan 给新用户命中了历史事件时，inbox 要能 JOIN 到它）；不提交"""
+    if not has_cold(con):
+        return False
+    cur = con.execute(f"""INSERT OR IGNORE INTO main.events({_ALL_EVENTS_COLS}, scanned, matched)
+                          SELECT {_ALL_EVENTS_COLS}, 1, 0 FROM cold.events_archive WHERE id=?""", (event_id,))
+    con.execute("DELETE FROM cold.events_archive WHERE id=?", (event_id,))
+    if cur.rowcount <= 0:
+        return False  # 不在冷库，或归档复制后还没删热表那份（只去掉冷库副本，计数没加过）
+    con.execute("UPDATE counters SET n = n - 1 WHERE name='archived'")
+    return True
+
+def mark_matched(con, event_id: int) -> None:
+    """重扫命中：事件在冷库时先搬回热表，再标 matched=1；不提交"""
+    restore_archived(con, event_id)
+    con.execute("UPDATE events SET matched=1 WHERE id=?", (event_id,))
+
+def incremental_vacuum(con, pages: Optional[int] = None) -> int:
+    """归还最多 pages 个空闲页给文件系统，返回归还的页数；auto_vacuum 不是 INCREMENTAL 时返回 -1"""
+    if con.execute("PRAGMA main.auto_vacuum").fetchone()[0] != 2:
+        return -1
+    if con.in_transaction:
+        con.commit()
+    before = con.execute("PRAGMA main.freelist_count").fetchone()[0]
+    # execute() 只 step 一次（每次释放一页），executescript 才会跑完
+    con.executescript(f"PRAGMA main.incremental_vacuum({int(pages or ARCHIVE_VACUUM_PAGES)});")
+    return before - con.execute("PRAGMA main.freelist_count").fetchone()[0]
+
+def enable_incremental_vacuum(con) -> None:
+    """老库一次性切到 auto_vacuum=INCREMENTAL（需要整库 VACUUM，期间独占写锁）"""
+    if con.in_transaction:
+        con.commit()
+    con.execute("PRAGMA main.auto_vacuum=INCREMENTAL")
+    con.execute("VACUUM main")
+
+# =============================================================================
+# 查询计划断言：热路径查询必须走指定索引，不能全表扫描 / 临时排序
+# =============================================================================
+# 名称 -> (SQL, 参数, 可接受的索引；任一出现在计划里即可)
+HOT_QUERIES: Dict[str, Tuple[str, tuple, Tuple[str, ...]]] = {
+    "fetch_inbox":     (SQL_FETCH_INBOX, ("alice",), ("ix_inbox_user_detected",)),
+    "inbox_by_id":     ("SELECT e.memo, i.memo_plain FROM inbox i JOIN events e ON i.event_id = e.id "
+                        "WHERE i.id=? AND i.user_id=?", (1, "alice"), ("INTEGER PRIMARY KEY",)),
+    "claim_live":      ("SELECT id, tag, R, memo, commitment, created_at FROM events WHERE scanned=0 AND id > ? "
+                        "AND (lease_until IS NULL OR lease_until < ?) AND (retry_at IS NULL OR retry_at <= ?) "
+                        "ORDER BY id DESC LIMIT ?", (0, 0, 0, 200), ("ix_events_scanned_id",)),
+    "claim_backfill":  ("SELECT id, tag, R, memo, commitment, created_at FROM events WHERE scanned=0 AND id <= ? "
+                        "AND (lease_until IS NULL OR lease_until < ?) AND (retry_at IS NULL OR retry_at <= ?) "
+                        "ORDER BY id ASC LIMIT ?", (0, 0, 0, 100), ("ix_events_scanned_id",)),
+    "oldest_pending":  ("SELECT MIN(block) FROM events WHERE scanned=0", (), ("ix_events_scanned_block",)),
+    "max_block":       ("SELECT MAX(block) FROM events", (), ("ix_events_block",)),
+    "scan_page":       ("SELECT id, tag, R, memo, commitment FROM main.events WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                        (0, 0, 1000), ("INTEGER PRIMARY KEY",)),
+    "archive_pick":    ("SELECT id FROM main.events WHERE scanned=1 AND block <= ? AND matched IS NOT 1 "
+                        "AND NOT EXISTS (SELECT 1 FROM main.inbox WHERE event_id = events.id) LIMIT ?",
+                        (0, 5000), ("ix_events_scanned_block",)),
+    "inbox_count":     ("SELECT n FROM counters WHERE name=?", ("inbox:alice",), ("PRIMARY KEY",)),
+}
+
+def query_plan(con, sql: str, params: tuple = ()) -> List[str]:
+    return [row[3] for row in con.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+def check_query_plans(con) -> List[str]:
+    """逐条检查 HOT_QUERIES 的计划，返回问题列表（空 = 通过）"""
+    problems: List[str] = []
+    for name, (sql, params, indexes) in HOT_QUERIES.items():
+        plan = query_plan(con, sql, params)
+        text = " | ".join(plan)
+        if not any(ix in text for ix in indexes):
+            problems.append(f"{name}: expected {' or '.join(indexes)}, got: {text}")
+        for step in plan:
+            if step.startswith("SCAN") and "USING" not in step:
+                problems.append(f"{name}: full table scan: {step}")
+            if "TEMP B-TREE" in step:
+                problems.append(f"{name}: temp b-tree: {step}")
+    return problems
+
+def main():
+    import argparse
+    import sys
+    ap = argparse.ArgumentParser(description="migrate an index DB and print its schema version")
+    ap.add_argument("db", nargs="?", default=DB_PATH)
+    ap.add_argument("--check-plans", action="store_true",
+                    help="assert hot queries use their indexes; exit 1 on regression")
+    args = ap.parse_args()
+    con = connect(args.db, migrate_schema=False)
+    before, after = migrate(con)
+    attach_cold(con)
+    print(f"{args.db}: schema v{before} -> v{after} (latest v{SCHEMA_VERSION})")
+    if args.check_plans:
+        problems = check_query_plans(con)
+        for name, (sql, params, _) in HOT_QUERIES.items():
+            print(f"  {name:<16} {' | '.join(query_plan(con, sql, params))}")
+        for p in problems:
+            print(f"[storage] ❌ {p}")
+        con.close()
+        sys.exit(1 if problems else 0)
+    con.close()
+
+if __name__ == "__main__":
+    main()
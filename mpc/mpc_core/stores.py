@@ -0,0 +1,509 @@
+# mpc_core/stores.py
+"""
+存储后端接口：scanner / watcher / server / test_wallet 经由 Store 读写 events、inbox、meta 与扫描进度
+
+- SqliteStore：mpc_core/storage.py 之上的薄封装（每线程复用连接、迁移链、触发器计数），
+  每个写方法自己提交并按 component 记录提交耗时，与之前各脚本直接写库的语义一致
+- MemoryStore：纯内存实现，给基准和单进程流水线用（同一进程里按名字共享一个实例），
+  不落盘、不跨进程；量的是去掉数据库之后的吞吐上限。scanner / watcher / server / test_wallet
+  各自是独立进程，用内存后端只会各看到一个空库，所以它们以 standalone=True 打开，遇到 memory 直接报错
+- 两者行为对齐：租约 / 重试 / 死信的认领规则、inbox 按 event_id 去重、counters() 的口径
+- rescan / archive / segments 需要冷库与分页归并，仍然直接用 storage（只有 SQLite 有历史）
+
+环境变量：
+  STORAGE_BACKEND=sqlite|memory   # 默认 sqlite
+"""
+import abc
+import bisect
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics, storage
+
+BACKENDS = ("sqlite", "memory")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+
+# 认领结果：(id, tag, R, memo, commitment, created_at)
+ClaimRow = Tuple[int, bytes, bytes, bytes, bytes, int]
+
+class Store(abc.ABC):
+    """后端接口；写方法各自提交（内存后端即时生效）"""
+    backend = ""
+    location = ""
+
+    def migrate(self) -> None:
+        pass
+
+    # ---- meta ----
+    @abc.abstractmethod
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_meta(self, key: str, value) -> None:
+        raise NotImplementedError
+
+    # ---- events ----
+    @abc.abstractmethod
+    def insert_event(self, block, txhash, tag: bytes, R: bytes, memo: bytes, commitment: bytes) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def max_event_id(self) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def max_block(self) -> Optional[int]:
+        raise NotImplementedError
+
+    # ---- 扫描进度：租约 / 重试 / 死信 ----
+    @abc.abstractmethod
+    def claim(self, lane: str, floor: int, limit: int, owner: str, lease_s: int) -> List[ClaimRow]:
+        """live：floor 之上最新的待扫事件（新到旧）；backfill：floor 及以下最老的（旧到新）"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def release_leases(self, owner: str) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def renew_leases(self, event_ids: List[int], owner: str, lease_s: int) -> int:
+        """把仍归 owner 的待扫事件租约续到 now + lease_s，返回续上的条数（少了说明有租约被别人接手）"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def mark_scanned(self, event_id: int, matched: int, owner: Optional[str] = None) -> bool:
+        """owner 给定时只在租约仍归它时写入；返回是否写入"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def attempts(self, event_id: int) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def defer(self, event_id: int, attempts: int, error: str, retry_at: Optional[int] = None,
+              owner: Optional[str] = None) -> bool:
+        """保持待扫并在 retry_at 之后可再认领；retry_at=None 表示转入死信（scanned=-1）。owner 同 mark_scanned"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def requeue_dead(self) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def pending_counts(self, floor: int) -> Tuple[int, int]:
+        """(live 待扫数, backfill 待扫数)"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def retry_counts(self) -> Tuple[int, int]:
+        """(等待重试数, 死信数)"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def lag_blocks(self) -> int:
+        """最新事件块号 - 最老待扫事件块号（无积压为 0）"""
+        raise NotImplementedError
+
+    # ---- inbox ----
+    @abc.abstractmethod
+    def insert_inbox(self, user_id: str, event_id: int, tag: bytes, R: bytes, memo: bytes, commitment: bytes,
+                     memo_plain: Optional[bytes] = None) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def fetch_inbox(self, user_id: str, limit: Optional[int] = None) -> List[Tuple]:
+        """(inbox_id, block, txhash, tag_hex, R_hex, memo_hex, commitment_hex, status, detected_at)，新到旧"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def inbox_memo(self, inbox_id: int, user_id: str) -> Optional[Tuple[bytes, Optional[bytes]]]:
+        """(事件原始 memo, 命中时解出的明文或 None)"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def counters(self) -> Dict[str, int]:
+        """口径同 storage.counters()"""
+        raise NotImplementedError
+
+# =============================================================================
+# SQLite
+# =============================================================================
+class SqliteStore(Store):
+    backend = "sqlite"
+
+    def __init__(self, path: str, component: str = "app"):
+        self.path = path
+        self.component = component
+        self.location = os.path.abspath(path)
+
+    @property
+    def con(self):
+        """本线程复用的调优连接；不要 close()"""
+        return storage.connection(self.path)
+
+    def _commit(self, con):
+        metrics.timed_commit(con, self.component)
+
+    def migrate(self) -> None:
+        storage.migrate(self.con)
+
+    def get_meta(self, key, default=None):
+        return storage.get_meta(self.con, key, default)
+
+    def set_meta(self, key, value):
+        con = self.con
+        storage.set_meta(con, key, value)
+        self._commit(con)
+
+    def insert_event(self, block, txhash, tag, R, memo, commitment):
+        con = self.con
+        eid = storage.insert_event(con, block, txhash, tag, R, memo, commitment)
+        self._commit(con)
+        return eid
+
+    def max_event_id(self):
+        return self.con.execute("SELECT MAX(id) FROM events").fetchone()[0] or 0
+
+    def max_block(self):
+        return storage.max_block(self.con)
+
+    def claim(self, lane, floor, limit, owner, lease_s):
+        now = int(time.time())
+        order = "DESC" if lane == "live" else "ASC"
+        cond = "id > ?" if lane == "live" else "id <= ?"
+        con = self.con
+        with storage.transaction(con, component=self.component):  # 写锁：select + update 原子化
+            rows = con.execute(f"""SELECT id, tag, R, memo, commitment, created_at FROM events
+                                   WHERE scanned=0 AND {cond}
+                                     AND (lease_until IS NULL OR lease_until < ?)
+                                     AND (retry_at IS NULL OR retry_at <= ?)
+                                   ORDER BY id {order} LIMIT ?""", (floor, now, now, limit)).fetchall()
+            if rows:
+                con.executemany("UPDATE events SET lease_owner=?, lease_until=? WHERE id=?",
+                                [(owner, now + lease_s, r[0]) for r in rows])
+        return rows
+
+    def release_leases(self, owner):
+        con = self.con
+        con.execute("UPDATE events SET lease_owner=NULL, lease_until=NULL WHERE scanned=0 AND lease_owner=?", (owner,))
+        self._commit(con)
+
+    def renew_leases(self, event_ids, owner, lease_s):
+        if not event_ids:
+            return 0
+        con = self.con
+        until = int(time.time()) + lease_s
+        n = 0
+        for i in range(0, len(event_ids), 500):
+            chunk = list(event_ids[i:i + 500])
+            n += con.execute(f"""UPDATE events SET lease_until=?
+                                 WHERE scanned=0 AND lease_owner=? AND id IN ({",".join("?" * len(chunk))})""",
+                             [until, owner] + chunk).rowcount
+        self._commit(con)
+        return n
+
+    def mark_scanned(self, event_id, matched, owner=None):
+        con = self.con
+        ok = storage.mark_scanned(con, event_id, matched, owner)
+        self._commit(con)
+        return ok
+
+    def attempts(self, event_id):
+        row = self.con.execute("SELECT COALESCE(attempts, 0) FROM events WHERE id=?", (event_id,)).fetchone()
+        return row[0] if row else 0
+
+    def defer(self, event_id, attempts, error, retry_at=None, owner=None):
+        con = self.con
+        owned, args = ("", ()) if owner is None else (" AND lease_owner=?", (owner,))
+        if retry_at is None:
+            n = con.execute("""UPDATE events SET scanned=-1, attempts=?, retry_at=NULL, last_error=?,
+                                      lease_owner=NULL, lease_until=NULL WHERE id=?""" + owned,
+                            (attempts, error, event_id) + args).rowcount
+        else:
+            n = con.execute("""UPDATE events SET attempts=?, retry_at=?, last_error=?,
+                                      lease_owner=NULL, lease_until=NULL WHERE id=?""" + owned,
+                            (attempts, retry_at, error, event_id) + args).rowcount
+        self._commit(con)
+        return n > 0
+
+    def requeue_dead(self):
+        con = self.con
+        n = con.execute("""UPDATE events SET scanned=0, attempts=0, retry_at=NULL, last_error=NULL
+                           WHERE scanned=-1""").rowcount
+        self._commit(con)
+        return n
+
+    def pending_counts(self, floor):
+        row = self.con.execute("""SELECT SUM(CASE WHEN id > ? THEN 1 ELSE 0 END),
+                                         SUM(CASE WHEN id <= ? THEN 1 ELSE 0 END)
+                                  FROM events WHERE scanned=0""", (floor, floor)).fetchone()
+        return (row[0] or 0), (row[1] or 0)
+
+    def retry_counts(self):
+        row = self.con.execute("""SELECT SUM(CASE WHEN scanned=0 AND retry_at IS NOT NULL THEN 1 ELSE 0 END),
+                                         SUM(CASE WHEN scanned=-1 THEN 1 ELSE 0 END)
+                                  FROM events WHERE scanned<=0""").fetchone()
+        return (row[0] or 0), (row[1] or 0)
+
+    def lag_blocks(self):
+        row = self.con.execute("""SELECT MAX(block), (SELECT MIN(block) FROM events WHERE scanned=0)
+                                  FROM events""").fetchone()
+        if not row or row[0] is None or row[1] is None:
+            return 0
+        return max(0, row[0] - row[1])
+
+    def insert_inbox(self, user_id, event_id, tag, R, memo, commitment, memo_plain=None):
+        con = self.con
+        storage.insert_inbox(con, user_id, event_id, tag, R, memo, commitment, memo_plain)
+        self._commit(con)
+
+    def fetch_inbox(self, user_id, limit=None):
+        return storage.fetch_inbox(self.con, user_id, limit)
+
+    def inbox_memo(self, inbox_id, user_id):
+        return self.con.execute("""SELECT e.memo, i.memo_plain
+                                   FROM inbox i JOIN events e ON i.event_id = e.id
+                                   WHERE i.id=? AND i.user_id=?""", (inbox_id, user_id)).fetchone()
+
+    def counters(self):
+        return storage.counters(self.con)
+
+# =============================================================================
+# 内存
+# =============================================================================
+class _Event:
+    __slots__ = ("id", "block", "txhash", "tag", "R", "memo", "commitment", "created_at",
+                 "scanned", "matched", "attempts", "retry_at", "last_error", "lease_owner", "lease_until")
+
+    def __init__(self, eid, block, txhash, tag, R, memo, commitment):
+        self.id, self.block, self.txhash = eid, block, txhash
+        self.tag, self.R, self.memo, self.commitment = tag, R, memo, commitment
+        self.created_at = int(time.time())
+        self.scanned, self.matched, self.attempts = 0, 0, 0
+        self.retry_at = self.last_error = self.lease_owner = self.lease_until = None
+
+def _hex(b) -> str:
+    return bytes(b).hex().upper() if b is not None else ""  # 同 SQLite hex()
+
+class MemoryStore(Store):
+    """单进程内存后端；一把锁串行化所有读写（与 SQLite 单写者的语义相同）"""
+    backend = "memory"
+
+    def __init__(self, name: str = "default"):
+        self.location = f"memory:{name}"
+        self._lock = threading.RLock()
+        self._meta: Dict[str, str] = {}
+        self._events: Dict[int, _Event] = {}
+        self._next_id = 1
+        self._max_block: Optional[int] = None
+        self._pending: List[int] = []      # scanned=0 的 id，升序
+        self._retrying = set()             # scanned=0 且 retry_at 非空
+        self._inbox: Dict[int, tuple] = {}  # inbox_id -> (user_id, event_id, memo_plain, status, detected_at)
+        self._inbox_by_event: Dict[int, int] = {}
+        self._inbox_by_user: Dict[str, List[int]] = {}
+        self._next_inbox = 1
+        self._counts: Dict[str, int] = {"inbox": 0}  # 与 counters 表同名的桶（v3 回填同样留一行 inbox=0）
+
+    def _bump(self, name: str, d: int):
+        self._counts[name] = self._counts.get(name, 0) + d
+
+    def _set_state(self, ev: _Event, scanned: int, matched: int):
+        if (ev.scanned, ev.matched) == (scanned, matched):
+            return
+        self._bump(f"ev:{ev.scanned}:{ev.matched}", -1)
+        self._bump(f"ev:{scanned}:{matched}", 1)
+        if ev.scanned == 0 and scanned != 0:
+            i = bisect.bisect_left(self._pending, ev.id)
+            if i < len(self._pending) and self._pending[i] == ev.id:
+                del self._pending[i]
+            self._retrying.discard(ev.id)
+        elif ev.scanned != 0 and scanned == 0:
+            bisect.insort(self._pending, ev.id)
+        ev.scanned, ev.matched = scanned, matched
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            return self._meta.get(key, default)
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._meta[key] = str(value)
+
+    def insert_event(self, block, txhash, tag, R, memo, commitment):
+        with self._lock:
+            eid = self._next_id
+            self._next_id += 1
+            self._events[eid] = _Event(eid, block, txhash, tag, R, memo, commitment)
+            self._pending.append(eid)
+            self._bump("ev:0:0", 1)
+            if block is not None and (self._max_block is None or block > self._max_block):
+                self._max_block = block
+            return eid
+
+    def max_event_id(self):
+        with self._lock:
+            return self._next_id - 1
+
+    def max_block(self):
+        with self._lock:
+            return self._max_block
+
+    def claim(self, lane, floor, limit, owner, lease_s):
+        now = int(time.time())
+        out: List[ClaimRow] = []
+        with self._lock:
+            cut = bisect.bisect_right(self._pending, floor)
+            ids = reversed(self._pending[cut:]) if lane == "live" else self._pending[:cut]
+            for eid in ids:
+                ev = self._events[eid]
+                if ev.lease_until is not None and ev.lease_until >= now:
+                    continue
+                if ev.retry_at is not None and ev.retry_at > now:
+                    continue
+                ev.lease_owner, ev.lease_until = owner, now + lease_s
+                out.append((eid, ev.tag, ev.R, ev.memo, ev.commitment, ev.created_at))
+                if len(out) >= limit:
+                    break
+        return out
+
+    def release_leases(self, owner):
+        with self._lock:
+            for eid in self._pending:
+                ev = self._events[eid]
+                if ev.lease_owner == owner:
+                    ev.lease_owner = ev.lease_until = None
+
+    def renew_leases(self, event_ids, owner, lease_s):
+        until = int(time.time()) + lease_s
+        n = 0
+        with self._lock:
+            for eid in event_ids:
+                ev = self._events.get(eid)
+                if ev is not None and ev.scanned == 0 and ev.lease_owner == owner:
+                    ev.lease_until = until
+                    n += 1
+        return n
+
+    def mark_scanned(self, event_id, matched, owner=None):
+        with self._lock:
+            ev = self._events.get(event_id)
+            if ev is None or (owner is not None and ev.lease_owner != owner):
+                return False
+            self._set_state(ev, 1, matched)
+            ev.lease_owner = ev.lease_until = ev.retry_at = ev.last_error = None
+            return True
+
+    def attempts(self, event_id):
+        with self._lock:
+            ev = self._events.get(event_id)
+            return ev.attempts if ev else 0
+
+    def defer(self, event_id, attempts, error, retry_at=None, owner=None):
+        with self._lock:
+            ev = self._events.get(event_id)
+            if ev is None or (owner is not None and ev.lease_owner != owner):
+                return False
+            ev.attempts, ev.retry_at, ev.last_error = attempts, retry_at, error
+            ev.lease_owner = ev.lease_until = None
+            if retry_at is None:
+                self._set_state(ev, -1, ev.matched)
+            elif ev.scanned == 0:
+                self._retrying.add(event_id)
+            return True
+
+    def requeue_dead(self):
+        with self._lock:
+            dead = [ev for ev in self._events.values() if ev.scanned == -1]
+            for ev in dead:
+                self._set_state(ev, 0, ev.matched)
+                ev.attempts, ev.retry_at, ev.last_error = 0, None, None
+            return len(dead)
+
+    def pending_counts(self, floor):
+        with self._lock:
+            cut = bisect.bisect_right(self._pending, floor)
+            return len(self._pending) - cut, cut
+
+    def retry_counts(self):
+        with self._lock:
+            dead = sum(n for name, n in self._counts.items() if name.startswith("ev:-1:"))
+            return len(self._retrying), dead
+
+    def lag_blocks(self):
+        with self._lock:
+            if self._max_block is None or not self._pending:
+                return 0
+            oldest = min(b for b in (self._events[i].block for i in self._pending) if b is not None)
+            return max(0, self._max_block - oldest)
+
+    def insert_inbox(self, user_id, event_id, tag, R, memo, commitment, memo_plain=None):
+        with self._lock:
+            iid = self._next_inbox
+            self._next_inbox += 1  # AUTOINCREMENT 在被忽略的插入上也会消耗一个 id
+            if event_id in self._inbox_by_event:  # 同 ux_inbox_event 上的 INSERT OR IGNORE
+                return
+            self._inbox[iid] = (user_id, event_id, memo_plain, "unread", int(time.time()))
+            self._inbox_by_event[event_id] = iid
+            self._inbox_by_user.setdefault(user_id, []).append(iid)
+            self._bump("inbox", 1)
+            self._bump(f"inbox:{user_id or ''}", 1)
+
+    def fetch_inbox(self, user_id, limit=None):
+        with self._lock:
+            inbox = self._inbox
+            # 与 ix_inbox_user_detected 倒序遍历一致：detected_at 再 event_id，从新到旧
+            ids = sorted(self._inbox_by_user.get(user_id, []), key=lambda i: (inbox[i][4], inbox[i][1]), reverse=True)
+            out = []
+            for iid in ids:
+                _user, eid, _plain, status, detected_at = self._inbox[iid]
+                ev = self._events.get(eid)
+                if ev is None:
+                    continue
+                out.append((iid, ev.block, ev.txhash, _hex(ev.tag), _hex(ev.R), _hex(ev.memo), _hex(ev.commitment),
+                            status, detected_at))
+                if limit is not None and len(out) >= limit:
+                    break
+            return out
+
+    def inbox_memo(self, inbox_id, user_id):
+        with self._lock:
+            row = self._inbox.get(inbox_id)
+            if row is None or row[0] != user_id or row[1] not in self._events:
+                return None
+            return self._events[row[1]].memo, row[2]
+
+    def counters(self):
+        with self._lock:
+            return storage.fold_counters(list(self._counts.items()))
+
+# =============================================================================
+# 选择后端
+# =============================================================================
+_memory_stores: Dict[str, MemoryStore] = {}
+_memory_lock = threading.Lock()
+
+def open_store(path: Optional[str] = None, backend: Optional[str] = None, component: str = "app",
+               standalone: bool = False) -> Store:
+    """
+    path 对 SQLite 是库文件；对内存后端是实例名（同一进程内同名共享，单进程流水线里各阶段看到同一份数据）
+    component 只用于 SQLite 的提交耗时指标（mpc_db_commit_seconds{component=...}）
+    standalone=True：调用方是独立进程的入口（scanner / watcher / server / test_wallet），
+    内存后端在那里只是一个别人写不进来的空库，直接拒绝
+    """
+    backend = (backend or STORAGE_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}")
+    if standalone and backend == "memory":
+        raise ValueError(f"{component}: STORAGE_BACKEND=memory is per-process and would leave this process "
+                         f"with its own empty store; use sqlite (memory is for in-process benchmarks only)")
+    path = path or os.getenv("DB_PATH", "mpc_index.db")
+    if backend == "sqlite":
+        return SqliteStore(path, component)
+    with _memory_lock:
+        store = _memory_stores.get(path)
+        if store is None:
+            store = _memory_stores[path] = MemoryStore(path)
+        return store
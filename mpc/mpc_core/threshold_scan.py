@@ -1,45 +1,28 @@
 # mpc_core/threshold_scan.py
-from typing import List, Tuple
-from web3 import Web3
-import hashlib, json
+from typing import List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse, json, os
 from coincurve import PublicKey
 
-# secp256k1 曲线阶
-N = int("0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141", 16)
-
-def _mod_inv(x: int) -> int:
-    return pow(x % N, N - 2, N)
+from .aggregate import lagrange_coeffs_at_zero
+from .primitives import SECP_N as N, tag_hash
+from . import storage
 
 def _lagrange_at_zero(indices: List[int]) -> List[int]:
     """
     计算在 x=0 的拉格朗日系数 λ_i（模 n），indices 是参与的 x 坐标（从 1 开始的正整数）。
+    结果按索引集合缓存（见 aggregate.lagrange_coeffs_at_zero）。
     """
-    lambdas: List[int] = []
-    for i, xi in enumerate(indices):
-        num, den = 1, 1
-        for j, xj in enumerate(indices):
-            if j == i:
-                continue
-            num = (num * (-xj % N)) % N        # (0 - xj)
-            den = (den * ((xi - xj) % N)) % N  # (xi - xj)
-        lambdas.append((num * _mod_inv(den)) % N)
-    return lambdas
-
-def _point_add(points: List[PublicKey]) -> PublicKey:
-    # coincurve 提供 PublicKey.combine 合并多个公钥（椭圆曲线点相加）
-    return PublicKey.combine(points)
-
-def _point_mul(point: PublicKey, k: int) -> PublicKey:
-    # 对给定点做标量乘法
-    return point.multiply(k.to_bytes(32, "big"))
+    return lagrange_coeffs_at_zero(indices)
 
 def derive_tag_tofn(
     R_compressed: bytes,
     shares: List[Tuple[int, int]],
 ) -> bytes:
     """
-    用 t-of-n 分片在“点上插值”计算 S = s_view * R（不重建明文私钥），
+    用 t-of-n 分片插值出 s_view = Σ λ_i·y_i，计算 S = s_view * R，
     再 tag = keccak256( sha256( S_compressed ) )
+    （本进程持有 t 份分片即等于持有 s_view；需要私钥不落地的场景走 MPC 节点）
 
     入参:
       - R_compressed: 33字节压缩一次性公钥 r·G（secp256k1）
@@ -51,23 +34,100 @@ def derive_tag_tofn(
     if len(shares) < 2:
         raise ValueError("need at least 2 shares for threshold scan demo")
 
-    indices = [i for (i, _) in shares]
-    lambdas = _lagrange_at_zero(indices)
-    R = PublicKey(R_compressed)
+    return _tag_from_scalar(R_compressed, _combined_scalar(shares), "comp33")
+
+def _combined_scalar(shares: Sequence[Tuple[int, int]]) -> bytes:
+    """
+    预先合并 s_view = Σ λ_i(0)·y_i mod n（32B），之后每个 R 只做一次点乘。
+    离线审计 / 重扫进程本来就同时持有 t 份分片，它们已经唯一确定 s_view；
+    逐份点乘再相加并不能让这个进程少知道什么，只会多花 t-1 次点乘和一次 combine。
+    """
+    lambdas = lagrange_coeffs_at_zero([i for (i, _) in shares])
+    s_view = sum(li * yi for (_, yi), li in zip(shares, lambdas)) % N
+    if s_view == 0:
+        raise ValueError("shares interpolate to zero")
+    return s_view.to_bytes(32, "big")
+
+def derive_shared_tofn(R_compressed: bytes, shares: List[Tuple[int, int]]) -> PublicKey:
+    """共享点 S = s_view * R 本身（例如命中后解 memo 用）"""
+    return PublicKey(R_compressed).multiply(_combined_scalar(shares))
+
+def _tag_from_scalar(R_compressed: bytes, scalar: bytes, codec: str) -> bytes:
+    S_point = PublicKey(R_compressed).multiply(scalar)           # S = s_view * R
+    if codec == "x32":
+        S_bytes = S_point.format(compressed=False)[1:33]          # X 坐标 32B
+    else:
+        S_bytes = S_point.format(compressed=True)                 # 33B
+    return tag_hash(S_bytes)
+
+# 进程池 worker 状态：每个进程只接收一次合并后的标量
+_worker_scalar = b""
+_worker_codec = "comp33"
+
+def _init_worker(scalar: bytes, codec: str):
+    global _worker_scalar, _worker_codec
+    _worker_scalar, _worker_codec = scalar, codec
+
+def _tags_chunk(R_list: Sequence[bytes], scalar: bytes, codec: str) -> List[Optional[bytes]]:
+    out: List[Optional[bytes]] = []
+    for R in R_list:
+        try:
+            out.append(_tag_from_scalar(bytes(R), scalar, codec))
+        except Exception:
+            out.append(None)  # 非法 R：不影响同批其它事件
+    return out
+
+def _worker_tags_chunk(R_list: List[bytes]) -> List[Optional[bytes]]:
+    return _tags_chunk(R_list, _worker_scalar, _worker_codec)
+
+def make_tofn_pool(shares: List[Tuple[int, int]], codec: str = "comp33",
+                   workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """预热好的进程池（每个 worker 已持有合并后的标量），跨多次 derive_tags_tofn_batch 复用"""
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, initializer=_init_worker,
+                               initargs=(_combined_scalar(shares), codec))
+
+def derive_tags_tofn_batch(
+    R_list: Sequence[bytes],
+    shares: List[Tuple[int, int]],
+    codec: str = "comp33",
+    workers: Optional[int] = None,
+    chunk: int = 1024,
+    executor: Optional[ProcessPoolExecutor] = None,
+) -> List[Optional[bytes]]:
+    """
+    derive_tag_tofn 的批量版：Σ λ_i·y_i 只合并一次（每个 R 一次点乘），多核并行。
+
+    入参:
+      - R_list: 33字节压缩 R 的列表
+      - shares: 同 derive_tag_tofn
+      - codec: "comp33"（与 derive_tag_tofn 一致）或 "x32"（与 scanner 默认口径一致）
+      - workers: 进程数，默认 os.cpu_count()；<=1 时在当前进程计算
+      - executor: make_tofn_pool 创建的进程池（须用同一组 shares / codec），传入则复用
+
+    返回:
+      - 与 R_list 等长的 tag 列表，非法 R 对应 None
+    """
+    if len(shares) < 2:
+        raise ValueError("need at least 2 shares for threshold scan demo")
+    if codec not in ("x32", "comp33"):
+        raise ValueError("codec must be x32 or comp33")
+
+    chunks = [list(R_list[i:i + chunk]) for i in range(0, len(R_list), chunk)]
+    out: List[Optional[bytes]] = []
+    if executor is not None:
+        for part in executor.map(_worker_tags_chunk, chunks):
+            out.extend(part)
+        return out
 
-    weighted_points: List[PublicKey] = []
-    for (i, yi), li in zip(shares, lambdas):
-        # 局部点：yi * R
-        Pi = R.multiply(yi.to_bytes(32, "big"))
-        # 加权：λ_i * (yi * R)
-        Qi = _point_mul(Pi, li)
-        weighted_points.append(Qi)
+    scalar = _combined_scalar(shares)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(R_list) <= chunk:
+        return _tags_chunk(R_list, scalar, codec)
 
-    S_point = _point_add(weighted_points)              # S = s_view * R
-    S_bytes = S_point.format(compressed=True)          # 33B
-    s_hash = hashlib.sha256(S_bytes).digest()          # 32B
-    tag = Web3.keccak(s_hash)                          # 32B
-    return tag
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(scalar, codec)) as pool:
+        for part in pool.map(_worker_tags_chunk, chunks):
+            out.extend(part)
+    return out
 
 def parse_shares_json(shares_json: str) -> List[Tuple[int, int]]:
     """
@@ -78,3 +138,44 @@ def parse_shares_json(shares_json: str) -> List[Tuple[int, int]]:
     for idx_str, y_hex in raw:
         out.append((int(idx_str), int(y_hex, 16)))
     return out
+
+def audit_events(db_path: str, shares: List[Tuple[int, int]], codec: str = "comp33",
+                 from_id: int = 0, to_id: Optional[int] = None,
+                 workers: Optional[int] = None, page: int = 50000) -> List[int]:
+    """
+    离线审计 / 重扫：按 id 分页读取 events 表（含冷库），批量计算 tag，返回命中的事件 id（不写库）
+    """
+    con = storage.connect(db_path, migrate_schema=False)  # 只读审计，不动库结构
+    matched: List[int] = []
+    last = from_id - 1
+    try:
+        while True:
+            # 热表 + 冷库（已归档的历史事件）
+            rows = storage.events_page(con, last, to_id if to_id is not None else 2**62, page, cols="id, tag, R")
+            if not rows:
+                break
+            tags = derive_tags_tofn_batch([bytes(r[2] or b"") for r in rows], shares, codec=codec, workers=workers)
+            for (eid, tag_db, _), tag in zip(rows, tags):
+                if tag is not None and bytes(tag) == bytes(tag_db or b""):
+                    matched.append(eid)
+            last = rows[-1][0]
+    finally:
+        con.close()
+    return matched
+
+def main():
+    ap = argparse.ArgumentParser(description="offline threshold re-scan of an events table")
+    ap.add_argument("--db", default=os.getenv("DB_PATH", "mpc_index.db"))
+    ap.add_argument("--shares", required=True, help='JSON, e.g. [["1","0x.."],["3","0x.."]]')
+    ap.add_argument("--codec", default="comp33", choices=("x32", "comp33"))
+    ap.add_argument("--from-id", type=int, default=0)
+    ap.add_argument("--to-id", type=int, default=None)
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+
+    matched = audit_events(args.db, parse_shares_json(args.shares), codec=args.codec,
+                           from_id=args.from_id, to_id=args.to_id, workers=args.workers)
+    print(json.dumps({"matched": matched, "count": len(matched)}))
+
+if __name__ == "__main__":
+    main()
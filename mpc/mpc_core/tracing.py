@@ -0,0 +1,335 @@
+# mpc_core/tracing.py
+"""
+分布式追踪（OpenTelemetry SDK）：scanner -> MPC 节点 -> scanner，span 写入本地 JSONL 文件
+
+- 每个被扫描的事件一条 trace（根 span "scan.event"），子 span 覆盖分片收集、
+  每次节点请求、聚合、哈希、DB 写入；节点侧的排队与点乘挂在同一条 trace 下
+- span / 采样 / 上下文都是 opentelemetry 的：ParentBased(TraceIdRatioBased(TRACE_SAMPLE))，
+  跨进程用 W3C traceparent 头（TraceContextTextMapPropagator）
+- 这里只是一层薄封装，保留各入口已经在用的 start_span / span / activate / inject / traced，
+  以及 span.set(**attrs) / span.end(error)
+- 未配置 TRACE_FILE 时全部是空操作（span() 返回同一个空对象），不创建 TracerProvider
+- 导出：BatchSpanProcessor + JsonlSpanExporter，每个进程追加写自己的 TRACE_FILE（一行一个 span）
+- 分析：python3 -m mpc.mpc_core.tracing traces-*.jsonl --slowest 5
+    把多个进程的文件合并，按 trace 还原成树，列出最慢的事件及各段耗时
+
+依赖：pip install opentelemetry-api opentelemetry-sdk
+
+环境变量：
+  TRACE_FILE=traces-scanner.jsonl  # 不设则关闭追踪
+  TRACE_SAMPLE=1.0                 # 根 span 采样率（子 span 跟随父 span）
+  TRACE_SERVICE=<name>             # resource 的 service.name（入口会给默认值）
+
+span 行格式：
+  {"trace_id", "span_id", "parent_id", "name", "service", "start_us", "dur_us", "attrs", "error"}
+"""
+import functools
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+from opentelemetry import context as otel_context, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import Status, StatusCode
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+TRACE_FILE   = os.getenv("TRACE_FILE", "").strip()
+TRACE_SAMPLE = float(os.getenv("TRACE_SAMPLE", "1.0"))
+_service     = os.getenv("TRACE_SERVICE", "").strip()
+
+TRACEPARENT = "traceparent"
+_propagator = TraceContextTextMapPropagator()
+
+def set_service(name: str):
+    """入口模块在产生第一个 span 之前调用；TRACE_SERVICE 显式设置时以环境变量为准"""
+    global _service
+    if not os.getenv("TRACE_SERVICE"):
+        _service = name
+
+def enabled() -> bool:
+    return bool(TRACE_FILE)
+
+# =============================================================================
+# 导出：JSONL 文件
+# =============================================================================
+class JsonlSpanExporter(SpanExporter):
+    """把结束的 span 追加写成一行 JSON（格式见模块说明，分析工具按它读）"""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = None
+
+    @staticmethod
+    def record(s) -> dict:
+        ctx = s.get_span_context()
+        err = None
+        if s.status.status_code is StatusCode.ERROR:
+            err = s.status.description or "error"
+        return {
+            "trace_id": format(ctx.trace_id, "032x"),
+            "span_id": format(ctx.span_id, "016x"),
+            "parent_id": format(s.parent.span_id, "016x") if s.parent is not None else None,
+            "name": s.name,
+            "service": s.resource.attributes.get("service.name", ""),
+            "start_us": s.start_time // 1000,
+            "dur_us": (s.end_time - s.start_time) // 1000,
+            "attrs": dict(s.attributes or {}),
+            "error": err,
+        }
+
+    def export(self, spans: Sequence) -> SpanExportResult:
+        lines = "".join(json.dumps(self.record(s), separators=(",", ":")) + "\n" for s in spans)
+        with self._lock:
+            if self._f is None:
+                self._f = open(self.path, "a", buffering=1 << 16)
+            self._f.write(lines)
+            self._f.flush()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+_provider: Optional[TracerProvider] = None
+_tracer = None
+_init_lock = threading.Lock()
+
+def _get_tracer():
+    """第一次用到时创建 TracerProvider（这时入口已经 set_service 过）；SDK 自己在 atexit 时 shutdown"""
+    global _provider, _tracer
+    if _tracer is None:
+        with _init_lock:
+            if _tracer is None:
+                _provider = TracerProvider(
+                    resource=Resource.create({"service.name": _service or "mpc"}),
+                    sampler=ParentBased(TraceIdRatioBased(TRACE_SAMPLE)),
+                )
+                _provider.add_span_processor(BatchSpanProcessor(JsonlSpanExporter(TRACE_FILE)))
+                _tracer = _provider.get_tracer("mpc")
+    return _tracer
+
+def flush():
+    if _provider is not None:
+        _provider.force_flush()
+
+# =============================================================================
+# Span
+# =============================================================================
+class _NoopSpan:
+    __slots__ = ()
+    trace_id = None
+    span_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def end(self, error: Optional[BaseException] = None):
+        pass
+
+    def traceparent(self) -> Optional[str]:
+        return None
+
+NOOP = _NoopSpan()
+
+class Span:
+    """OTel span 的薄封装：set(**attrs)、end(error) 可重复调用、with 时设为当前 span"""
+    __slots__ = ("otel", "_token", "_ended")
+
+    def __init__(self, otel_span):
+        self.otel = otel_span
+        self._token = None
+        self._ended = False
+
+    @property
+    def trace_id(self) -> str:
+        return format(self.otel.get_span_context().trace_id, "032x")
+
+    @property
+    def span_id(self) -> str:
+        return format(self.otel.get_span_context().span_id, "016x")
+
+    def set(self, **attrs):
+        self.otel.set_attributes({k: v for k, v in attrs.items() if v is not None})
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def end(self, error: Optional[BaseException] = None):
+        if self._ended:
+            return
+        self._ended = True
+        if error is not None:
+            self.otel.set_status(Status(StatusCode.ERROR, f"{type(error).__name__}: {error}"))
+        self.otel.end()
+
+    # with span: 设为当前 span，退出时结束
+    def __enter__(self):
+        self._token = otel_context.attach(trace.set_span_in_context(self.otel))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        otel_context.detach(self._token)
+        self.end(exc)
+        return False
+
+def _start(name: str, ctx, attrs: dict):
+    s = _get_tracer().start_span(name, context=ctx, attributes={k: v for k, v in attrs.items() if v is not None})
+    if not s.is_recording():  # 未采样：后续子 span 全部走空操作
+        s.end()
+        return NOOP
+    return Span(s)
+
+def _recording_current():
+    s = trace.get_current_span()
+    return s if s.is_recording() else None
+
+def start_span(name: str, parent=None, traceparent: Optional[str] = None, root: bool = False, **attrs):
+    """
+    新建 span（不设为当前）：
+      parent 给定 -> 其子 span；traceparent 给定 -> 远端父 span 的子 span；
+      否则挂在当前 span 下；root=True 或没有当前 span 时按 TRACE_SAMPLE 开一条新 trace
+    """
+    if not TRACE_FILE:
+        return NOOP
+    if traceparent is not None:
+        ctx = _propagator.extract({TRACEPARENT: traceparent})
+        sc = trace.get_current_span(ctx).get_span_context()
+        if not sc.is_valid or not sc.trace_flags.sampled:
+            return NOOP
+        return _start(name, ctx, attrs)
+    if parent is NOOP:
+        return NOOP
+    if parent is not None:
+        return _start(name, trace.set_span_in_context(parent.otel), attrs)
+    if not root:
+        cur = _recording_current()
+        if cur is not None:
+            return _start(name, trace.set_span_in_context(cur), attrs)
+    return _start(name, otel_context.Context(), attrs)  # 空上下文：新 trace 的根
+
+def span(name: str, **attrs):
+    """with span("db.mark_scanned"): ...  —— 当前 span 的子 span；没有当前 span（未采样 / 关闭）时为空操作"""
+    if not TRACE_FILE:
+        return NOOP
+    parent = _recording_current()
+    if parent is None:
+        return NOOP
+    return _start(name, trace.set_span_in_context(parent), attrs)
+
+@contextmanager
+def activate(s):
+    """把已有 span 设为当前（不结束它），用于跨线程继续同一条 trace"""
+    if s is NOOP or s is None:
+        yield s
+        return
+    token = otel_context.attach(trace.set_span_in_context(s.otel))
+    try:
+        yield s
+    finally:
+        otel_context.detach(token)
+
+def current():
+    cur = _recording_current()
+    return Span(cur) if cur is not None else None
+
+def inject(headers: Dict[str, str]) -> Dict[str, str]:
+    """把当前 span 写进 HTTP 头（关闭/未采样时不写）"""
+    if TRACE_FILE and _recording_current() is not None:
+        _propagator.inject(headers)
+    return headers
+
+def traced(name: str):
+    """装饰器：函数调用算作当前 span 的一个子 span"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACE_FILE or _recording_current() is None:
+                return fn(*args, **kwargs)
+            with start_span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+# =============================================================================
+# 分析：合并多个进程的 JSONL，按 trace 还原成树
+# =============================================================================
+def load_spans(paths: List[str]) -> Dict[str, List[dict]]:
+    traces: Dict[str, List[dict]] = {}
+    for p in paths:
+        with open(p) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # 进程被杀时可能留下半行
+                traces.setdefault(rec["trace_id"], []).append(rec)
+    return traces
+
+def format_trace(spans: List[dict]) -> str:
+    by_parent: Dict[Optional[str], List[dict]] = {}
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        by_parent.setdefault(parent, []).append(s)
+    lines: List[str] = []
+
+    def walk(parent: Optional[str], depth: int, t0: int):
+        for s in sorted(by_parent.get(parent, []), key=lambda x: x["start_us"]):
+            attrs = " ".join(f"{k}={v}" for k, v in (s.get("attrs") or {}).items())
+            err = f"  ERROR {s['error']}" if s.get("error") else ""
+            lines.append(f"{'  ' * depth}{s['name']:<28} {s['service']:<10} "
+                         f"+{(s['start_us'] - t0) / 1000:8.3f}ms {s['dur_us'] / 1000:9.3f}ms  {attrs}{err}")
+            walk(s["span_id"], depth + 1, t0)
+
+    roots = by_parent.get(None, [])
+    walk(None, 0, min((s["start_us"] for s in roots), default=0))
+    return "\n".join(lines)
+
+def summarize(paths: List[str], slowest: int = 5, trace_id: Optional[str] = None) -> str:
+    traces = load_spans(paths)
+    if trace_id:
+        return format_trace(traces.get(trace_id, []))
+    roots = []
+    for tid, spans in traces.items():
+        ids = {s["span_id"] for s in spans}
+        top = [s for s in spans if s["parent_id"] not in ids]
+        if top:
+            roots.append((max(s["dur_us"] for s in top), tid))
+    roots.sort(reverse=True)
+    out: List[str] = []
+    if roots:
+        durs = sorted(d for d, _ in roots)
+        pct = lambda q: durs[min(len(durs) - 1, int(q * len(durs)))] / 1000
+        out.append(f"traces={len(durs)}  p50={pct(0.5):.3f}ms  p99={pct(0.99):.3f}ms  max={durs[-1] / 1000:.3f}ms")
+    for dur, tid in roots[:slowest]:
+        out.append(f"\n== trace {tid}  {dur / 1000:.3f}ms")
+        out.append(format_trace(traces[tid]))
+    return "\n".join(out)
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="summarize JSONL span files (scanner + nodes)")
+    ap.add_argument("files", nargs="+")
+    ap.add_argument("--slowest", type=int, default=5)
+    ap.add_argument("--trace", default=None, help="only print this trace id")
+    args = ap.parse_args()
+    print(summarize(args.files, slowest=args.slowest, trace_id=args.trace))
+
+if __name__ == "__main__":
+    main()
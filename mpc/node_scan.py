@@ -5,10 +5,19 @@
 - 每个节点持有一个 view_sk 的分片 y_i（标量），以及自己的索引 i
 - 提供接口 POST /scan_share { "R": "0x02/03..(33B)" }
 - 返回 {"i": i, "Yi": "0x02/03..(33B)"}，其中 Yi = y_i * R（点乘）
+- POST /scan_share_batch { "Rs": [...], "encoding": "hex|base64" } -> {"i", "Yis": [...]}，
+  按点数占执行槽（每 NODE_SLOT_POINTS 个点一个槽，最多占满全部槽）
 - 供 scanner（协调端）收集并按拉格朗日系数聚合
+- 两阶段会话：协调端先 POST /session 固定参与集合，节点预先把 λ_i(0) 折进分片，
+  之后带 session 的 /scan_share 直接返回 λ_i·y_i·R，协调端只需一次点加
+- 准入控制：有界工作队列 + 优先级（live 优先于 backfill），饱和时立即 503，
+  /health 报告队列深度，scanner 据此退避而不是等到超时
+- GET /metrics：Prometheus 文本格式（请求数、排队等待、点乘耗时、队列深度）
+- 追踪：请求带 traceparent 头且设置了 TRACE_FILE 时，把排队 / 点乘 span 接到 scanner 的 trace 下
+- PROFILE_ADMIN=true 时挂 /admin/profile/start|stop、/admin/stages（见 mpc_core/profiling.py）
 
 运行依赖：
-  pip install fastapi uvicorn coincurve
+  pip install fastapi uvicorn coincurve prometheus_client opentelemetry-api opentelemetry-sdk
 
 运行示例（三节点三端口）：
   # 节点1
@@ -26,6 +35,15 @@
   export VIEW_SK_SHARE_HEX=0x7a8b9c...
   uvicorn mpc.node_scan:app --host 127.0.0.1 --port 7003
 
+准入控制（可选）：
+  NODE_WORKERS=4               # 同时执行点乘的请求数
+  NODE_QUEUE_MAX=64            # 排队上限（live + backfill 合计）
+  NODE_BACKFILL_QUEUE_MAX=16   # backfill 排队上限，余量留给 live
+  NODE_RETRY_AFTER_S=1         # 拒绝时返回的 Retry-After 秒数
+  NODE_SESSIONS_MAX=64         # 最多保留的参与集合会话（超出淘汰最旧）
+  NODE_BATCH_MAX=256           # /scan_share_batch 单次最多的点数
+  NODE_SLOT_POINTS=16          # 批量请求每多少个点折算一个执行槽（排队上限同样按槽计）
+
 scanner 环境变量：
   export USE_MPC=true
   export MPC_NODES="http://127.0.0.1:7001,http://127.0.0.1:7002,http://127.0.0.1:7003"
@@ -33,13 +51,25 @@ scanner 环境变量：
 """
 
 import os
-from typing import Optional
+import time
+import base64
+import asyncio
+import secrets
+from collections import deque, OrderedDict
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from coincurve import PublicKey
 
+try:
+    from .mpc_core import metrics, profiling, tracing
+except ImportError:  # uvicorn node_scan:app（在 mpc/ 目录下运行）
+    from mpc_core import metrics, profiling, tracing
+
 SECP_N = int("0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141", 16)
 
 # -----------------------------------------------------------------------------
@@ -70,6 +100,137 @@ except Exception as e:
     raise RuntimeError(f"VIEW_SK_SHARE_HEX invalid: {e}")
 
 VIEW_SK_SHARE_INT = int(_strip0x(VIEW_SK_SHARE_HEX), 16)
+tracing.set_service(f"node{NODE_INDEX}")
+
+NODE_WORKERS            = max(1, int(os.getenv("NODE_WORKERS", "4")))
+NODE_QUEUE_MAX          = max(0, int(os.getenv("NODE_QUEUE_MAX", "64")))
+NODE_BACKFILL_QUEUE_MAX = max(0, int(os.getenv("NODE_BACKFILL_QUEUE_MAX", "16")))
+NODE_RETRY_AFTER_S      = os.getenv("NODE_RETRY_AFTER_S", "1")
+NODE_SESSIONS_MAX       = max(1, int(os.getenv("NODE_SESSIONS_MAX", "64")))
+NODE_BATCH_MAX          = max(1, int(os.getenv("NODE_BATCH_MAX", "256")))
+NODE_SLOT_POINTS        = max(1, int(os.getenv("NODE_SLOT_POINTS", "16")))
+
+LANES = ("live", "backfill")
+
+# -----------------------------------------------------------------------------
+# 准入控制：有界队列 + 优先级
+# -----------------------------------------------------------------------------
+class Saturated(Exception):
+    pass
+
+class AdmissionQueue:
+    """
+    在事件循环里做准入（不占用线程池），只在拿到执行槽后才把点乘丢进线程池。
+    - 每个请求按代价占槽（单点 1 个；批量按点数折算，见 slot_cost），执行槽不够时排队；
+      释放槽位时 live 先于 backfill，同一车道按到达顺序
+    - 排队的总代价超过 queue_max，或 backfill 排队代价超过 backfill_max，立即拒绝
+    所有状态只在事件循环线程中修改，无需加锁。
+    """
+    def __init__(self, workers: int, queue_max: int, backfill_max: int):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.backfill_max = backfill_max
+        self.running = 0
+        self.waiters = {lane: deque() for lane in LANES}  # (future, cost)
+        self.admitted = {lane: 0 for lane in LANES}
+        self.rejected = {lane: 0 for lane in LANES}
+
+    def _queued(self, lane: Optional[str] = None) -> int:
+        lanes = LANES if lane is None else (lane,)
+        return sum(cost for l in lanes for _fut, cost in self.waiters[l])
+
+    async def acquire(self, lane: str, cost: int = 1):
+        cost = max(1, min(cost, self.workers))  # 再大的批也最多占满整个节点，否则永远排不上
+        if self.running + cost <= self.workers and not any(self.waiters.values()):
+            self.running += cost
+            self.admitted[lane] += 1
+            return
+        if self._queued() + cost > self.queue_max or \
+           (lane == "backfill" and self._queued("backfill") + cost > self.backfill_max):
+            self.rejected[lane] += 1
+            raise Saturated(lane)
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (fut, cost)
+        self.waiters[lane].append(entry)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # 客户端断开：还在排队就出队；若槽位已转交给我们则归还
+            if fut.done() and not fut.cancelled():
+                self.release(cost)
+            else:
+                try:
+                    self.waiters[lane].remove(entry)
+                except ValueError:
+                    pass
+                self._dispatch()  # 排在队首的大请求走了，后面的小请求可能放得下
+            raise
+        self.admitted[lane] += 1
+
+    def release(self, cost: int = 1):
+        self.running -= max(1, min(cost, self.workers))
+        self._dispatch()
+
+    def _dispatch(self):
+        """按优先级把空出来的槽转交给排队者；队首放不下就停（不让小请求一直插队饿死大批）"""
+        for lane in LANES:
+            q = self.waiters[lane]
+            while q:
+                fut, cost = q[0]
+                if fut.done():  # 已取消
+                    q.popleft()
+                    continue
+                if self.running + cost > self.workers:
+                    return
+                q.popleft()
+                self.running += cost
+                fut.set_result(None)
+
+    def snapshot(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": {lane: self._queued(lane) for lane in LANES},
+            "queue_max": self.queue_max,
+            "backfill_queue_max": self.backfill_max,
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+        }
+
+def slot_cost(points: int) -> int:
+    """批量请求的准入代价：每 NODE_SLOT_POINTS 个点一个执行槽"""
+    return -(-points // NODE_SLOT_POINTS)
+
+admission = AdmissionQueue(NODE_WORKERS, NODE_QUEUE_MAX, NODE_BACKFILL_QUEUE_MAX)
+
+# -----------------------------------------------------------------------------
+# 指标
+# -----------------------------------------------------------------------------
+M_REQUESTS = metrics.counter("mpc_node_share_requests_total", "Share requests by lane and outcome", ("lane", "outcome"))
+M_WAIT     = metrics.histogram("mpc_node_queue_wait_seconds", "Time spent waiting for an execution slot", ("lane",))
+M_COMPUTE  = metrics.histogram("mpc_node_compute_seconds", "Point multiplication time", ("weighted",))
+# 两者都按槽位代价计（见 slot_cost），与 NODE_WORKERS / NODE_QUEUE_MAX 同单位
+M_RUNNING  = metrics.gauge("mpc_node_running", "Execution slot cost currently in use")
+M_QUEUED   = metrics.gauge("mpc_node_queued", "Queued slot cost (not request count) waiting for a slot", ("lane",))
+M_RUNNING.set_function(lambda: admission.running)
+for _lane in LANES:
+    M_QUEUED.labels(lane=_lane).set_function(lambda lane=_lane: admission._queued(lane))
+
+# -----------------------------------------------------------------------------
+# 参与集合会话：session id -> λ_i(0)·y_i（32B 标量）
+# -----------------------------------------------------------------------------
+def _lagrange_coeff_at_zero(i: int, indices: List[int]) -> int:
+    """本节点在参与集合 indices 下的 λ_i(0) mod n"""
+    num, den = 1, 1
+    for j in indices:
+        if j == i:
+            continue
+        num = (num * (-j % SECP_N)) % SECP_N
+        den = (den * ((i - j) % SECP_N)) % SECP_N
+    return (num * pow(den, SECP_N - 2, SECP_N)) % SECP_N
+
+_sessions: "OrderedDict[str, bytes]" = OrderedDict()
 
 # -----------------------------------------------------------------------------
 # FastAPI
@@ -84,43 +245,180 @@ app.add_middleware(
 
 class ScanShareReq(BaseModel):
     R: str  # 0x02/03.. (33B 压缩公钥)
+    lane: str = "live"  # live | backfill（准入优先级）
+    session: Optional[str] = None  # 带上则返回 λ_i·y_i·R
 
 class ScanShareResp(BaseModel):
     i: int
     Yi: str # 0x02/03.. (33B)
+    weighted: bool = False  # True 表示 Yi 已乘 λ_i(0)
+
+class ScanShareBatchReq(BaseModel):
+    Rs: List[str]  # 每个 33B 压缩点
+    lane: str = "live"
+    session: Optional[str] = None
+    encoding: str = "hex"  # hex（0x..）| base64，Rs 与 Yis 使用同一编码
+
+class ScanShareBatchResp(BaseModel):
+    i: int
+    Yis: List[str]  # 与 Rs 同序
+    weighted: bool = False
+
+class SessionReq(BaseModel):
+    participants: List[int]  # 本会话固定的参与方索引
+
+class SessionResp(BaseModel):
+    session: str
+    i: int
+    participants: List[int]
 
 @app.get("/health")
 def health():
-    return {"ok": True, "index": NODE_INDEX}
+    return {"ok": True, "index": NODE_INDEX, "queue": admission.snapshot()}
+
+profiling.add_admin_routes(app, f"node{NODE_INDEX}")
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/whoami")
 def whoami():
     # 仅用于调试，不泄露分片！
     return {"index": NODE_INDEX}
 
+@app.post("/session", response_model=SessionResp)
+def open_session(req: SessionReq):
+    """阶段一：固定参与集合，预计算 λ_i(0)·y_i，后续每个事件仍只做一次点乘"""
+    participants = sorted(set(req.participants))
+    if NODE_INDEX not in participants:
+        raise HTTPException(status_code=400, detail=f"node {NODE_INDEX} not in participants")
+    if len(participants) < 2 or any(j <= 0 for j in participants):
+        raise HTTPException(status_code=400, detail="participants must be >= 2 positive indices")
+
+    lam = _lagrange_coeff_at_zero(NODE_INDEX, participants)
+    weighted = (lam * VIEW_SK_SHARE_INT) % SECP_N
+    sid = secrets.token_hex(8)
+    _sessions[sid] = weighted.to_bytes(32, "big")
+    while len(_sessions) > NODE_SESSIONS_MAX:
+        _sessions.popitem(last=False)
+    return SessionResp(session=sid, i=NODE_INDEX, participants=participants)
+
+def _compute_share(Rb: bytes, k_bytes: bytes, weighted: bool, parent=tracing.NOOP) -> ScanShareResp:
+    # 计算 Yi = y_i * R（或 λ_i·y_i * R）点乘，输出压缩形式 33B
+    try:
+        with profiling.stage("point_mul"), tracing.start_span("node.point_mul", parent=parent), \
+                M_COMPUTE.labels(weighted=str(weighted).lower()).time():
+            R = PublicKey(Rb)
+            # coincurve PublicKey.multiply 接受 32-byte big-endian 标量
+            Yi = R.multiply(k_bytes)                     # PublicKey
+            Yi_comp = Yi.format(compressed=True)         # bytes(33)
+        return ScanShareResp(i=NODE_INDEX, Yi=_b2h(Yi_comp), weighted=weighted)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"point multiply failed: {e}")
+
 @app.post("/scan_share", response_model=ScanShareResp)
-def scan_share(req: ScanShareReq):
-    # 校验 R
+async def scan_share(req: ScanShareReq, request: Request):
+    sp = tracing.start_span("node.scan_share", traceparent=request.headers.get(tracing.TRACEPARENT, ""),
+                            lane=req.lane, weighted=req.session is not None)
+    try:
+        resp = await _scan_share(req, sp)
+    except HTTPException as e:
+        sp.set(status=e.status_code)
+        sp.end()
+        raise
+    except Exception as e:
+        sp.end(e)
+        raise
+    sp.end()
+    return resp
+
+def _parse_R(h: str, encoding: str = "hex") -> bytes:
     try:
-        Rb = _h2b(req.R.strip())
+        Rb = base64.b64decode(h, validate=True) if encoding == "base64" else _h2b(h.strip())
     except Exception:
-        raise HTTPException(status_code=400, detail="invalid hex for R")
+        raise HTTPException(status_code=400, detail=f"invalid {encoding} for R")
     if len(Rb) != 33 or Rb[0] not in (2, 3):
         raise HTTPException(status_code=400, detail="R must be a 33-byte compressed pubkey (0x02/0x03...)")
+    return Rb
+
+def _share_scalar(lane: str, session: Optional[str]) -> bytes:
+    if lane not in LANES:
+        raise HTTPException(status_code=400, detail=f"lane must be one of {LANES}")
+    if session is not None:
+        k_bytes = _sessions.get(session)
+        if k_bytes is None:
+            # 会话被淘汰或节点重启：协调端应重新建立
+            raise HTTPException(status_code=404, detail="unknown session")
+        return k_bytes
+    return VIEW_SK_SHARE_INT.to_bytes(32, "big")
+
+async def _run_admitted(lane: str, sp, fn, *args, cost: int = 1):
+    """准入（按 cost 占槽）后在线程池里执行 fn；饱和时快速拒绝，让 scanner 退避"""
+    t0 = time.perf_counter()
+    wait_sp = tracing.start_span("node.queue_wait", parent=sp, cost=cost)
+    try:
+        await admission.acquire(lane, cost)
+    except Saturated:
+        wait_sp.set(rejected=True)
+        wait_sp.end()
+        M_REQUESTS.labels(lane=lane, outcome="rejected").inc()
+        raise HTTPException(
+            status_code=503, detail=f"node saturated ({lane})",
+            headers={"Retry-After": NODE_RETRY_AFTER_S},
+        )
+    wait_sp.end()
+    M_WAIT.labels(lane=lane).observe(time.perf_counter() - t0)
+    outcome = "error"
+    try:
+        resp = await run_in_threadpool(fn, *args)
+        outcome = "ok"
+        return resp
+    finally:
+        admission.release(cost)
+        M_REQUESTS.labels(lane=lane, outcome=outcome).inc()
+
+async def _scan_share(req: ScanShareReq, sp) -> ScanShareResp:
+    Rb = _parse_R(req.R)
+    k_bytes = _share_scalar(req.lane, req.session)
+    return await _run_admitted(req.lane, sp, _compute_share, Rb, k_bytes, req.session is not None, sp)
 
-    # 计算 Yi = y_i * R（点乘），输出压缩形式 33B
+def _compute_batch(Rs: List[bytes], k_bytes: bytes, weighted: bool, encoding: str, parent=tracing.NOOP) -> ScanShareBatchResp:
     try:
-        R = PublicKey(Rb)
-        # coincurve PublicKey.multiply 接受 32-byte big-endian 标量
-        k_bytes = VIEW_SK_SHARE_INT.to_bytes(32, "big")
-        Yi = R.multiply(k_bytes)                     # PublicKey
-        Yi_comp = Yi.format(compressed=True)         # bytes(33)
-        return ScanShareResp(i=NODE_INDEX, Yi=_b2h(Yi_comp))
+        with profiling.stage("point_mul"), tracing.start_span("node.point_mul", parent=parent, n=len(Rs)), \
+                M_COMPUTE.labels(weighted=str(weighted).lower()).time():
+            Yis = [PublicKey(Rb).multiply(k_bytes).format(compressed=True) for Rb in Rs]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"point multiply failed: {e}")
+    enc = (lambda b: base64.b64encode(b).decode()) if encoding == "base64" else _b2h
+    return ScanShareBatchResp(i=NODE_INDEX, Yis=[enc(Y) for Y in Yis], weighted=weighted)
+
+@app.post("/scan_share_batch", response_model=ScanShareBatchResp)
+async def scan_share_batch(req: ScanShareBatchReq, request: Request):
+    """一次请求多个 R：省掉逐个请求的 HTTP / JSON 开销；准入按点数计价，大批不会只占一个槽挤掉 live"""
+    if req.encoding not in ("hex", "base64"):
+        raise HTTPException(status_code=400, detail="encoding must be hex or base64")
+    if not req.Rs or len(req.Rs) > NODE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Rs must hold 1..{NODE_BATCH_MAX} points")
+    sp = tracing.start_span("node.scan_share_batch", traceparent=request.headers.get(tracing.TRACEPARENT, ""),
+                            lane=req.lane, n=len(req.Rs))
+    try:
+        Rs = [_parse_R(h, req.encoding) for h in req.Rs]
+        k_bytes = _share_scalar(req.lane, req.session)
+        resp = await _run_admitted(req.lane, sp, _compute_batch, Rs, k_bytes, req.session is not None, req.encoding, sp,
+                                   cost=slot_cost(len(Rs)))
+    except HTTPException as e:
+        sp.set(status=e.status_code)
+        sp.end()
+        raise
+    except Exception as e:
+        sp.end(e)
+        raise
+    sp.end()
+    return resp
 
 @app.post("/ecdh_share")
-def compute_ecdh_share(req: ScanShareReq):
+async def compute_ecdh_share(req: ScanShareReq, request: Request):
     """计算ECDH分片用于解密 - 复用scan_share的计算逻辑"""
     # 实际上和 scan_share 计算的是同一个东西：yi * R
-    return scan_share(req)  # 直接复用现有逻辑！
\ No newline at end of file
+    return await scan_share(req, request)  # 直接复用现有逻辑！
@@ -7,32 +7,39 @@ from eth_account import Account
 from mpc_core.shamir import shamir_split
 from mpc_core.scan import derive_tag, match_tag
 from mpc_core.crypto import ecies_decrypt_secp256k1
+from mpc_core.ecdh_client import default_client
 
 # ---------- Web3 connection & contract ----------
+# Built on first use by _chain(): importing this module must not dial RPC or read the ABI.
 RPC_URL = os.getenv("RPC_URL", "http://127.0.0.1:8545")
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
-
-PAYMENT_PROXY_ADDRESS = Web3.to_checksum_address(
-    os.getenv("PAYMENT_PROXY_ADDRESS", "0xYourDeployedContract")
-)
+PAYMENT_PROXY_ADDRESS = os.getenv("PAYMENT_PROXY_ADDRESS", "0xYourDeployedContract")
 ABI_PATH = os.getenv(
     "PAYMENT_PROXY_ABI",
     "artifacts/contracts/src/PaymentProxy.sol/PaymentProxy.json"
 )
-with open(ABI_PATH) as f:
-    contract_json = json.load(f)
-    abi = contract_json["abi"]
-
-payment_contract = w3.eth.contract(address=PAYMENT_PROXY_ADDRESS, abi=abi)
-
-SENDER_ADDR = Web3.to_checksum_address(os.getenv("ETH_SENDER", "0xYourAccount"))
 SENDER_PK   = os.getenv("ETH_PRIVATE_KEY", "0xYourPrivateKey")
 
+w3 = None
+payment_contract = None
+SENDER_ADDR = None
+
+def _chain():
+    """Return (w3, payment_contract, SENDER_ADDR), connecting and loading the ABI once."""
+    global w3, payment_contract, SENDER_ADDR
+    if w3 is None:
+        chain_w3 = Web3(Web3.HTTPProvider(RPC_URL))
+        with open(ABI_PATH) as f:
+            abi = json.load(f)["abi"]
+        payment_contract = chain_w3.eth.contract(
+            address=Web3.to_checksum_address(PAYMENT_PROXY_ADDRESS), abi=abi
+        )
+        SENDER_ADDR = Web3.to_checksum_address(os.getenv("ETH_SENDER", "0xYourAccount"))
+        w3 = chain_w3
+    return w3, payment_contract, SENDER_ADDR
+
 # ---------- MPC decryption config ----------
 USE_MPC_DECRYPT = os.getenv("USE_MPC_DECRYPT", "true").lower() in ("1", "true", "yes")
-MPC_NODES = [x.strip() for x in os.getenv("MPC_NODES", "http://127.0.0.1:7001,http://127.0.0.1:7002,http://127.0.0.1:7003").split(",") if x.strip()]
-MPC_THRESHOLD = int(os.getenv("MPC_THRESHOLD", "2"))
-HTTP_TIMEOUT_S = float(os.getenv("HTTP_TIMEOUT_S", "1.5"))
+# MPC_NODES / MPC_THRESHOLD / HTTP_TIMEOUT_S / MPC_AUTH are read by mpc_core.ecdh_client.default_client()
 STRICT_MPC = os.getenv("STRICT_MPC", "false").lower() in ("1", "true", "yes")
 
 # Backup view private key for simulated decryption
@@ -45,6 +52,7 @@ def _bytes32_align(b: bytes) -> bytes:
     return b.ljust(32, b"\x00")[:32]
 
 def send_tx(tx):
+    w3, _, SENDER_ADDR = _chain()
     tx["nonce"] = w3.eth.get_transaction_count(SENDER_ADDR)
     tx.setdefault("gas", 2_000_000)
     tx.setdefault("gasPrice", w3.to_wei("10", "gwei"))
@@ -53,6 +61,7 @@ def send_tx(tx):
     return w3.eth.wait_for_transaction_receipt(tx_hash)
 
 def announce_onchain(tag_bytes32: bytes, R: bytes, memo: bytes):
+    _, payment_contract, SENDER_ADDR = _chain()
     tx = payment_contract.functions.announcePayment(tag_bytes32, R, memo).build_transaction({
         "from": SENDER_ADDR
     })
@@ -60,123 +69,9 @@ def announce_onchain(tag_bytes32: bytes, R: bytes, memo: bytes):
 
 # -------------------- MPC decryption implementation --------------------
 def mpc_ecies_decrypt(eph_pub_hex: str, iv_hex: str, ct_hex: str) -> bytes:
-    """ECIES decryption using MPC nodes"""
-    import requests
-    import hashlib
-    from coincurve import PublicKey
-    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
-    from cryptography.hazmat.primitives import hashes
-    
-    # Step 1: collect ECDH shares
-    # Reuse /scan_share endpoint since it computes Yi = share_i * R
-    def _as_bytes(x) -> bytes:
-        if isinstance(x, str):
-            s = x.strip()
-            if s.lower().startswith("0x"):
-                s = s[2:]
-            return bytes.fromhex(s)
-        return bytes(x)
-    
-    def _b2h(b: bytes) -> str:
-        return "0x" + b.hex()
-    
-    R_bytes = _as_bytes(eph_pub_hex)
-    shares = []
-    seen = set()
-    
-    payload = {"R": _b2h(R_bytes)}
-    
-    for url in MPC_NODES:
-        try:
-            resp = requests.post(f"{url.rstrip('/')}/scan_share", json=payload, timeout=HTTP_TIMEOUT_S)
-            resp.raise_for_status()
-            data = resp.json()
-            
-            i = int(data["i"])
-            if i in seen:
-                continue
-            Yi = _as_bytes(data["Yi"])
-            
-            if len(Yi) != 33 or Yi[0] not in (2, 3):
-                print(f"⚠️ bad Yi from {url}: len={len(Yi)}")
-                continue
-                
-            PublicKey(Yi)  # sanity check: point must be on curve
-            shares.append((i, Yi))
-            seen.add(i)
-            
-            if len(shares) >= MPC_THRESHOLD:
-                break
-                
-        except Exception as e:
-            print(f"⚠️ ECDH share from {url} failed: {e}")
-            continue
-    
-    if len(shares) < MPC_THRESHOLD:
-        raise RuntimeError(f"Not enough ECDH shares: {len(shares)}/{MPC_THRESHOLD}")
-    
-    # Step 2: aggregate via Lagrange interpolation at x=0
-    SECP_N = int("0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141", 16)
-    
-    def _lagrange_coeffs_at_zero(indices):
-        lambdas = []
-        for i in indices:
-            num = 1
-            den = 1
-            for j in indices:
-                if j == i:
-                    continue
-                num = (num * (-j % SECP_N)) % SECP_N
-                den = (den * ((i - j) % SECP_N)) % SECP_N
-            den_inv = pow(den, SECP_N - 2, SECP_N)
-            lambdas.append((num * den_inv) % SECP_N)
-        return lambdas
-    
-    def _point_mul(pub, k):
-        # coincurve expects 32-byte big-endian scalar
-        k_bytes = (k % SECP_N).to_bytes(32, "big")
-        return pub.multiply(k_bytes)
-    
-    def _point_add(p, q):
-        if p is None:
-            return q
-        return PublicKey.combine_keys([p, q])
-    
-    indices = [i for (i, _) in shares]
-    lambdas = _lagrange_coeffs_at_zero(indices)
-    
-    # Aggregate S = Σ λᵢ * Yᵢ = v * R
-    S = None
-    for lam, (_, Yi_bytes) in zip(lambdas, shares):
-        Yi = PublicKey(Yi_bytes)
-        weighted = _point_mul(Yi, lam)
-        S = _point_add(S, weighted)
-    
-    if S is None:
-        raise RuntimeError("Failed to aggregate ECDH result")
-    
-    # Step 3: extract shared key = X coordinate (32 bytes)
-    shared_secret = S.format(compressed=False)[1:33]
-    
-    # Step 4: derive AES key via HKDF-SHA256
-    hkdf = HKDF(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=None,
-        info=b"ecies-secp256k1-key"
-    )
-    aes_key = hkdf.derive(shared_secret)
-    
-    # Step 5: AES-CTR decrypt
-    iv_bytes = _as_bytes(iv_hex)
-    ct_bytes = _as_bytes(ct_hex)
-    
-    cipher = Cipher(algorithms.AES(aes_key), modes.CTR(iv_bytes))
-    decryptor = cipher.decryptor()
-    plaintext = decryptor.update(ct_bytes) + decryptor.finalize()
-    
-    return plaintext
+    """ECIES decryption using MPC nodes (shared threshold-ECDH client: pooled
+    connections, auth, coalescing of identical in-flight R values)"""
+    return default_client().ecies_decrypt(eph_pub_hex, iv_hex, ct_hex)
 
 # -------------------- Main entry --------------------
 def process_payment_request(req_json: str):
@@ -186,7 +81,7 @@ def process_payment_request(req_json: str):
     pubkey_view  = data["pubkeyView"]
     nonce        = data["nonce"]
     checksum     = data["checksum"]
-    to_addr      = Web3.to_checksum_address(data.get("to", SENDER_ADDR))
+    to_addr      = Web3.to_checksum_address(data.get("to") or _chain()[2])
 
     # 1) checksum sanity check
     if not str(checksum).startswith("0x"):
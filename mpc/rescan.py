@@ -0,0 +1,356 @@
+# mpc/rescan.py
+# -*- coding: utf-8 -*-
+"""
+新用户历史重扫：只为新加入的 key 扫一段历史事件，不动 events.scanned
+
+以前新增用户要把整张 events 表的 scanned 清零，其他用户的事件也跟着重扫一遍，
+而且按 live 循环的节奏慢慢爬。这里改为：
+- 按 id 分页流式读取 events 与冷库归档（块号范围会先换算成 id 范围），每页所有 key 共用一次读取
+- watcher 写了段文件时优先 mmap 读段（不经过 SQLite、不抢锁），段尾之后的部分回到库里读；
+  段里只有 R / tag，命中后再按 id 回库取 memo / commitment
+- 命中已归档的事件时先把它搬回热表，inbox 才能 JOIN 到
+- 本地引擎（--key user=view_sk）或离线阈值引擎（--tofn user=shares.json）整页批量计算，
+  进程池在整个任务期间只建一次，默认占满所有 CPU
+- 命中写 inbox（可顺手解 memo），进度（游标/命中数）与命中在同一个事务里提交到 rescan_progress
+- 中断后用同样的参数重跑即从游标处继续；已完成的任务直接跳过（--restart 强制重来）
+
+用法：
+  python3 mpc/rescan.py --key bob=0x<view_sk> --from-block 0
+  python3 -m mpc.rescan --tofn carol=carol_shares.json --from-id 1 --to-id 500000 --workers 8
+  python3 mpc/rescan.py status
+
+--tofn 文件内容同 threshold_scan：[["1","0x.."],["3","0x.."]]
+
+环境变量（可选）：
+  DB_PATH=mpc_index.db
+  SCAN_CODEC=x32|comp33|auto # 与 scanner 相同的 tag 口径（阈值引擎不支持 auto）
+  DECRYPT_ON_MATCH=true      # 命中时解 memo 并落库
+  RESCAN_PAGE=20000          # 每页事件数
+  RESCAN_SOURCE=auto|db      # auto：有段文件就读段（SEGMENT_DIR，见 mpc_core/segments.py）
+"""
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+from typing import List, Optional, Tuple
+
+try:
+    from .mpc_core import segments, storage
+    from .mpc_core.crypto import decrypt_memo_with_shared
+    from .mpc_core.local_scan import LocalScanEngine
+    from .mpc_core.threshold_scan import (derive_shared_tofn, derive_tags_tofn_batch,
+                                          make_tofn_pool, parse_shares_json)
+except ImportError:  # 以脚本方式运行：python3 mpc/rescan.py
+    from mpc_core import segments, storage
+    from mpc_core.crypto import decrypt_memo_with_shared
+    from mpc_core.local_scan import LocalScanEngine
+    from mpc_core.threshold_scan import (derive_shared_tofn, derive_tags_tofn_batch,
+                                         make_tofn_pool, parse_shares_json)
+
+# =============================================================================
+# 环境配置
+# =============================================================================
+DB_PATH            = os.getenv("DB_PATH", "mpc_index.db")
+SCAN_CODEC         = os.getenv("SCAN_CODEC", "x32").lower()
+DECRYPT_ON_MATCH   = os.getenv("DECRYPT_ON_MATCH", "true").lower() in ("1", "true", "yes")
+RESCAN_PAGE        = max(1, int(os.getenv("RESCAN_PAGE", "20000")))
+RESCAN_SOURCE      = os.getenv("RESCAN_SOURCE", "auto").lower()
+
+def _as_bytes(x) -> bytes:
+    if x is None:
+        return b""
+    if isinstance(x, str):
+        s = x[2:] if x.lower().startswith("0x") else x
+        return bytes.fromhex(s)
+    return bytes(x)
+
+# =============================================================================
+# SQLite
+# =============================================================================
+def _open_db():
+    """新开一条调优连接（见 mpc_core/storage.py），调用方负责 close()"""
+    return storage.connect(DB_PATH)
+
+def ensure_tables():
+    """inbox / rescan_progress 由 storage 的迁移链创建"""
+    con = _open_db()
+    try:
+        storage.migrate(con)
+    finally:
+        con.close()
+
+def resolve_range(from_id: Optional[int], to_id: Optional[int],
+                  from_block: Optional[int], to_block: Optional[int]) -> Tuple[int, int]:
+    """把块号/ID 范围统一成闭区间 [lo, hi] 的事件 id（watcher 按块顺序写入，id 随块号递增）"""
+    con = _open_db()
+    try:
+        lo = from_id if from_id is not None else 1
+        if from_block is not None:
+            row = con.execute("SELECT MIN(id) FROM all_events WHERE block >= ?", (from_block,)).fetchone()
+            lo = max(lo, row[0] if row[0] is not None else 2**62)
+        hi_row = con.execute("SELECT MAX(id) FROM all_events").fetchone()
+        hi = hi_row[0] or 0
+        if to_id is not None:
+            hi = min(hi, to_id)
+        if to_block is not None:
+            row = con.execute("SELECT MAX(id) FROM all_events WHERE block <= ?", (to_block,)).fetchone()
+            hi = min(hi, row[0] or 0)
+    finally:
+        con.close()
+    return lo, hi
+
+# secp256k1 生成元 G（压缩）
+_G = bytes.fromhex("0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798")
+
+# =============================================================================
+# 任务：一个用户 + 一把 key + 一个引擎
+# =============================================================================
+class RescanJob:
+    def __init__(self, user_id: str, engine: str, secret: str, codec: str, workers: int):
+        self.user_id = user_id
+        self.engine = engine  # "local" | "tofn"
+        self.codec = codec
+        self.workers = workers
+        if engine == "local":
+            self._local = LocalScanEngine(secret, codec=codec)
+            view_pub = self._local.shared_point(_G)
+        else:
+            if codec not in ("x32", "comp33"):
+                raise ValueError("threshold engine supports codec x32 / comp33 only")
+            self._shares = parse_shares_json(secret)
+            view_pub = derive_shared_tofn(_G, self._shares)
+        # 指纹取自 v·G：同一把 key 不论本地还是分片形式都对应同一条进度
+        self.key_fp = hashlib.sha256(view_pub.format()).hexdigest()[:16]
+        self._pool = None
+        self.cursor = 0
+        self.to_id = 0
+        self.scanned = 0
+        self.matched = 0
+
+    # ---- 进程池：整个任务只建一次 ----
+    def open(self):
+        if self.workers > 1:
+            self._pool = self._local.make_pool(self.workers) if self.engine == "local" \
+                else make_tofn_pool(self._shares, self.codec, self.workers)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def tags(self, Rs: List[bytes]) -> List[Tuple[Optional[bytes], Optional[bytes]]]:
+        """整页 R -> [(主口径tag, 备选tag)]，非法 R 为 (None, None)"""
+        if self.engine == "local":
+            res = self._local.tags_batch(Rs, workers=self.workers, chunk=512, executor=self._pool)
+            return [(r[0], r[1]) if r is not None else (None, None) for r in res]
+        res = derive_tags_tofn_batch(Rs, self._shares, codec=self.codec, workers=self.workers,
+                                     chunk=1024, executor=self._pool)
+        return [(t, None) for t in res]
+
+    def memo_plain(self, eid: int, R_raw: bytes, memo_b: bytes) -> Optional[bytes]:
+        if not DECRYPT_ON_MATCH or not memo_b:
+            return None
+        try:
+            S = self._local.shared_point(R_raw) if self.engine == "local" \
+                else derive_shared_tofn(R_raw, self._shares)
+            return decrypt_memo_with_shared(S.format(compressed=False)[1:33], memo_b, R_raw)
+        except Exception as e:
+            print(f"[rescan] ⚠️ memo decrypt failed for eid={eid}: {e}")
+            return None
+
+    # ---- 进度 ----
+    def load_or_start(self, lo: int, hi: int, restart: bool) -> bool:
+        """返回 False 表示该任务已完成、无需再跑"""
+        con = _open_db()
+        row = con.execute("SELECT from_id, to_id, cursor, scanned, matched, done FROM rescan_progress "
+                          "WHERE user_id=? AND key_fp=?", (self.user_id, self.key_fp)).fetchone()
+        try:
+            if row and not restart:
+                from_id, to_id, cursor, scanned, matched, done = row
+                if done and (lo, hi) == (from_id, to_id):
+                    print(f"[rescan] ✔️ {self.user_id} ({self.key_fp}) already done for ids [{lo}, {hi}]")
+                    return False
+                if not done:
+                    if (lo, hi) != (from_id, to_id):
+                        print(f"[rescan] ℹ️ {self.user_id}: resuming unfinished job [{from_id}, {to_id}] "
+                              f"(requested [{lo}, {hi}] ignored; use --restart to replace)")
+                    self.cursor, self.to_id, self.scanned, self.matched = cursor, to_id, scanned, matched
+                    print(f"[rescan] ▶️ {self.user_id} resume at id>{cursor} (to {to_id}, matched so far {matched})")
+                    return True
+            now = int(time.time())
+            self.cursor, self.to_id, self.scanned, self.matched = lo - 1, hi, 0, 0
+            con.execute("""INSERT OR REPLACE INTO rescan_progress
+                           (user_id, key_fp, engine, from_id, to_id, cursor, scanned, matched, done, started_at, updated_at)
+                           VALUES(?,?,?,?,?,?,0,0,0,?,?)""",
+                        (self.user_id, self.key_fp, f"{self.engine}:{self.codec}", lo, hi, self.cursor, now, now))
+            con.commit()
+            print(f"[rescan] ▶️ {self.user_id} ({self.key_fp}) start ids [{lo}, {hi}] engine={self.engine}:{self.codec}")
+            return True
+        finally:
+            con.close()
+
+    @property
+    def finished(self) -> bool:
+        return self.cursor >= self.to_id
+
+    def process_page(self, con, rows: List[Tuple]) -> int:
+        """rows: (id, tag, R, memo, commitment)，只处理本任务游标之后、范围之内的行；在 con 上写入但不提交"""
+        todo = [r for r in rows if self.cursor < r[0] <= self.to_id]
+        if not todo:
+            return 0
+        tags = self.tags([_as_bytes(r[2]) for r in todo])
+        hits = 0
+        for (eid, tag_b, R_b, memo_b, commitment_b), (t1, t2) in zip(todo, tags):
+            tag_db = _as_bytes(tag_b)
+            if (t1 is None or t1 != tag_db) and (t2 is None or t2 != tag_db):
+                continue
+            if memo_b is None:  # 段文件里的行不带 memo / commitment
+                memo_b, commitment_b = con.execute("SELECT memo, commitment FROM all_events WHERE id=?",
+                                                   (eid,)).fetchone()
+            R_raw, memo_raw = _as_bytes(R_b), _as_bytes(memo_b)
+            storage.insert_inbox(con, self.user_id, eid, tag_db, R_raw, memo_raw, _as_bytes(commitment_b),
+                                 self.memo_plain(eid, R_raw, memo_raw))
+            storage.mark_matched(con, eid)  # 已归档到冷库的事件会先搬回热表
+            hits += 1
+            print(f"[rescan] ✅ MATCH event #{eid} -> inbox[{self.user_id}]")
+        self.cursor = todo[-1][0]
+        self.scanned += len(todo)
+        self.matched += hits
+        con.execute("""UPDATE rescan_progress SET cursor=?, scanned=?, matched=?, done=?, updated_at=?
+                       WHERE user_id=? AND key_fp=?""",
+                    (self.cursor, self.scanned, self.matched, int(self.finished), int(time.time()),
+                     self.user_id, self.key_fp))
+        return hits
+
+    def mark_done(self, con):
+        self.cursor = max(self.cursor, self.to_id)
+        con.execute("UPDATE rescan_progress SET cursor=?, done=1, updated_at=? WHERE user_id=? AND key_fp=?",
+                    (self.cursor, int(time.time()), self.user_id, self.key_fp))
+
+# =============================================================================
+# 主流程：所有任务共用一条事件流
+# =============================================================================
+def _open_segments() -> Optional["segments.SegmentReader"]:
+    if RESCAN_SOURCE == "db":
+        return None
+    reader = segments.SegmentReader(segments.segment_dir(DB_PATH))
+    if not reader.count:
+        return None
+    print(f"[rescan] 🧱 reading segments up to id={reader.last_id} from {reader.directory}")
+    return reader
+
+def _read_page(con, reader, cursor: int, hi: int, page: int) -> List[Tuple]:
+    """段覆盖到的部分读段（id 到 last_id 为止是完整的），其余读热表 + 冷库"""
+    if reader is not None:
+        if cursor >= reader.last_id:
+            reader.refresh()
+        if cursor < reader.last_id:
+            return reader.rows(cursor, hi, page)
+    return storage.events_page(con, cursor, hi, page)
+
+def run(jobs: List[RescanJob], page: int = RESCAN_PAGE):
+    con = _open_db()
+    for j in jobs:
+        if j.finished:  # 空范围
+            j.mark_done(con)
+    con.commit()
+    active = [j for j in jobs if not j.finished]
+    for j in active:
+        j.open()
+    reader = _open_segments() if active else None
+    t0 = time.time()
+    total = 0
+    try:
+        while active:
+            cursor = min(j.cursor for j in active)
+            hi = max(j.to_id for j in active)
+            rows = _read_page(con, reader, cursor, hi, page)
+            con.execute("BEGIN")
+            for j in active:
+                if not rows:
+                    j.mark_done(con)
+                else:
+                    j.process_page(con, rows)
+            con.commit()  # 命中与进度同一事务：中断后不丢、不重
+            total += len(rows)
+            if rows:
+                dt = max(time.time() - t0, 1e-9)
+                print(f"[rescan] 📈 up to id={rows[-1][0]} / {hi}  {total} events  {total / dt:.0f} ev/s  " +
+                      "  ".join(f"{j.user_id}:{j.matched}" for j in active))
+            for j in [j for j in active if j.finished]:
+                print(f"[rescan] 🏁 {j.user_id} done: scanned={j.scanned} matched={j.matched}")
+                j.close()
+            active = [j for j in active if not j.finished]
+    finally:
+        con.close()
+        for j in active:
+            j.close()
+
+def print_status():
+    con = _open_db()
+    try:
+        rows = con.execute("""SELECT user_id, key_fp, engine, from_id, to_id, cursor, scanned, matched, done, updated_at
+                              FROM rescan_progress ORDER BY started_at""").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        con.close()
+    for (uid, fp, engine, lo, hi, cur, scanned, matched, done, upd) in rows:
+        span = max(hi - lo + 1, 1)
+        pct = 100.0 if done else max(0.0, min(100.0, (cur - lo + 1) * 100.0 / span))
+        print(f"{uid:<12} {fp}  {engine:<12} ids [{lo}, {hi}]  cursor={cur}  {pct:5.1f}%  "
+              f"scanned={scanned} matched={matched}  {'done' if done else 'running/paused'}  updated={upd}")
+    if not rows:
+        print("(no rescan jobs)")
+
+def _parse_assignment(s: str) -> Tuple[str, str]:
+    if "=" not in s:
+        raise argparse.ArgumentTypeError(f"expected user=value, got {s!r}")
+    user, val = s.split("=", 1)
+    return user.strip(), val.strip()
+
+def main():
+    ap = argparse.ArgumentParser(description="historical rescan for newly onboarded keys")
+    ap.add_argument("command", nargs="?", default="run", choices=("run", "status"))
+    ap.add_argument("--key", action="append", default=[], type=_parse_assignment,
+                    help="user=0x<view_sk>，本地引擎，可重复")
+    ap.add_argument("--tofn", action="append", default=[], type=_parse_assignment,
+                    help="user=<shares.json 路径或 JSON 字符串>，离线阈值引擎，可重复")
+    ap.add_argument("--from-id", type=int, default=None)
+    ap.add_argument("--to-id", type=int, default=None)
+    ap.add_argument("--from-block", type=int, default=None)
+    ap.add_argument("--to-block", type=int, default=None)
+    ap.add_argument("--codec", default=SCAN_CODEC, choices=("x32", "comp33", "auto"))
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--page", type=int, default=RESCAN_PAGE)
+    ap.add_argument("--restart", action="store_true", help="忽略已有进度，从头开始")
+    args = ap.parse_args()
+
+    ensure_tables()
+    if args.command == "status":
+        print_status()
+        return
+    if not args.key and not args.tofn:
+        ap.error("need at least one --key or --tofn")
+
+    jobs: List[RescanJob] = []
+    for user, sk in args.key:
+        jobs.append(RescanJob(user, "local", sk, args.codec, args.workers))
+    for user, src in args.tofn:
+        shares_json = open(src).read() if os.path.exists(src) else src
+        jobs.append(RescanJob(user, "tofn", shares_json, args.codec, args.workers))
+
+    lo, hi = resolve_range(args.from_id, args.to_id, args.from_block, args.to_block)
+    jobs = [j for j in jobs if j.load_or_start(lo, hi, args.restart)]
+    if not jobs:
+        return
+    try:
+        run(jobs, page=args.page)
+    except KeyboardInterrupt:
+        print("\n[rescan] ⏹ interrupted; progress saved, rerun the same command to resume")
+        sys.exit(130)
+
+if __name__ == "__main__":
+    main()
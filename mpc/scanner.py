@@ -2,16 +2,20 @@
 # -*- coding: utf-8 -*-
 """
 MPC 阈值扫描器（2-of-3 示例，阈值/节点数可配）
-- 从 SQLite 的 events 表取未扫描事件
+- 从存储后端（默认 SQLite，见 mpc_core/stores.py）的 events 取未扫描事件
 - 对每条事件里的 R（压缩33B公钥）做“阈值 ECDH”：
     收集 Yi = (share_i) * R（从 MPC 节点获取），按 λ_i(0) 聚合得到 S = v * R
 - 生成 tag（默认 X32 -> sha256 -> keccak），与事件中 tag 比对，命中则入 inbox
+- 命中时 S 还在手里：顺便 HKDF + AES-GCM 解开 memo（ver||nonce||ct||tag，见 crypto.py），
+  认证通过的明文存入 inbox.memo_plain，失败什么都不存；
+  之后 /wallet/decrypt 直接读库，不再走一轮 MPC
 
-依赖：pip install web3 requests coincurve
+依赖：pip install web3 requests coincurve cryptography prometheus_client opentelemetry-api opentelemetry-sdk
 Python: 3.8+
 
 环境变量（可选）：
   DB_PATH=mpc_index.db
+  STORAGE_BACKEND=sqlite         # memory 只在同一进程内共享，独立运行的 scanner 会拒绝
   USER_ID=alice
   TARGET_ADDRESS=0x7099...  # 仅用于 fallback 本地 view_sk 派生
   VIEW_SK_HEX=0x...         # 显式指定 view_sk（优先于 TARGET_ADDRESS 派生）
@@ -23,16 +27,75 @@ Python: 3.8+
   SCAN_CODEC=x32|comp33|auto # tag 口径（默认 x32，auto 会两种都算）
   STRICT_MPC=false           # 严格要求 MPC；不足阈值时不回退本地
   LOOP_INTERVAL_S=2          # 扫描轮询间隔秒
+  MPC_SESSION=false          # 两阶段会话：先固定参与集合，节点直接返回 λ_i·y_i·R
+  LOCAL_SCAN_WORKERS=1       # 本地扫描（USE_MPC=false）的进程数，>1 时整批并行
+  DECRYPT_ON_MATCH=true      # 命中时用 S 解密 memo 并落库
+
+节点并发（每个节点的在途请求数由 AIMD 自适应，见 mpc_core/limiter.py）：
+  MPC_MAX_INFLIGHT=32        # 一批事件中同时进行阈值 ECDH 的事件数上限
+  MPC_CONCURRENCY_INITIAL=4 / MPC_CONCURRENCY_MIN=1 / MPC_CONCURRENCY_MAX=64
+  MPC_LATENCY_TOLERANCE=2.0  # 平滑延迟超过基线该倍数即减半并发
+
+指标：
+  METRICS_PORT=9101          # Prometheus 文本格式 http://127.0.0.1:9101/metrics；0 = 关闭
+
+剖析（见 mpc_core/profiling.py）：
+  kill -USR1 <pid>           # 开始采样所有线程（默认 PROFILE_MODE=sample）+ 分阶段计时；再发一次停止，结果写到 PROFILE_DIR
+  PROFILE_STAGES=true        # 启动即打开分阶段计时（decode / share_collection / aggregation / hashing / db_*）
+
+追踪（见 mpc_core/tracing.py）：
+  TRACE_FILE=traces-scanner.jsonl  # 每个事件一条 trace，经 traceparent 头延伸到节点；不设则关闭
+  TRACE_SAMPLE=1.0
+
+录制 / 回放节点请求（见 mpc_core/replay.py）：
+  REPLAY_MODE=record|replay  # record 写 <REPLAY_DIR>/nodes[-<REPLAY_TAG>].jsonl（已存在则报错）；replay 不连节点，按录制结果返回
+  REPLAY_DIR=fixtures
+  REPLAY_DELAY_SCALE=0       # 回放时按录制耗时 × 系数等待
+
+两条扫描车道（每轮先 live 后 backfill）：
+  LIVE_WINDOW=1000           # 最新的 N 个事件 id 属于 live 车道，其余为 backfill
+  LIVE_BATCH=200             # live 车道每轮最多处理条数（新到旧）
+  LIVE_POLL_S=0.2            # 仍有积压时的轮询间隔（无积压时用 LOOP_INTERVAL_S）
+  BACKFILL_RATE=50           # backfill 车道限速（events/s，令牌桶；0 = 不限）
+  BACKFILL_BATCH=100         # backfill 每轮最多处理条数（也是令牌桶容量）
+  走 MPC 时 backfill 每轮还受节点余量约束：各节点 AIMD 上限在 LIVE_POLL_S 内能放行的请求数
+  减去本轮 live 已用掉的部分；节点变慢 / 报错导致上限减半时 backfill 跟着让路
+
+多 worker 分片（同一个 DB 上跑多个 scanner 进程，单机或多机共享文件）：
+  WORKER_ID=<host>:<pid>     # 租约持有者标识
+  LEASE_S=60                 # 认领一批事件的租约时长；进程崩溃后过期即被其他 worker 回收
+                             # 处理中每过 LEASE_S/3 给本批未完成的事件续租；写结果时校验租约仍归本 worker，
+                             # 已被别人接手的事件结果直接丢弃（由接手者重算）
+
+失败重试（MPC 不可用 / 处理异常时不再直接标记为“未命中”）：
+  RETRY_BASE_S=5             # 第一次重试延迟，之后指数翻倍（带抖动）
+  RETRY_MAX_S=600            # 单次重试延迟上限
+  RETRY_MAX_ATTEMPTS=8       # 超过后进入死信（scanned=-1），用 `scanner.py requeue-dead` 重新入队
+
+events.scanned 取值：0 待扫（含等待重试）/ 1 已扫 / -1 死信
 """
 import os
+import sys
 import time
-import sqlite3
-import hashlib
-from typing import List, Tuple, Optional
-
-import requests
-from web3 import Web3
-from coincurve import PrivateKey, PublicKey
+import random
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional
+
+from coincurve import PublicKey
+
+try:
+    from .mpc_core.crypto import decrypt_memo_with_shared
+    from .mpc_core.ecdh_client import ThresholdECDHClient
+    from .mpc_core.local_scan import LocalScanEngine
+    from .mpc_core import metrics, profiling, stores, tracing
+    from .mpc_core.primitives import SECP_N, keccak_text, tag_hash
+except ImportError:  # 以脚本方式运行：python3 mpc/scanner.py
+    from mpc_core.crypto import decrypt_memo_with_shared
+    from mpc_core.ecdh_client import ThresholdECDHClient
+    from mpc_core.local_scan import LocalScanEngine
+    from mpc_core import metrics, profiling, stores, tracing
+    from mpc_core.primitives import SECP_N, keccak_text, tag_hash
 
 # =============================================================================
 # 环境配置
@@ -51,8 +114,24 @@ MPC_AUTH        = os.getenv("MPC_AUTH", "").encode("utf-8")
 SCAN_CODEC      = os.getenv("SCAN_CODEC", "x32").lower()  # x32|comp33|auto
 STRICT_MPC      = os.getenv("STRICT_MPC", "false").lower() in ("1", "true", "yes")
 LOOP_INTERVAL_S = float(os.getenv("LOOP_INTERVAL_S", "2"))
+MPC_SESSION     = os.getenv("MPC_SESSION", "false").lower() in ("1", "true", "yes")
+LOCAL_SCAN_WORKERS = max(1, int(os.getenv("LOCAL_SCAN_WORKERS", "1")))
+DECRYPT_ON_MATCH = os.getenv("DECRYPT_ON_MATCH", "true").lower() in ("1", "true", "yes")
+MPC_MAX_INFLIGHT = max(1, int(os.getenv("MPC_MAX_INFLIGHT", "32")))
+METRICS_PORT     = int(os.getenv("METRICS_PORT", "9101"))
+
+LIVE_WINDOW     = max(0, int(os.getenv("LIVE_WINDOW", "1000")))
+LIVE_BATCH      = max(1, int(os.getenv("LIVE_BATCH", "200")))
+LIVE_POLL_S     = float(os.getenv("LIVE_POLL_S", "0.2"))
+BACKFILL_RATE   = float(os.getenv("BACKFILL_RATE", "50"))
+BACKFILL_BATCH  = max(1, int(os.getenv("BACKFILL_BATCH", "100")))
 
-SECP_N = int("0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141", 16)
+WORKER_ID       = os.getenv("WORKER_ID", "").strip() or f"{socket.gethostname()}:{os.getpid()}"
+LEASE_S         = max(1, int(os.getenv("LEASE_S", "60")))
+
+RETRY_BASE_S       = float(os.getenv("RETRY_BASE_S", "5"))
+RETRY_MAX_S        = float(os.getenv("RETRY_MAX_S", "600"))
+RETRY_MAX_ATTEMPTS = max(1, int(os.getenv("RETRY_MAX_ATTEMPTS", "8")))
 
 def _strip0x(s: str) -> str:
     return s[2:] if isinstance(s, str) and s.lower().startswith("0x") else s
@@ -80,13 +159,20 @@ def _as_bytes(x) -> bytes:
     except Exception:
         return b""
 
-def _int_to_32be(x: int) -> bytes:
-    return (x % SECP_N).to_bytes(32, "big")
+def _valid_point(R_raw: bytes) -> bool:
+    """33B 压缩点且在曲线上；链上任何人都能发一个前缀合法但不在曲线上的 R"""
+    if len(R_raw) != 33 or R_raw[0] not in (2, 3):
+        return False
+    try:
+        PublicKey(R_raw)
+        return True
+    except Exception:
+        return False
 
 def derive_view_private_key_from_addr(address: str) -> str:
     """演示/开发用：从地址派生 view_sk（不要用于生产）"""
     addr_lower = address.lower()
-    seed_view = Web3.keccak(text=addr_lower + ":view")  # 32B
+    seed_view = keccak_text(addr_lower + ":view")  # 32B
     seed_int  = int.from_bytes(seed_view, "big")
     view_sk_int = (seed_int % (SECP_N - 1)) + 1         # [1, n-1]
     return f"0x{view_sk_int:064x}"
@@ -96,303 +182,509 @@ VIEW_PRIVATE_KEY = VIEW_SK_HEX_ENV if VIEW_SK_HEX_ENV else derive_view_private_k
 # =============================================================================
 # TAG 计算口径
 # =============================================================================
-def _tag_from_shared_x32(R_bytes: bytes, view_sk_hex: str) -> bytes:
-    sk = PrivateKey.from_hex(_strip0x(view_sk_hex))
-    R  = PublicKey(R_bytes)
-    shared = R.multiply(sk.secret)                      # 共有点 vR
-    uncompressed = shared.format(compressed=False)      # 65B = 0x04 || X || Y
-    x32 = uncompressed[1:33]
-    return Web3.keccak(hashlib.sha256(x32).digest())
-
-def _tag_from_shared_comp33(R_bytes: bytes, view_sk_hex: str) -> bytes:
-    sk = PrivateKey.from_hex(_strip0x(view_sk_hex))
-    R  = PublicKey(R_bytes)
-    comp33 = R.multiply(sk.secret).format(compressed=True)
-    return Web3.keccak(hashlib.sha256(comp33).digest())
+# 本地引擎按 view_sk 缓存：私钥只解析一次，每个 R 只做一次点乘
+_local_engines: Dict[str, LocalScanEngine] = {}
+
+def _local_engine(view_sk_hex: str) -> LocalScanEngine:
+    eng = _local_engines.get(view_sk_hex)
+    if eng is None:
+        eng = LocalScanEngine(view_sk_hex, codec=SCAN_CODEC)
+        _local_engines[view_sk_hex] = eng
+    return eng
 
+@tracing.traced("local.tag")
 def derive_tag_local(R_bytes: bytes, view_sk_hex: str) -> Tuple[bytes, Optional[bytes], str]:
-    codec = SCAN_CODEC
-    if codec == "x32":
-        return _tag_from_shared_x32(R_bytes, view_sk_hex), None, "local:x32"
-    elif codec == "comp33":
-        return _tag_from_shared_comp33(R_bytes, view_sk_hex), None, "local:comp33"
-    else:  # auto
-        t1 = _tag_from_shared_x32(R_bytes, view_sk_hex)
-        t2 = _tag_from_shared_comp33(R_bytes, view_sk_hex)
-        return t1, t2, "local:auto"
+    return _local_engine(view_sk_hex).tags(R_bytes)
 
 # =============================================================================
 # 阈值 ECDH
 # =============================================================================
-def _lagrange_coeffs_at_zero(indices: List[int]) -> List[int]:
-    """计算拉格朗日系数 λ_i(0) over secp256k1 标量域（mod n）"""
-    lambdas: List[int] = []
-    for i in indices:
-        num = 1
-        den = 1
-        for j in indices:
-            if j == i:
-                continue
-            num = (num * (-j % SECP_N)) % SECP_N
-            den = (den * ((i - j) % SECP_N)) % SECP_N
-        den_inv = pow(den, SECP_N - 2, SECP_N)  # n 为素数，费马小定理求逆
-        lambdas.append((num * den_inv) % SECP_N)
-    return lambdas
-
-def _point_mul(pub: PublicKey, k: int) -> PublicKey:
-    return pub.multiply(_int_to_32be(k))
-
-def _point_add(p: Optional[PublicKey], q: PublicKey) -> PublicKey:
-    if p is None:
-        return q
-    return PublicKey.combine_keys([p, q])
-
-def collect_scan_shares(R_bytes: bytes, need: int) -> List[Tuple[int, bytes]]:
-    """
-    调用各 MPC 节点 /scan_share，收集至少 need 份不同索引的 (i, Yi)
-    请求：POST { "R": "0x..33B", "auth": "0xkeccak(auth||R)" }（auth 可选）
-    响应：{ "i": <int>, "Yi": "0x02/03..33B" }
-    """
-    shares: List[Tuple[int, bytes]] = []
-    seen = set()
-    auth_sig = Web3.keccak(MPC_AUTH + R_bytes).hex() if MPC_AUTH else None
-    payload = {"R": _b2h(R_bytes)}
-    if auth_sig:
-        payload["auth"] = auth_sig
-
-    for url in MPC_NODES:
-        try:
-            resp = requests.post(f"{url.rstrip('/')}/scan_share", json=payload, timeout=HTTP_TIMEOUT_S)
-            resp.raise_for_status()
-            data = resp.json()
-            i = int(data["i"])
-            if i in seen:
-                continue
-            Yi = _as_bytes(data["Yi"])
-            # 基本健全性：压缩点 33B，首字节 0x02/0x03；on-curve 校验由构造 PublicKey 触发
-            if len(Yi) != 33 or Yi[0] not in (2, 3):
-                print(f"[scanner] ⚠️ bad Yi from {url}: len={len(Yi)} head={Yi[:1].hex()}")
-                continue
-            PublicKey(Yi)  # 无异常代表在曲线上
-            shares.append((i, Yi))
-            seen.add(i)
-            if len(shares) >= need:
-                break
-        except Exception as e:
-            print(f"[scanner] ⚠️ share from {url} failed: {e}")
-            continue
-    return shares
-
-def derive_tag_threshold(R_bytes: bytes) -> Tuple[bytes, Optional[bytes], str]:
-    """MPC 阈值计算 tag；返回 (主口径tag, 备选tag或None, 说明)"""
-    shares = collect_scan_shares(R_bytes, need=MPC_THRESHOLD)
-    if len(shares) < MPC_THRESHOLD:
-        raise RuntimeError(f"not enough MPC shares: got {len(shares)}/{MPC_THRESHOLD}")
-
-    indices = [i for (i, _) in shares]
-    lambdas = _lagrange_coeffs_at_zero(indices)
+# 分片收集 / 会话 / 请求合并 / 退避都在共享客户端里（mpc_core.ecdh_client）
+mpc_client = ThresholdECDHClient(MPC_NODES, MPC_THRESHOLD, timeout=HTTP_TIMEOUT_S, auth=MPC_AUTH,
+                                 session=MPC_SESSION, log_prefix="[scanner]")
 
-    # 聚合 S = Σ λ_i * Yi
-    S: Optional[PublicKey] = None
-    for lam, (_, Yi_bytes) in zip(lambdas, shares):
-        Yi = PublicKey(Yi_bytes)
-        lamYi = _point_mul(Yi, lam)
-        S = _point_add(S, lamYi)
-
-    if S is None:
-        raise RuntimeError("failed to aggregate point S")
+def collect_scan_shares(R_bytes: bytes, need: int, lane: str = "live") -> List[Tuple[int, bytes]]:
+    """调用各 MPC 节点 /scan_share，收集至少 need 份不同索引的 (i, Yi)"""
+    return mpc_client.collect_shares(R_bytes, need=need, lane=lane)
 
+@profiling.timed("hashing")
+@tracing.traced("hash.tags")
+def _tags_from_point(S: PublicKey, prefix: str) -> Tuple[bytes, Optional[bytes], str]:
     codec = SCAN_CODEC
     tag_x32 = None
     tag_c33 = None
     if codec in ("x32", "auto"):
         uncompressed = S.format(compressed=False)
         x32 = uncompressed[1:33]
-        tag_x32 = Web3.keccak(hashlib.sha256(x32).digest())
+        tag_x32 = tag_hash(x32)
     if codec in ("comp33", "auto"):
         comp33 = S.format(compressed=True)
-        tag_c33 = Web3.keccak(hashlib.sha256(comp33).digest())
+        tag_c33 = tag_hash(comp33)
 
     if codec == "x32":
-        return tag_x32, None, "mpc:x32"
+        return tag_x32, None, f"{prefix}:x32"
     elif codec == "comp33":
-        return tag_c33, None, "mpc:comp33"
+        return tag_c33, None, f"{prefix}:comp33"
     else:
-        return tag_x32, tag_c33, "mpc:auto"
+        return tag_x32, tag_c33, f"{prefix}:auto"
+
+def derive_shared_threshold(R_bytes: bytes, lane: str = "live") -> Tuple[PublicKey, str]:
+    """MPC 阈值 ECDH：返回 (S = v·R, 说明前缀)；lane 决定节点侧准入优先级"""
+    return mpc_client.shared_point(R_bytes, lane)
+
+def derive_tag_threshold(R_bytes: bytes, lane: str = "live") -> Tuple[bytes, Optional[bytes], str]:
+    """MPC 阈值计算 tag；返回 (主口径tag, 备选tag或None, 说明)"""
+    return _tags_from_point(*derive_shared_threshold(R_bytes, lane))
+
+_mpc_pool: Optional[ThreadPoolExecutor] = None
+
+def _derive_in_span(span, R_bytes: bytes, lane: str) -> Tuple[PublicKey, str]:
+    with tracing.activate(span):  # 线程池里接着事件自己的 trace
+        return derive_shared_threshold(R_bytes, lane)
+
+def prefetch_shared_threshold(items: List[Tuple[int, bytes]], lane: str = "live",
+                              spans: Optional[Dict[int, object]] = None,
+                              on_progress=None) -> Dict[int, object]:
+    """
+    整批并发做阈值 ECDH：{eid: (S, prefix) 或 Exception}
+    实际打到每个节点的并发由客户端里的 AIMD 限流器控制，这里只给出足够的在途事件
+    spans：{eid: 该事件的根 span}，节点请求挂在对应 trace 下
+    on_progress：每收到一个结果调用一次（scanner 用来续租）
+    """
+    global _mpc_pool
+    if _mpc_pool is None:
+        _mpc_pool = ThreadPoolExecutor(max_workers=MPC_MAX_INFLIGHT, thread_name_prefix="mpc")
+    spans = spans or {}
+    futs = {eid: _mpc_pool.submit(_derive_in_span, spans.get(eid, tracing.NOOP), R, lane) for eid, R in items}
+    out: Dict[int, object] = {}
+    for eid, fut in futs.items():
+        try:
+            out[eid] = fut.result()
+        except Exception as e:
+            out[eid] = e
+        if on_progress is not None:
+            on_progress()
+    return out
+
+def mpc_limits() -> Dict[str, int]:
+    """各节点当前生效的并发上限"""
+    return mpc_client.limits()
+
+def mpc_capacity(window_s: float) -> int:
+    """window_s 内节点还能承接的事件数（AIMD 余量，见 ThresholdECDHClient.capacity）"""
+    return mpc_client.capacity(window_s)
+
+tracing.set_service("scanner")
 
 # =============================================================================
-# SQLite 存取
+# 指标（mpc_core.metrics；节点延迟 / 聚合耗时由 ECDH 客户端记录）
 # =============================================================================
-def _open_db():
-    con = sqlite3.connect(DB_PATH)
-    # 稳定性：WAL 模式，适合读多写少
-    try:
-        con.execute("PRAGMA journal_mode=WAL;")
-        con.execute("PRAGMA synchronous=NORMAL;")
-    except Exception:
-        pass
-    return con
+M_SCANNED  = metrics.counter("mpc_scanner_events_scanned_total", "Events scanned", ("lane",))
+M_MATCHED  = metrics.counter("mpc_scanner_events_matched_total", "Events matched to this user", ("lane",))
+M_DEFERRED = metrics.counter("mpc_scanner_events_deferred_total", "Events deferred for retry", ("outcome",))
+M_BATCH    = metrics.histogram("mpc_scanner_batch_seconds", "Time to process one claimed batch", ("lane",))
+M_PENDING  = metrics.gauge("mpc_scanner_pending_events", "Pending events (scan lag in events)", ("lane",))
+M_LAG_BLK  = metrics.gauge("mpc_scanner_lag_blocks", "Newest event block minus oldest pending event block")
+M_STATE    = metrics.gauge("mpc_scanner_retry_events", "Events waiting for retry / dead-lettered", ("state",))
+M_LEASE    = metrics.counter("mpc_scanner_lease_lost_total", "Results dropped because another worker took over the lease")
+M_LIMIT    = metrics.gauge("mpc_node_concurrency_limit", "AIMD in-flight limit per MPC node", ("node",))
+for _u in MPC_NODES:
+    M_LIMIT.labels(node=_u).set_function(lambda u=_u: mpc_client.limits().get(u, 0))
+
+# =============================================================================
+# 存取（SQL 与内存实现都在 mpc_core/stores.py）
+# =============================================================================
+_store = None
+
+def _get_store() -> "stores.Store":
+    global _store
+    if _store is None:
+        _store = stores.open_store(DB_PATH, component="scanner", standalone=True)
+    return _store
 
 def ensure_tables():
-    con = _open_db()
-    cur = con.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS events(
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      block INTEGER,
-      txhash TEXT,
-      tag BLOB,
-      R   BLOB,
-      memo BLOB,
-      commitment BLOB,
-      scanned INTEGER DEFAULT 0,
-      matched INTEGER DEFAULT 0,
-      created_at INTEGER
-    )""")
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS inbox(
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      user_id TEXT,
-      event_id INTEGER,
-      tag BLOB,
-      R   BLOB,
-      memo BLOB,
-      commitment BLOB,
-      status TEXT DEFAULT 'unread',
-      detected_at INTEGER
-    )""")
-    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_inbox_event ON inbox(event_id)")
-    con.commit()
-    con.close()
-
-def fetch_unscanned() -> List[Tuple]:
-    con = _open_db()
-    cur = con.cursor()
-    cur.execute("SELECT id, tag, R, memo, commitment FROM events WHERE scanned=0")
-    rows = cur.fetchall()
-    con.close()
-    return rows
-
-def mark_scanned(eid: int, matched: int):
-    con = _open_db()
-    cur = con.cursor()
-    cur.execute("UPDATE events SET scanned=1, matched=? WHERE id=?", (matched, eid))
-    con.commit()
-    con.close()
-
-def insert_inbox(user_id: str, eid: int, tag: bytes, R: bytes, memo: bytes, commitment: bytes):
-    con = _open_db()
-    cur = con.cursor()
-    cur.execute("""
-      INSERT OR IGNORE INTO inbox(user_id, event_id, tag, R, memo, commitment, detected_at)
-      VALUES(?,?,?,?,?,?, strftime('%s','now'))
-    """, (user_id, eid, tag, R, memo, commitment))
-    con.commit()
-    con.close()
+    """建表 / 迁移统一由 storage 的迁移链负责（内存后端无需迁移）"""
+    _get_store().migrate()
+
+def live_floor() -> int:
+    """id 大于该值的事件属于 live 车道"""
+    return max(0, _get_store().max_event_id() - LIVE_WINDOW)
+
+@profiling.timed("db_claim")
+def claim_pending(lane: str, floor: int, limit: int) -> List[Tuple]:
+    """
+    认领一批待扫事件（加租约），多个 worker 之间不重叠：
+      live：floor 之上最新的待扫事件（新到旧）；backfill：floor 及以下最老的待扫事件
+    没有租约或租约已过期（持有者崩溃）的事件都可被认领。
+    """
+    return _get_store().claim(lane, floor, limit, WORKER_ID, LEASE_S)
+
+def release_leases():
+    """退出时归还本 worker 尚未完成的租约，其他 worker 可立即接手"""
+    _get_store().release_leases(WORKER_ID)
+
+class LeaseKeeper:
+    """
+    一批事件处理期间的续租：距上次续租超过 LEASE_S/3 时，把本批尚未写结果的事件续到 now + LEASE_S。
+    批的耗时随批大小和节点超时增长（LIVE_BATCH=200、每事件数次 HTTP_TIMEOUT_S 可以超过 LEASE_S），
+    不续租的话租约会在处理中途过期，另一个 worker 重复认领同一批
+    """
+    def __init__(self, eids: List[int]):
+        self.pending = set(eids)
+        self._renewed = time.monotonic()
+
+    def done(self, eid: int):
+        self.pending.discard(eid)
+
+    @profiling.timed("db_write")
+    def tick(self):
+        if not self.pending or time.monotonic() - self._renewed < LEASE_S / 3:
+            return
+        kept = _get_store().renew_leases(sorted(self.pending), WORKER_ID, LEASE_S)
+        self._renewed = time.monotonic()
+        if kept < len(self.pending):
+            print(f"[scanner] ⚠️ {len(self.pending) - kept} lease(s) taken over by another worker")
+
+def count_pending(floor: int) -> Tuple[int, int]:
+    """(live 待扫数, backfill 待扫数)"""
+    return _get_store().pending_counts(floor)
+
+def count_retry_states() -> Tuple[int, int]:
+    """(等待重试数, 死信数)"""
+    return _get_store().retry_counts()
+
+def lag_blocks() -> int:
+    """扫描滞后的块数：最新事件的块号 - 最老待扫事件的块号（无积压为 0）"""
+    return _get_store().lag_blocks()
+
+@profiling.timed("db_write")
+@tracing.traced("db.defer_retry")
+def defer_retry(eid: int, err: Exception):
+    """
+    暂时性失败：保持 scanned=0，按指数退避安排下次重试；
+    超过 RETRY_MAX_ATTEMPTS 次后转入死信（scanned=-1），不再自动重试
+    """
+    store = _get_store()
+    attempts = store.attempts(eid) + 1
+    if attempts >= RETRY_MAX_ATTEMPTS:
+        if not store.defer(eid, attempts, str(err)[:500], owner=WORKER_ID):
+            return _lease_lost(eid)
+        print(f"[scanner] ☠️ eid={eid} dead-lettered after {attempts} attempts: {err}")
+        M_DEFERRED.labels(outcome="dead").inc()
+    else:
+        delay = min(RETRY_MAX_S, RETRY_BASE_S * (2 ** (attempts - 1)))
+        delay *= random.uniform(0.8, 1.2)  # 抖动：节点恢复时不要整批同时重放
+        if not store.defer(eid, attempts, str(err)[:500], retry_at=int(time.time() + delay), owner=WORKER_ID):
+            return _lease_lost(eid)
+        print(f"[scanner] 🔁 eid={eid} retry #{attempts} in {delay:.0f}s: {err}")
+        M_DEFERRED.labels(outcome="retry").inc()
+
+def requeue_dead() -> int:
+    """把死信事件重新放回待扫队列（节点恢复后手动执行）"""
+    return _get_store().requeue_dead()
+
+@profiling.timed("db_write")
+@tracing.traced("db.mark_scanned")
+def mark_scanned(eid: int, matched: int) -> bool:
+    """只在租约仍归本 worker 时写入；返回是否写入"""
+    if _get_store().mark_scanned(eid, matched, owner=WORKER_ID):
+        return True
+    _lease_lost(eid)
+    return False
+
+def _lease_lost(eid: int):
+    print(f"[scanner] ⚠️ eid={eid} lease no longer ours; result dropped")
+    M_LEASE.inc()
+
+@profiling.timed("db_write")
+@tracing.traced("db.insert_inbox")
+def insert_inbox(user_id: str, eid: int, tag: bytes, R: bytes, memo: bytes, commitment: bytes,
+                 memo_plain: Optional[bytes] = None):
+    _get_store().insert_inbox(user_id, eid, tag, R, memo, commitment, memo_plain)
 
 # =============================================================================
 # 扫描一次
 # =============================================================================
-def scan_once():
-    pending = fetch_unscanned()
-    if not pending:
-        print("[scanner] no pending events")
-        return
-
-    for eid, tag_b, R_b, memo_b, commitment_b in pending:
+@profiling.timed("memo_decrypt")
+@tracing.traced("memo.decrypt")
+def _decrypt_memo_on_match(eid: int, R_raw: bytes, S: Optional[PublicKey], memo_b: bytes) -> Optional[bytes]:
+    """命中时顺手解 memo；S 为 None（本地路径）时用本地引擎补算一次点乘"""
+    if not DECRYPT_ON_MATCH or not memo_b:
+        return None
+    try:
+        if S is None:
+            S = _local_engine(VIEW_PRIVATE_KEY).shared_point(R_raw)
+        pt = decrypt_memo_with_shared(S.format(compressed=False)[1:33], memo_b, R_raw)
+        if pt is None:
+            print(f"[scanner] ⚠️ memo for eid={eid} failed authentication; not stored")
+        return pt
+    except Exception as e:
+        print(f"[scanner] ⚠️ memo decrypt failed for eid={eid}: {e}")
+        return None
+
+def _process_row(row: Tuple, lane: str, local_tags: Dict[int, Tuple[bytes, Optional[bytes], str]],
+                 mpc_shared: Dict[int, object]) -> int:
+    """扫描单条事件，命中返回 1"""
+    eid, tag_b, R_b, memo_b, commitment_b, _created_at = row
+    with profiling.stage("decode"):
         tag_db = _as_bytes(tag_b)
         R_raw  = _as_bytes(R_b)
         memo_b = _as_bytes(memo_b) if memo_b is not None else b""
         commitment_b = _as_bytes(commitment_b) if commitment_b is not None else b""
+        R_ok = _valid_point(R_raw)
 
-        try:
-            if len(R_raw) != 33 or R_raw[0] not in (2, 3):
-                print(f"[scanner] ⚠️  eid={eid} unexpected R length/prefix: len={len(R_raw)} head={R_raw[:1].hex()}")
-                mark_scanned(eid, 0)
-                continue
-
-            # 优先 MPC；若 STRICT_MPC=true，MPC 失败时不会回退本地
-            used_codec = ""
-            tag_primary: Optional[bytes] = None
-            tag_secondary: Optional[bytes] = None
-
-            if USE_MPC:
-                try:
-                    tag_primary, tag_secondary, used_codec = derive_tag_threshold(R_raw)
-                except Exception as mpc_err:
-                    if STRICT_MPC:
-                        print(f"[scanner] ❌ MPC required but failed for eid={eid}: {mpc_err}")
-                        mark_scanned(eid, 0)
-                        continue
-                    print(f"[scanner] ⚠️ MPC derive failed for eid={eid}: {mpc_err} -> fallback local")
-                    tag_primary, tag_secondary, used_codec = derive_tag_local(R_raw, VIEW_PRIVATE_KEY)
-            else:
+    try:
+        # 无效点直接记为不匹配：重试不会让它变有效，只会反复打到所有节点、最后混进死信
+        if not R_ok:
+            print(f"[scanner] ⚠️  eid={eid} R is not a valid compressed point: len={len(R_raw)} head={R_raw[:1].hex()}")
+            if mark_scanned(eid, 0):
+                M_SCANNED.labels(lane=lane).inc()
+            return 0
+
+        # 优先 MPC；若 STRICT_MPC=true，MPC 失败时不会回退本地
+        used_codec = ""
+        tag_primary: Optional[bytes] = None
+        tag_secondary: Optional[bytes] = None
+        S: Optional[PublicKey] = None  # MPC 聚合出的共享点，命中时用于解 memo
+
+        if USE_MPC:
+            try:
+                res = mpc_shared.get(eid)
+                if isinstance(res, Exception):
+                    raise res
+                S, prefix = res if res is not None else derive_shared_threshold(R_raw, lane)
+                tag_primary, tag_secondary, used_codec = _tags_from_point(S, prefix)
+            except Exception as mpc_err:
+                if STRICT_MPC:
+                    print(f"[scanner] ❌ MPC required but failed for eid={eid}: {mpc_err}")
+                    defer_retry(eid, mpc_err)
+                    return 0
+                print(f"[scanner] ⚠️ MPC derive failed for eid={eid}: {mpc_err} -> fallback local")
                 tag_primary, tag_secondary, used_codec = derive_tag_local(R_raw, VIEW_PRIVATE_KEY)
+        elif eid in local_tags:
+            tag_primary, tag_secondary, used_codec = local_tags[eid]
+        else:
+            tag_primary, tag_secondary, used_codec = derive_tag_local(R_raw, VIEW_PRIVATE_KEY)
+
+        dbg = f"[scanner] {lane} eid={eid} codec={used_codec} " \
+              f"tag_db={_b2h(tag_db)} tag_calc={_b2h(tag_primary or b'')}"
+        if tag_secondary is not None:
+            dbg += f" tag_calc_alt={_b2h(tag_secondary)}"
+        print(dbg)
+
+        matched = 0
+        if tag_primary is not None and tag_primary == tag_db:
+            matched = 1
+        elif tag_secondary is not None and tag_secondary == tag_db:
+            matched = 1
+
+        if matched:
+            memo_plain = _decrypt_memo_on_match(eid, R_raw, S, memo_b)
+            insert_inbox(USER_ID, eid, tag_db, R_raw, memo_b, commitment_b, memo_plain)  # 按 event_id 去重，接手者重写无害
+            if mark_scanned(eid, 1):
+                M_SCANNED.labels(lane=lane).inc()
+                M_MATCHED.labels(lane=lane).inc()
+            print(f"[scanner] ✅ MATCH event #{eid} -> inbox[{USER_ID}]")
+        else:
+            if mark_scanned(eid, 0):
+                M_SCANNED.labels(lane=lane).inc()
+            print(f"[scanner] ❌ No match event #{eid}")
+        return matched
+
+    except KeyboardInterrupt:
+        raise
+    except Exception as e:
+        print(f"[scanner] error on event {eid}: {e}")
+        defer_retry(eid, e)
+        return 0
+
+def process_events(rows: List[Tuple], lane: str = "live") -> int:
+    """扫描一批事件行 (id, tag, R, memo, commitment, created_at)，返回命中数"""
+    # 每个事件一条 trace（TRACE_FILE 未设置时为空操作）
+    roots = {row[0]: tracing.start_span("scan.event", root=True, eid=row[0], lane=lane) for row in rows}
+    lease = LeaseKeeper([row[0] for row in rows])
+
+    # 不走 MPC 时整批本地计算（可多进程），循环里直接查表
+    local_tags: Dict[int, Tuple[bytes, Optional[bytes], str]] = {}
+    if not USE_MPC:
+        eids = [row[0] for row in rows]
+        with profiling.stage("local_tags"):  # 点乘 + 哈希
+            results = _local_engine(VIEW_PRIVATE_KEY).tags_batch(
+                [_as_bytes(row[2]) for row in rows], workers=LOCAL_SCAN_WORKERS)
+        local_tags = {eid: res for eid, res in zip(eids, results) if res is not None}
+        lease.tick()
+
+    # 走 MPC 时整批并发请求节点，循环里只取结果
+    mpc_shared: Dict[int, object] = {}
+    if USE_MPC:
+        valid = [(row[0], _as_bytes(row[2])) for row in rows]
+        with profiling.stage("mpc_batch"):  # 整批墙钟；逐事件的 share_collection / aggregation 另计
+            mpc_shared = prefetch_shared_threshold(
+                [(eid, R) for eid, R in valid if _valid_point(R)], lane, roots, lease.tick)
+
+    hits = 0
+    for row in rows:
+        lease.tick()
+        root = roots[row[0]]
+        with tracing.activate(root):
+            try:
+                hit = _process_row(row, lane, local_tags, mpc_shared)
+                root.set(matched=hit)
+                hits += hit
+            finally:
+                lease.done(row[0])
+                root.end()
+    return hits
 
-            dbg = f"[scanner] eid={eid} codec={used_codec} " \
-                  f"tag_db={_b2h(tag_db)} tag_calc={_b2h(tag_primary or b'')}"
-            if tag_secondary is not None:
-                dbg += f" tag_calc_alt={_b2h(tag_secondary)}"
-            print(dbg)
-
-            matched = 0
-            if tag_primary is not None and tag_primary == tag_db:
-                matched = 1
-            elif tag_secondary is not None and tag_secondary == tag_db:
-                matched = 1
-
-            if matched:
-                insert_inbox(USER_ID, eid, tag_db, R_raw, memo_b, commitment_b)
-                mark_scanned(eid, 1)
-                print(f"[scanner] ✅ MATCH event #{eid} -> inbox[{USER_ID}]")
-            else:
-                mark_scanned(eid, 0)
-                print(f"[scanner] ❌ No match event #{eid}")
-
-        except KeyboardInterrupt:
-            raise
-        except Exception as e:
-            print(f"[scanner] error on event {eid}: {e}")
-            mark_scanned(eid, 0)
+# =============================================================================
+# 两车道调度：live（最新事件，低延迟）/ backfill（历史积压，限速）
+# =============================================================================
+class LaneScheduler:
+    """
+    每轮：先把 live 车道（最新 LIVE_WINDOW 个 id 内的待扫事件，新到旧）处理完，
+    再从 backfill 车道（更老的待扫事件，旧到新）取一批：条数取令牌桶与节点余量的较小者，
+    余量 = 节点 AIMD 上限在一个轮询间隔内能放行的事件数 - 本轮 live 已处理数，
+    live 吃满节点或节点在退避时 backfill 本轮不取。
+    lag() 给出两条车道的积压与延迟，用于调 BACKFILL_RATE。
+    事件通过租约认领（claim_pending），多个 worker 各自跑调度器互不重叠；
+    BACKFILL_RATE 是单个 worker 的限速。
+    """
+    def __init__(self, live_batch: int = LIVE_BATCH, backfill_rate: float = BACKFILL_RATE,
+                 backfill_batch: int = BACKFILL_BATCH, window_s: float = LIVE_POLL_S):
+        self.live_batch = live_batch
+        self.window_s = window_s
+        self.backfill_rate = backfill_rate
+        self.backfill_batch = backfill_batch
+        self._tokens = float(backfill_batch)
+        self._refilled_at = time.monotonic()
+        self._floor = 0
+        self._last = {"live": {"scanned": 0, "delay_s": None},
+                      "backfill": {"scanned": 0, "delay_s": None}}
+        self._headroom: Optional[int] = None
+
+    def _backfill_budget(self, live_done: int) -> int:
+        if self.backfill_rate <= 0:
+            budget = self.backfill_batch
+        else:
+            now = time.monotonic()
+            self._tokens = min(float(self.backfill_batch),
+                               self._tokens + (now - self._refilled_at) * self.backfill_rate)
+            self._refilled_at = now
+            budget = int(self._tokens)
+        if USE_MPC:
+            self._headroom = max(0, mpc_capacity(self.window_s) - live_done)
+            budget = min(budget, self._headroom)
+        return budget
+
+    def _run(self, lane: str, rows: List[Tuple]) -> int:
+        if not rows:
+            return 0
+        with M_BATCH.labels(lane=lane).time():
+            process_events(rows, lane)
+        # 延迟：入库（created_at）到扫描完成，取本批最老的一条
+        created = [r[5] for r in rows if r[5] is not None]
+        self._last[lane] = {
+            "scanned": len(rows),
+            "delay_s": (int(time.time()) - min(created)) if created else None,
+        }
+        return len(rows)
+
+    def tick(self) -> int:
+        """跑一轮，返回本轮处理的事件数"""
+        self._floor = live_floor()
+        n = self._run("live", claim_pending("live", self._floor, self.live_batch))
+
+        budget = self._backfill_budget(n)
+        if budget > 0:
+            done = self._run("backfill", claim_pending("backfill", self._floor, budget))
+            if self.backfill_rate > 0:
+                self._tokens -= done
+            n += done
+        return n
+
+    def lag(self) -> dict:
+        live_pending, backfill_pending = count_pending(self._floor)
+        retrying, dead = count_retry_states()
+        eta = (backfill_pending / self.backfill_rate) if self.backfill_rate > 0 else None
+        blocks = lag_blocks()
+        M_PENDING.labels(lane="live").set(live_pending)
+        M_PENDING.labels(lane="backfill").set(backfill_pending)
+        M_LAG_BLK.set(blocks)
+        M_STATE.labels(state="retrying").set(retrying)
+        M_STATE.labels(state="dead").set(dead)
+        return {
+            "live": dict(self._last["live"], pending=live_pending),
+            "backfill": dict(self._last["backfill"], pending=backfill_pending,
+                             rate=self.backfill_rate, eta_s=eta, headroom=self._headroom),
+            "retrying": retrying,
+            "dead": dead,
+            "lag_blocks": blocks,
+            "live_floor": self._floor,
+            "mpc_limits": mpc_limits() if USE_MPC else {},
+        }
+
+scheduler = LaneScheduler()
+
+def scan_once() -> int:
+    """调度一轮（live + 限速 backfill），返回处理的事件数"""
+    n = scheduler.tick()
+    lag = scheduler.lag()  # 空闲时也刷新积压指标
+    if not n:
+        print("[scanner] no pending events")
+        return 0
+    print(f"[scanner] lanes: live pending={lag['live']['pending']} delay={lag['live']['delay_s']}s | "
+          f"backfill pending={lag['backfill']['pending']} delay={lag['backfill']['delay_s']}s "
+          f"eta={lag['backfill']['eta_s']} | retrying={lag['retrying']} dead={lag['dead']}")
+    if lag["mpc_limits"]:
+        print("[scanner] node concurrency limits: " +
+              " ".join(f"{u}={n}" for u, n in lag["mpc_limits"].items()))
+    return n
 
 # =============================================================================
 # 主程序
 # =============================================================================
 def _debug_print_pending():
-    con = _open_db()
-    cur = con.cursor()
     try:
-        cur.execute("SELECT COUNT(*), SUM(CASE WHEN scanned=0 THEN 1 ELSE 0 END) FROM events")
-        row = cur.fetchone()
-        total = row[0] if row and row[0] is not None else 0
-        pending = row[1] if row and row[1] is not None else 0
-        print(f"[scanner] DB={os.path.abspath(DB_PATH)} total={total} pending={pending}")
+        c = _get_store().counters()
+        print(f"[scanner] DB={_get_store().location} total={c['events']} pending={c['events_pending']}")
     except Exception:
         pass
-    con.close()
 
 def main():
     print(f"🔍 [scanner] Starting scanner for user: {USER_ID}")
     print(f"🎯 Target address: {TARGET_ADDRESS}")
     print(f"🔑 View SK (fallback): {VIEW_PRIVATE_KEY[:10]}... (only used when MPC disabled/insufficient)")
-    print(f"💾 Database: {os.path.abspath(DB_PATH)}")
+    print(f"💾 Database: {_get_store().location} ({_get_store().backend})")
     print(f"🧮 TAG codec: {SCAN_CODEC} (x32 recommended; auto will try both)")
-    print(f"🧩 MPC: {USE_MPC}  nodes={MPC_NODES}  t={MPC_THRESHOLD}  strict={STRICT_MPC}")
+    print(f"🧩 MPC: {USE_MPC}  nodes={MPC_NODES}  t={MPC_THRESHOLD}  strict={STRICT_MPC}  session={MPC_SESSION}")
     print(f"🔐 Auth: {'enabled' if MPC_AUTH else 'disabled'}")
+    print(f"🪪 Worker: {WORKER_ID}  lease={LEASE_S}s")
+    print(f"🛣️  Lanes: live window={LIVE_WINDOW} batch={LIVE_BATCH} | backfill rate={BACKFILL_RATE}/s batch={BACKFILL_BATCH}")
 
     ensure_tables()
     _debug_print_pending()
+    metrics.start_http_server(METRICS_PORT)
+    profiling.install_signal_handler("scanner", log_prefix="[scanner]")
 
     print("🚀 Scanner started, monitoring for matching events...")
     while True:
+        n = 0
         try:
-            scan_once()
+            n = scan_once()
         except KeyboardInterrupt:
+            release_leases()
+            for eng in _local_engines.values():
+                eng.close()  # LOCAL_SCAN_WORKERS > 1 时的进程池
             print("\n👋 Scanner stopped")
             break
         except Exception as e:
             print(f"❌ [scanner] loop error: {e}")
-        time.sleep(LOOP_INTERVAL_S)
+        # 仍有积压时快速回到 live 车道，空闲时按 LOOP_INTERVAL_S 轮询
+        time.sleep(LIVE_POLL_S if n else LOOP_INTERVAL_S)
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "requeue-dead":
+        ensure_tables()
+        print(f"[scanner] requeued {requeue_dead()} dead-lettered event(s)")
+    else:
+        main()
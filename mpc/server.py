@@ -1,17 +1,25 @@
 # mpc/server.py
 import os
 import json
+import time
 import sqlite3
+import threading
 from typing import List, Dict, Any
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from web3 import Web3
+
+try:
+    from .mpc_core import metrics, profiling, stores
+except ImportError:  # 以脚本方式运行：python3 mpc/server.py
+    from mpc_core import metrics, profiling, stores
 
 # 配置
 DB_PATH = os.getenv("DB_PATH", "mpc_index.db")
 RPC_URL = os.getenv("RPC_URL", "http://127.0.0.1:8545")
 REGISTRY_ADDRESS = os.getenv("REGISTRY_V2")  # StealthRegistry 合约地址
+STORE = stores.open_store(DB_PATH, component="server", standalone=True)  # STORAGE_BACKEND=sqlite（memory 会被拒绝，见 mpc_core/stores.py）
 PRIVATE_KEY = os.getenv("SENDER_PRIVATE_KEY", "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80")  # 默认 Anvil 私钥
 
 app = FastAPI(title="MPC Wallet Server")
@@ -30,28 +38,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Web3 连接
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+# 指标：请求延迟 + 抓取时读取的事件/收件箱计数（STORE.counters）
+M_REQ = metrics.histogram("mpc_server_request_seconds", "HTTP request latency", ("path", "status"))
+M_EVENTS = metrics.gauge("mpc_server_events", "Rows in events by scan state", ("state",))
+M_INBOX = metrics.gauge("mpc_server_inbox", "Rows in inbox")
+
+@app.middleware("http")
+async def _observe_request(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    M_REQ.labels(path=getattr(route, "path", "<unmatched>"), status=str(response.status_code)) \
+        .observe(time.perf_counter() - t0)
+    return response
 
-# 加载合约 ABI（如果存在的话）
+profiling.add_admin_routes(app, "server")  # PROFILE_ADMIN=true 时生效
+
+@app.get("/metrics")
+def metrics_endpoint():
+    try:
+        c = STORE.counters()  # 触发器维护的计数，不扫表
+        for state in ("pending", "scanned", "matched", "dead"):
+            M_EVENTS.labels(state=state).set(c[f"events_{state}"])
+        M_INBOX.set(c.get("inbox", 0))
+    except sqlite3.Error:
+        pass  # 库打不开（权限 / 磁盘）：只输出进程内指标
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# Web3 连接与合约：第一次用到时才导入 web3、读 ABI（/wallet/* 与 /metrics 不需要链）
+w3 = None
 registry_abi = None
 registry_contract = None
+_chain_lock = threading.Lock()
 
-try:
-    abi_path = os.path.join(os.path.dirname(__file__), "../contracts/out/StealthRegistry.sol/StealthRegistryV2.json")
-    with open(abi_path) as f:
-        contract_data = json.load(f)
-        registry_abi = contract_data["abi"]
-    
-    if REGISTRY_ADDRESS and registry_abi:
-        registry_contract = w3.eth.contract(
-            address=Web3.to_checksum_address(REGISTRY_ADDRESS), 
-            abi=registry_abi
-        )
-except FileNotFoundError:
-    print("Warning: StealthRegistry ABI file not found. Deploy contracts first or set REGISTRY_V2 address.")
-except Exception as e:
-    print(f"Warning: Failed to load contract: {e}")
+def get_chain():
+    """返回 (w3, registry_contract)；合约不可用时 registry_contract 为 None"""
+    global w3, registry_abi, registry_contract
+    with _chain_lock:
+        if w3 is not None:
+            return w3, registry_contract
+        from web3 import Web3
+
+        chain_w3 = Web3(Web3.HTTPProvider(RPC_URL))
+        # 加载合约 ABI（如果存在的话）
+        try:
+            abi_path = os.path.join(os.path.dirname(__file__), "../contracts/out/StealthRegistry.sol/StealthRegistryV2.json")
+            with open(abi_path) as f:
+                contract_data = json.load(f)
+                registry_abi = contract_data["abi"]
+
+            if REGISTRY_ADDRESS and registry_abi:
+                registry_contract = chain_w3.eth.contract(
+                    address=Web3.to_checksum_address(REGISTRY_ADDRESS),
+                    abi=registry_abi
+                )
+        except FileNotFoundError:
+            print("Warning: StealthRegistry ABI file not found. Deploy contracts first or set REGISTRY_V2 address.")
+        except Exception as e:
+            print(f"Warning: Failed to load contract: {e}")
+        w3 = chain_w3
+        return w3, registry_contract
 
 # 请求模型
 class AnnounceRequest(BaseModel):
@@ -65,22 +111,12 @@ class AnnounceRequest(BaseModel):
 def fetch_inbox(user_id: str) -> List[Dict[str, Any]]:
     """获取用户收件箱"""
     try:
-        con = sqlite3.connect(DB_PATH)
-        cur = con.cursor()
-        cur.execute("""
-        SELECT i.id, e.block, e.txhash, hex(e.tag), hex(e.R), hex(e.memo), hex(e.commitment), i.status
-        FROM inbox i
-        JOIN events e ON i.event_id = e.id
-        WHERE i.user_id=?
-        ORDER BY i.detected_at DESC
-        """, (user_id,))
-        rows = cur.fetchall()
-        con.close()
-        
+        rows = STORE.fetch_inbox(user_id)
+
         results = []
         for row in rows:
             if row:  # 确保行不为空
-                iid, blk, tx, tag_hex, R_hex, memo_hex, commit_hex, status = row
+                iid, blk, tx, tag_hex, R_hex, memo_hex, commit_hex, status, _detected_at = row
                 results.append({
                     "inbox_id": iid,
                     "block": blk,
@@ -100,10 +136,11 @@ def fetch_inbox(user_id: str) -> List[Dict[str, Any]]:
 @app.get("/health")
 def health():
     """健康检查"""
+    chain_w3, registry = get_chain()
     return {
         "ok": True,
-        "rpc_connected": w3.is_connected(),
-        "registry_loaded": registry_contract is not None,
+        "rpc_connected": chain_w3.is_connected(),
+        "registry_loaded": registry is not None,
         "registry_address": REGISTRY_ADDRESS
     }
 
@@ -115,23 +152,19 @@ def wallet_sync(user_id: str = "alice"):
 
 @app.post("/wallet/decrypt")
 def wallet_decrypt(inbox_id: int, user_id: str = "alice"):
-    """演示解密：真实情况应使用 view 私钥协作解密 ECIES 密文"""
+    """读取 scanner 命中时已解出的 memo 明文（inbox.memo_plain），不再触发 MPC 轮次；
+    memo_plain 只在 AES-GCM 认证通过后才写入，没有明文（老格式 / 认证失败）时返回原始 memo 且 decrypted=False"""
     try:
-        con = sqlite3.connect(DB_PATH)
-        cur = con.cursor()
-        cur.execute("""
-        SELECT e.memo
-        FROM inbox i JOIN events e ON i.event_id = e.id
-        WHERE i.id=? AND i.user_id=?
-        """, (inbox_id, user_id))
-        row = cur.fetchone()
-        con.close()
-        
+        row = STORE.inbox_memo(inbox_id, user_id)
+
         if not row:
             return {"ok": False, "error": "not found"}
         
-        memo_hex = row[0].hex() if row[0] else ""
-        return {"ok": True, "plaintext": memo_hex}
+        memo, memo_plain = row
+        if memo_plain is not None:
+            return {"ok": True, "plaintext": bytes(memo_plain).hex(), "decrypted": True}
+        memo_hex = memo.hex() if memo else ""
+        return {"ok": True, "plaintext": memo_hex, "decrypted": False}
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
@@ -141,17 +174,25 @@ def stealth_spend(inbox_id: int, to: str, amount: int, user_id: str = "alice"):
     fake_txid = f"0xDEMOFAKETX{inbox_id:04d}"
     return {"ok": True, "txid": fake_txid, "to": to, "amount": amount}
 
+def _memo_bytes(memo_cipher: Any) -> bytes:
+    """前端 senderAssembleAnnouncement 给出的 memoCipher（hex，ver||nonce||ct||tag）；没有 memo 时为空"""
+    if not memo_cipher:
+        return b""
+    h = str(memo_cipher)
+    return bytes.fromhex(h[2:] if h.startswith("0x") else h)
+
 @app.post("/sender/announce")
 def sender_announce(request: AnnounceRequest):
     """接收发送方的公告请求"""
     try:
         # 如果合约可用，发布到链上
+        w3, registry_contract = get_chain()
         if registry_contract and REGISTRY_ADDRESS:
             # 准备参数
             R_bytes = bytes.fromhex(request.R[2:] if request.R.startswith('0x') else request.R)
             tag_bytes32 = bytes.fromhex(request.tag[2:] if request.tag.startswith('0x') else request.tag)
             commitment_bytes32 = bytes.fromhex(request.commitment[2:] if request.commitment.startswith('0x') else request.commitment)
-            memo_bytes = b""  # 暂时为空
+            memo_bytes = _memo_bytes(request.memoCipher)
             
             # 构建交易
             account = w3.eth.account.from_key(PRIVATE_KEY)
@@ -184,38 +225,14 @@ def sender_announce(request: AnnounceRequest):
             # 合约不可用时，模拟保存到数据库
             print(f"收到公告请求: R={request.R[:10]}..., tag={request.tag[:10]}..., txHash={request.txHash}")
             
-            # 模拟写入 events 表
-            con = sqlite3.connect(DB_PATH)
-            cur = con.cursor()
-            
-            # 确保 events 表存在
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS events(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              block INTEGER,
-              txhash TEXT,
-              tag BLOB,
-              R BLOB,
-              memo BLOB,
-              commitment BLOB,
-              scanned INTEGER DEFAULT 0,
-              matched INTEGER DEFAULT 0,
-              created_at INTEGER
-            )""")
-            
-            # 插入模拟事件
+            # 模拟写入 events 表（SQLite 下表由迁移链保证存在）
             tag_bytes = bytes.fromhex(request.tag[2:] if request.tag.startswith('0x') else request.tag)
             R_bytes = bytes.fromhex(request.R[2:] if request.R.startswith('0x') else request.R)
             commitment_bytes = bytes.fromhex(request.commitment[2:] if request.commitment.startswith('0x') else request.commitment)
-            memo_bytes = b""  # 暂时为空
+            memo_bytes = _memo_bytes(request.memoCipher)
             
-            cur.execute("""
-              INSERT INTO events(block, txhash, tag, R, memo, commitment, created_at)
-              VALUES(?,?,?,?,?,?, strftime('%s','now'))
-            """, (999999, request.txHash or "0xMOCKTX", tag_bytes, R_bytes, memo_bytes, commitment_bytes))
-            
-            con.commit()
-            con.close()
+            STORE.insert_event(999999, request.txHash or "0xMOCKTX",
+                               tag_bytes, R_bytes, memo_bytes, commitment_bytes)
             
             return {
                 "ok": True, 
@@ -233,10 +250,14 @@ async def startup_event():
     print(f"🚀 MPC Wallet Server starting...")
     print(f"📡 RPC: {RPC_URL}")
     print(f"🔗 Registry: {REGISTRY_ADDRESS or 'Not set'}")
-    print(f"📊 Database: {DB_PATH}")
-    
-    if w3.is_connected():
-        chain_id = w3.eth.chain_id
+    print(f"📊 Database: {STORE.location} ({STORE.backend})")
+    # 链检查放到后台线程：导入 web3 + 连 RPC 不再挡住服务就绪
+    threading.Thread(target=_check_chain, name="chain-check", daemon=True).start()
+
+def _check_chain():
+    chain_w3, _ = get_chain()
+    if chain_w3.is_connected():
+        chain_id = chain_w3.eth.chain_id
         print(f"⛓️  Connected to chain ID: {chain_id}")
     else:
         print("❌ RPC connection failed")
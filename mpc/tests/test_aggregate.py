@@ -0,0 +1,56 @@
+import itertools
+import random
+
+import pytest
+from coincurve import PrivateKey, PublicKey
+
+from mpc.mpc_core.aggregate import aggregate_shares, combine_points, lagrange_coeffs_at_zero
+from mpc.mpc_core.primitives import SECP_N
+
+RNG = random.Random(28)
+T, N = 3, 5
+
+def _shamir(secret: int, t: int, n: int):
+    """f(x) = secret + a1·x + ... + a_{t-1}·x^{t-1}；返回 {i: f(i)}"""
+    coeffs = [secret] + [RNG.randrange(1, SECP_N) for _ in range(t - 1)]
+    return {i: sum(c * pow(i, k, SECP_N) for k, c in enumerate(coeffs)) % SECP_N for i in range(1, n + 1)}
+
+V = RNG.randrange(1, SECP_N)
+SHARES = _shamir(V, T, N)
+R = PrivateKey(RNG.randrange(1, SECP_N).to_bytes(32, "big")).public_key
+
+def _node_share(i: int) -> bytes:
+    """节点 i 返回的 Y_i = y_i·R（33B 压缩点）"""
+    return R.multiply(SHARES[i].to_bytes(32, "big")).format(compressed=True)
+
+def test_coefficients_interpolate_constants():
+    for subset in itertools.combinations(range(1, N + 1), T):
+        assert sum(lagrange_coeffs_at_zero(subset)) % SECP_N == 1
+        assert sum(lam * SHARES[i] for lam, i in zip(lagrange_coeffs_at_zero(subset), subset)) % SECP_N == V
+
+@pytest.mark.parametrize("subset", list(itertools.combinations(range(1, N + 1), T)) + [(5, 1, 3), (2, 4, 1, 5)])
+def test_any_threshold_subset_recovers_v_times_R(subset):
+    expected = R.multiply(V.to_bytes(32, "big")).format()
+    S = aggregate_shares([(i, _node_share(i)) for i in subset])
+    assert S.format() == expected
+    # PublicKey 与压缩字节混用结果相同
+    mixed = [(i, PublicKey(_node_share(i)) if k % 2 else _node_share(i)) for k, i in enumerate(subset)]
+    assert aggregate_shares(mixed).format() == expected
+
+def test_fewer_than_threshold_does_not_recover():
+    S = aggregate_shares([(i, _node_share(i)) for i in (1, 2)])
+    assert S.format() != R.multiply(V.to_bytes(32, "big")).format()
+
+def test_combine_points_matches_pairwise_addition():
+    pts = [PrivateKey(RNG.randrange(1, SECP_N).to_bytes(32, "big")).public_key for _ in range(4)]
+    pairwise = pts[0]
+    for p in pts[1:]:
+        pairwise = PublicKey.combine_keys([pairwise, p])
+    assert combine_points([p.format() for p in pts]).format() == pairwise.format()
+    assert combine_points([pts[0].format()]).format() == pts[0].format()
+
+def test_empty_inputs_raise():
+    with pytest.raises(ValueError):
+        aggregate_shares([])
+    with pytest.raises(ValueError):
+        combine_points([])
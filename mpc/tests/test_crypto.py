@@ -0,0 +1,53 @@
+import os
+import random
+
+import pytest
+from coincurve import PrivateKey, PublicKey
+
+from mpc.mpc_core.crypto import MEMO_V1, decrypt_memo_with_shared, encrypt_memo_with_shared
+from mpc.mpc_core.primitives import SECP_N
+
+RNG = random.Random(31)
+VIEW = PrivateKey(RNG.randrange(1, SECP_N).to_bytes(32, "big"))
+OTHER = PrivateKey(RNG.randrange(1, SECP_N).to_bytes(32, "big"))
+
+def _announce(plaintext: bytes):
+    """发送方：R = r·G，密钥取 x32(r·V)"""
+    r = PrivateKey(RNG.randrange(1, SECP_N).to_bytes(32, "big"))
+    R = r.public_key.format(compressed=True)
+    shared = VIEW.public_key.multiply(r.secret).format(compressed=False)[1:33]
+    return R, encrypt_memo_with_shared(shared, R, plaintext)
+
+def _receiver_x32(sk: PrivateKey, R: bytes) -> bytes:
+    """接收方：S = v·R，与 scanner 命中时手里的点一致"""
+    return PublicKey(R).multiply(sk.secret).format(compressed=False)[1:33]
+
+@pytest.mark.parametrize("plaintext", [b"", b"x", b"amount=0.01 ETH", os.urandom(300)])
+def test_round_trip_with_receiver_shared(plaintext):
+    R, memo = _announce(plaintext)
+    assert memo[0] == MEMO_V1
+    assert decrypt_memo_with_shared(_receiver_x32(VIEW, R), memo, R) == plaintext
+
+def test_wrong_key_returns_none():
+    R, memo = _announce(b"not for you")
+    assert decrypt_memo_with_shared(_receiver_x32(OTHER, R), memo, R) is None
+
+@pytest.mark.parametrize("pos", [1, 13, -1])
+def test_tampered_memo_returns_none(pos):
+    R, memo = _announce(b"tamper me")
+    bad = bytearray(memo)
+    bad[pos] ^= 0x01
+    assert decrypt_memo_with_shared(_receiver_x32(VIEW, R), bytes(bad), R) is None
+
+def test_memo_is_bound_to_its_announcement():
+    R, memo = _announce(b"bound to R")
+    R2, _ = _announce(b"other")
+    assert decrypt_memo_with_shared(_receiver_x32(VIEW, R), memo, R2) is None
+
+@pytest.mark.parametrize("memo", [b"", b"\x01" * 28, os.urandom(16) + os.urandom(32)])
+def test_short_or_legacy_memo_returns_none(memo):
+    # 旧的 iv(16)||ct（AES-CTR，无 MAC）无法认证，不再产出“明文”
+    if memo and memo[0] == MEMO_V1:
+        memo = b"\x00" + memo[1:]
+    R, _ = _announce(b"")
+    assert decrypt_memo_with_shared(_receiver_x32(VIEW, R), memo, R) is None
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+from coincurve import PrivateKey
+
+from mpc.mpc_core.ecdh_client import ThresholdECDHClient
+
+NODES = ["http://n1", "http://n2", "http://n3"]
+Y = PrivateKey(b"\x01" * 32).public_key.format()
+
+class _Resp:
+    def __init__(self, body):
+        self._body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._body
+
+def _client(fail_scan=lambda url: False, whoami_delay=0.0):
+    """不走网络：whoami / session / scan_share 都由桩函数回答，calls 记录每次请求"""
+    c = ThresholdECDHClient(NODES, 2, session=True, log_prefix="[test]")
+    calls = []
+
+    def get(url, timeout=None):
+        calls.append(("whoami", url))
+        time.sleep(whoami_delay)
+        return _Resp({"index": NODES.index(url.rsplit("/", 1)[0]) + 1})
+
+    def post(url, path, payload):
+        calls.append((path, url))
+        if path == "/session":
+            return {"session": f"s{len(calls)}"}
+        if fail_scan(url):
+            raise RuntimeError("node down")
+        return {"i": NODES.index(url) + 1, "Yi": "0x" + Y.hex(), "weighted": True}
+
+    c._http.get = get
+    c._post = post
+    return c, calls
+
+def test_failed_session_does_not_clear_a_newer_one():
+    c, _ = _client()
+    old = c.open_session()
+    new = c.open_session()
+    assert old is not new and c._session is new
+    c._drop_session(old)
+    assert c._session is new
+    c._drop_session(new)
+    assert c._session is None
+
+def test_failure_invalidates_only_the_session_it_used():
+    down = {"on": True}
+    c, _ = _client(fail_scan=lambda url: down["on"] and url == NODES[1])
+    failing = c.open_session()
+    replacement = [("http://n1", 1, "x"), ("http://n3", 3, "y")]
+    real_post = c._post
+
+    def swap_then_post(url, path, payload):
+        # 失败请求在途时，另一线程已经换上了新会话
+        c._session = replacement
+        return real_post(url, path, payload)
+
+    c._post = swap_then_post
+    with pytest.raises(RuntimeError):
+        c.collect_weighted_shares(b"\x02" * 33)
+    assert failing is not replacement and c._session is replacement
+
+def test_concurrent_callers_open_one_session():
+    c, calls = _client(whoami_delay=0.05)
+    barrier = threading.Barrier(8)
+    out = []
+
+    def worker():
+        barrier.wait()
+        out.append(len(c.collect_weighted_shares(b"\x02" * 33)))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert out == [2] * 8
+    assert sum(1 for path, _ in calls if path == "/session") == 2  # 一次协商，两个参与节点
+    assert c.stats()["sessions_opened"] == 1
+
+def test_capacity_is_threshold_th_best_node_and_skips_backoff():
+    c, _ = _client()
+    for u, lim in c._limiters.items():
+        lim._limit = {"http://n1": 8.0, "http://n2": 4.0, "http://n3": 2.0}[u]
+    assert c.capacity(0.5) == 4                 # t=2：第二宽的节点决定一个事件能不能完成
+    c._backoff_until["http://n1"] = time.monotonic() + 30
+    assert c.capacity(0.5) == 2
@@ -0,0 +1,59 @@
+from mpc.mpc_core.limiter import AIMDLimiter
+
+def _fill(lim: AIMDLimiter) -> int:
+    n = 0
+    while lim.acquire(timeout=0):
+        n += 1
+    return n
+
+def test_acquire_blocks_at_limit_and_release_frees():
+    lim = AIMDLimiter(initial=3, max_limit=3)
+    assert _fill(lim) == 3
+    assert lim.snapshot()["rejected"] == 1
+    lim.release(0.01)
+    assert lim.acquire(timeout=0)
+
+def test_additive_increase_only_when_saturated():
+    lim = AIMDLimiter(initial=2, max_limit=8)
+    for _ in range(20):          # 从不用满上限：不涨
+        assert lim.acquire(timeout=0)
+        lim.release(0.01)
+    assert lim.limit == 2
+    for _ in range(20):          # 每轮都把上限用满：约每个窗口 +1
+        n = _fill(lim)
+        for _ in range(n):
+            lim.release(0.01)
+    assert 2 < lim.limit <= 8
+
+def test_error_halves_once_per_rtt():
+    lim = AIMDLimiter(initial=16, max_limit=16)
+    for _ in range(4):
+        lim.acquire(timeout=0)
+    lim.release(0.5)             # 建立基线 / EWMA
+    lim.release(0.5, ok=False)
+    assert lim.limit == 8
+    lim.release(0.5, ok=False)   # 同一 RTT 内的第二个失败不再减
+    assert lim.limit == 8
+    assert lim.snapshot()["decreases"] == 1
+
+def test_latency_above_tolerance_backs_off_to_min():
+    lim = AIMDLimiter(initial=4, min_limit=2, max_limit=4, tolerance=2.0, alpha=1.0)
+    lim.acquire(timeout=0)
+    lim.release(0.001)
+    for _ in range(5):
+        lim.acquire(timeout=0)
+        lim._last_decrease = 0.0
+        lim.release(0.01)        # 10 倍基线：拥塞
+    assert lim.limit == 2
+
+def test_headroom_counts_free_slots_per_rtt_in_window():
+    lim = AIMDLimiter(initial=4, max_limit=4, alpha=1.0)
+    assert lim.headroom(1.0) == 4               # 没有延迟样本：只算一轮
+    lim.acquire(timeout=0)
+    lim.release(0.1)
+    assert lim.headroom(1.0) == 40              # 4 个名额 × 10 个 RTT
+    lim.acquire(timeout=0)
+    assert lim.headroom(1.0) == 30
+    lim.release(0.1, ok=False)                  # 乘性减：余量跟着减半
+    assert lim.headroom(1.0) == 20
+    assert lim.headroom(0.01) == 2              # 窗口小于 RTT 时至少一轮
@@ -0,0 +1,56 @@
+import hashlib
+
+import pytest
+from coincurve import PrivateKey
+
+from mpc.mpc_core.local_scan import LocalScanEngine
+from mpc.mpc_core.primitives import keccak256
+
+SK = PrivateKey(b"\x11" * 32)
+
+def _expected(R: bytes):
+    S = SK.public_key.__class__(R).multiply(SK.secret)
+    x32 = S.format(compressed=False)[1:33]
+    return keccak256(hashlib.sha256(x32).digest()), keccak256(hashlib.sha256(S.format()).digest())
+
+def _points(n):
+    return [PrivateKey((i + 7).to_bytes(32, "big")).public_key.format() for i in range(n)]
+
+@pytest.mark.parametrize("codec", ["x32", "comp33", "auto"])
+def test_tags_match_direct_ecdh(codec):
+    eng = LocalScanEngine("0x" + SK.secret.hex(), codec=codec)
+    for R in _points(5):
+        x32, comp33 = _expected(R)
+        t1, t2, label = eng.tags(R)
+        assert label == f"local:{codec}"
+        if codec == "x32":
+            assert (t1, t2) == (x32, None)
+        elif codec == "comp33":
+            assert (t1, t2) == (comp33, None)
+        else:
+            assert (t1, t2) == (x32, comp33)
+
+def test_batch_marks_invalid_R_as_none():
+    eng = LocalScanEngine("0x" + SK.secret.hex())
+    Rs = _points(3)
+    out = eng.tags_batch([Rs[0], b"\x02" + b"\x00" * 32, b"short", Rs[1]])
+    assert out[1] is None and out[2] is None
+    assert out[0] == eng.tags(Rs[0]) and out[3] == eng.tags(Rs[1])
+
+def test_rejects_unknown_codec():
+    with pytest.raises(ValueError):
+        LocalScanEngine("0x" + SK.secret.hex(), codec="x64")
+
+def test_pool_is_created_once_and_reused():
+    eng = LocalScanEngine("0x" + SK.secret.hex(), codec="auto")
+    Rs = _points(40)
+    try:
+        first = eng.tags_batch(Rs, workers=2, chunk=8)
+        pool = eng._pool
+        assert pool is not None
+        assert eng.tags_batch(Rs, workers=2, chunk=8) == first
+        assert eng._pool is pool
+        assert first == eng.tags_batch(Rs)  # 单进程同结果
+    finally:
+        eng.close()
+    assert eng._pool is None
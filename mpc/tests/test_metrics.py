@@ -0,0 +1,24 @@
+from mpc.mpc_core import metrics
+
+def test_get_or_create_returns_the_same_metric():
+    a = metrics.counter("mpc_test_things_total", "Things", ("kind",))
+    assert metrics.counter("mpc_test_things_total", "Things", ("kind",)) is a
+
+def test_render_exposes_counters_gauges_and_histograms():
+    c = metrics.counter("mpc_test_events_total", "Events", ("lane",))
+    g = metrics.gauge("mpc_test_depth", "Depth")
+    h = metrics.histogram("mpc_test_latency_seconds", "Latency", ("node",))
+    c.labels(lane="live").inc(3)
+    g.set_function(lambda: 7)
+    with h.labels(node="n1").time():
+        pass
+    h.labels(node="n1").observe(0.002)
+    text = metrics.render()
+    assert 'mpc_test_events_total{lane="live"} 3.0' in text
+    assert "mpc_test_depth 7.0" in text
+    assert 'mpc_test_latency_seconds_count{node="n1"} 2.0' in text
+    assert 'mpc_test_latency_seconds_bucket{le="0.0025",node="n1"} 2.0' in text
+    assert metrics.CONTENT_TYPE.startswith("text/plain")
+
+def test_start_http_server_disabled_on_zero_port():
+    assert metrics.start_http_server(0) is None
@@ -0,0 +1,114 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("NODE_INDEX", "1")
+os.environ.setdefault("VIEW_SK_SHARE_HEX", "0x" + "11" * 32)
+
+from prometheus_client import REGISTRY  # noqa: E402
+
+from mpc import node_scan  # noqa: E402
+from mpc.node_scan import AdmissionQueue, Saturated, slot_cost  # noqa: E402
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_fast_path_then_queue_then_reject():
+    async def main():
+        q = AdmissionQueue(workers=2, queue_max=2, backfill_max=1)
+        await q.acquire("live")
+        await q.acquire("live")
+        waiting = asyncio.ensure_future(q.acquire("live"))
+        await asyncio.sleep(0)
+        backfill = asyncio.ensure_future(q.acquire("backfill"))
+        await asyncio.sleep(0)
+        with pytest.raises(Saturated):          # 排队总代价已到 queue_max
+            await q.acquire("live")
+        q.release()
+        await waiting
+        assert q.running == 2 and not backfill.done()
+        q.release()
+        q.release()
+        await backfill
+        return q.snapshot()
+
+    snap = run(main())
+    assert snap["admitted"] == {"live": 3, "backfill": 1} and snap["rejected"]["live"] == 1
+
+def test_live_overtakes_queued_backfill():
+    async def main():
+        q = AdmissionQueue(workers=1, queue_max=8, backfill_max=8)
+        order = []
+        await q.acquire("live")
+
+        async def req(lane, tag):
+            await q.acquire(lane)
+            order.append(tag)
+            q.release()
+
+        tasks = [asyncio.ensure_future(req("backfill", "b1")), asyncio.ensure_future(req("live", "l1"))]
+        await asyncio.sleep(0)
+        q.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(main()) == ["l1", "b1"]
+
+def test_batch_is_charged_per_point():
+    assert [slot_cost(n) for n in (1, 16, 17, 256)] == [1, 1, 2, 16]
+
+    async def main():
+        q = AdmissionQueue(workers=4, queue_max=16, backfill_max=4)
+        await q.acquire("backfill", slot_cost(48))  # 3 个槽
+        assert q.running == 3
+        await q.acquire("live")                    # 还剩 1 个槽给 live
+        big = asyncio.ensure_future(q.acquire("backfill", slot_cost(256)))  # 折算后最多占满 4 个槽
+        await asyncio.sleep(0)
+        with pytest.raises(Saturated):             # backfill 排队代价 4 + 1 > 4
+            await q.acquire("backfill", 1)
+        live = asyncio.ensure_future(q.acquire("live"))
+        await asyncio.sleep(0)
+        q.release()                                # 空出 1 个槽：live 优先拿到
+        await live
+        assert not big.done()
+        q.release(3)
+        q.release()
+        await big
+        assert q.running == 4
+        q.release(slot_cost(256))
+        assert q.running == 0
+
+    run(main())
+
+def test_cancelled_waiter_frees_the_queue():
+    async def main():
+        q = AdmissionQueue(workers=2, queue_max=8, backfill_max=8)
+        await q.acquire("live", 2)
+        big = asyncio.ensure_future(q.acquire("live", 2))
+        small = asyncio.ensure_future(q.acquire("live", 1))
+        await asyncio.sleep(0)
+        q.release()                                # 1 个槽：队首的大请求放不下，小请求也不插队
+        await asyncio.sleep(0)
+        assert not small.done()
+        big.cancel()
+        await asyncio.sleep(0)
+        await small
+        assert q.running == 2 and q.snapshot()["queued"] == {"live": 0, "backfill": 0}
+
+    run(main())
+
+def test_queued_gauge_reports_slot_cost(monkeypatch):
+    async def main():
+        q = AdmissionQueue(workers=4, queue_max=16, backfill_max=8)
+        monkeypatch.setattr(node_scan, "admission", q)
+        await q.acquire("live", 4)
+        big = asyncio.ensure_future(q.acquire("backfill", slot_cost(48)))
+        await asyncio.sleep(0)
+        sample = lambda lane: REGISTRY.get_sample_value("mpc_node_queued", {"lane": lane})
+        assert (sample("backfill"), sample("live")) == (3, 0)   # 一个请求，占 3 个单位
+        assert REGISTRY.get_sample_value("mpc_node_running") == 4
+        q.release(4)
+        await big
+
+    run(main())
@@ -0,0 +1,37 @@
+import threading
+import time
+
+from mpc.mpc_core import profiling
+
+def _busy_worker_fn(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(2000))
+
+def test_default_mode_samples_worker_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    assert profiling.PROFILE_MODE == "sample"
+    stop = threading.Event()
+    t = threading.Thread(target=_busy_worker_fn, args=(stop,), name="mpc_0")
+    t.start()
+    try:
+        assert profiling.start_profile()["mode"] == "sample"
+        time.sleep(0.1)
+        res = profiling.stop_profile("t")
+    finally:
+        stop.set()
+        t.join()
+    folded = open(res["path"]).read()
+    assert "mpc_0;" in folded and "_busy_worker_fn" in folded
+
+def test_stage_timer_only_counts_when_enabled():
+    profiling.enable_stages(False)
+    with profiling.stage("off"):
+        pass
+    profiling.enable_stages(True)
+    try:
+        with profiling.stage("on"):
+            pass
+        report = profiling.stage_report(reset=True)
+    finally:
+        profiling.enable_stages(False)
+    assert "on" in report and "off" not in report and report["on"]["count"] == 1
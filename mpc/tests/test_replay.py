@@ -0,0 +1,34 @@
+import pytest
+
+from mpc.mpc_core import replay
+
+@pytest.fixture
+def fixtures(tmp_path, monkeypatch):
+    monkeypatch.setattr(replay, "REPLAY_DIR", str(tmp_path))
+    monkeypatch.setattr(replay, "REPLAY_TAG", "")
+    monkeypatch.setattr(replay, "_recorders", {})
+    return tmp_path
+
+def test_record_then_replay_in_order(fixtures):
+    rec = replay.recorder("nodes")
+    for i in (1, 2):
+        rec.write("POST http://n1/scan_share {}", "http", rec.now_ms(), 1.0, {"i": i})
+    rec.close()
+    p = replay.Player(replay.fixture_path("nodes"))
+    assert [p.take("POST http://n1/scan_share {}")["body"]["i"] for _ in range(3)] == [1, 2, 2]
+    assert p.take("nope") is None and p.missed == ["nope"]
+
+def test_one_process_shares_one_recorder(fixtures):
+    assert replay.recorder("nodes") is replay.recorder("nodes")
+
+def test_refuses_to_overwrite_an_existing_fixture(fixtures):
+    (fixtures / "nodes.jsonl").write_text('{"key":"k"}\n')
+    with pytest.raises(RuntimeError, match="REPLAY_TAG"):
+        replay.Recorder(replay.fixture_path("nodes"))
+    assert (fixtures / "nodes.jsonl").read_text() == '{"key":"k"}\n'
+
+def test_tag_separates_processes(fixtures, monkeypatch):
+    monkeypatch.setattr(replay, "REPLAY_TAG", "worker2")
+    assert replay.fixture_path("nodes").endswith("nodes-worker2.jsonl")
+    replay.recorder("nodes").close()
+    assert (fixtures / "nodes-worker2.jsonl").exists()
@@ -0,0 +1,55 @@
+import itertools
+import os
+
+import pytest
+from coincurve import PrivateKey, PublicKey
+
+from mpc import scanner
+from mpc.mpc_core import stores
+
+_names = itertools.count()
+
+def _off_curve_R() -> bytes:
+    """前缀合法、但 x^3 + 7 不是平方剩余的 x：不在曲线上"""
+    for x in itertools.count(1):
+        R = b"\x02" + x.to_bytes(32, "big")
+        try:
+            PublicKey(R)
+        except Exception:
+            return R
+
+@pytest.fixture
+def store(monkeypatch):
+    s = stores.open_store(f"scanner-{next(_names)}", backend="memory")
+    monkeypatch.setattr(scanner, "_store", s)
+    return s
+
+def _claimed(store, R: bytes):
+    eid = store.insert_event(1, "0x" + "00" * 32, os.urandom(32), R, b"", b"")
+    (row,) = store.claim("backfill", eid, 1, scanner.WORKER_ID, 60)
+    return eid, row
+
+@pytest.mark.parametrize("R", [_off_curve_R(), b"\x04" + b"\x00" * 32, b"\x02" * 5],
+                         ids=["off_curve", "bad_prefix", "short"])
+def test_invalid_R_is_marked_scanned_without_touching_nodes(store, monkeypatch, R):
+    def no_nodes(*_a, **_kw):
+        raise AssertionError("invalid R must not reach the MPC nodes")
+    monkeypatch.setattr(scanner, "USE_MPC", True)
+    monkeypatch.setattr(scanner, "derive_shared_threshold", no_nodes)
+    eid, row = _claimed(store, R)
+    assert scanner.process_events([row], "backfill") == 0
+    assert store.attempts(eid) == 0
+    assert store.retry_counts() == (0, 0)
+    assert store.counters()["events_scanned"] == 1
+
+def test_node_errors_still_go_through_retry(store, monkeypatch):
+    def down(*_a, **_kw):
+        raise ConnectionError("node down")
+    R = PrivateKey().public_key.format(compressed=True)
+    monkeypatch.setattr(scanner, "USE_MPC", True)
+    monkeypatch.setattr(scanner, "STRICT_MPC", True)
+    monkeypatch.setattr(scanner, "derive_shared_threshold", down)
+    eid, row = _claimed(store, R)
+    assert scanner.process_events([row], "backfill") == 0
+    assert store.attempts(eid) == 1
+    assert store.retry_counts() == (1, 0)
@@ -0,0 +1,88 @@
+import os
+
+from mpc.mpc_core import segments
+from mpc.mpc_core.segments import HEADER, REC_SIZE, SegmentReader, SegmentWriter
+
+def _records(ids):
+    return [(i, i // 2, b"\x02" + i.to_bytes(32, "big"), i.to_bytes(32, "little")) for i in ids]
+
+def _tail_file(directory):
+    return segments._segment_files(directory)[-1]
+
+def test_round_trip_and_roll(tmp_path):
+    d = str(tmp_path)
+    w = SegmentWriter(d, records_per_segment=4)
+    assert w.append(_records(range(1, 11))) == 10
+    assert w.append(_records([5, 10])) == 0     # 不大于 last_id 的跳过
+    w.close()
+    assert len(segments._segment_files(d)) == 3
+
+    r = SegmentReader(d)
+    assert (r.count, r.last_id) == (10, 10)
+    rows = r.rows(0, 2**62, 100)
+    assert [row[0] for row in rows] == list(range(1, 11))
+    assert rows[2] == (3, _records([3])[0][3], _records([3])[0][2], None, None)
+    assert [row[0] for row in r.rows(3, 8, 100)] == [4, 5, 6, 7, 8]
+    assert r.slice(3, 8, 100).ids() == [4]      # 不跨段文件
+
+def test_bad_R_and_tag_are_zeroed(tmp_path):
+    w = SegmentWriter(str(tmp_path))
+    w.append([(1, 1, b"\x02" * 5, None)])
+    w.close()
+    (_, _, R, tag), = SegmentReader(str(tmp_path)).slice(0, 10, 10).records()
+    assert R == b"\x00" * 33 and tag == b"\x00" * 32
+
+def test_reader_ignores_torn_tail(tmp_path):
+    d = str(tmp_path)
+    w = SegmentWriter(d)
+    w.append(_records(range(1, 4)))
+    w._f.write(os.urandom(REC_SIZE // 2))   # 写到一半
+    w._f.flush()
+    r = SegmentReader(d)
+    assert r.count == 3 and r.last_id == 3
+    assert [row[0] for row in r.rows(0, 2**62, 10)] == [1, 2, 3]
+    w.close()
+
+def test_writer_truncates_torn_tail_and_resumes(tmp_path):
+    d = str(tmp_path)
+    w = SegmentWriter(d)
+    w.append(_records(range(1, 4)))
+    w.close()
+    with open(_tail_file(d), "ab") as f:
+        f.write(_records([4])[0][2][:20])
+
+    w = SegmentWriter(d)
+    assert w.last_id == 3
+    assert os.path.getsize(_tail_file(d)) == HEADER.size + 3 * REC_SIZE
+    assert w.append(_records(range(2, 7))) == 3
+    w.close()
+    r = SegmentReader(d)
+    assert [row[0] for row in r.rows(0, 2**62, 10)] == [1, 2, 3, 4, 5, 6]
+
+def test_reader_refresh_picks_up_appends(tmp_path):
+    d = str(tmp_path)
+    w = SegmentWriter(d, records_per_segment=2)
+    w.append(_records([1]))
+    r = SegmentReader(d)
+    assert r.count == 1
+    w.append(_records([2, 3]))
+    r.refresh()
+    assert (r.count, r.last_id) == (3, 3)
+    w.close()
+
+def test_sync_from_db_covers_hot_and_cold(tmp_path):
+    from mpc.mpc_core import storage
+    con = storage.connect(str(tmp_path / "t.db"))
+    with storage.transaction(con):
+        ids = [storage.insert_event(con, b, f"0x{b:064x}", os.urandom(32), b"\x02" + os.urandom(32), b"", b"")
+               for b in range(1, 7)]
+        for eid in ids[:4]:
+            storage.mark_scanned(con, eid, 0)
+        storage.set_meta(con, "last_block", 6)
+    assert storage.archive_finalized(con, finality=0) == 4
+    w = SegmentWriter(str(tmp_path / "seg"))
+    assert w.sync_from_db(con) == 6
+    assert w.sync_from_db(con) == 0
+    w.close()
+    con.close()
+    assert SegmentReader(str(tmp_path / "seg")).rows(0, 2**62, 10)[-1][0] == ids[-1]
@@ -0,0 +1,163 @@
+import os
+import sqlite3
+
+import pytest
+
+from mpc.mpc_core import storage
+
+@pytest.fixture
+def con(tmp_path):
+    c = storage.connect(str(tmp_path / "t.db"))
+    yield c
+    c.close()
+
+def _events(con, blocks):
+    with storage.transaction(con):
+        ids = [storage.insert_event(con, b, f"0x{i:064x}", os.urandom(32), b"\x02" + os.urandom(32),
+                                    os.urandom(48), os.urandom(32)) for i, b in enumerate(blocks)]
+        storage.set_meta(con, "last_block", max(blocks))
+    return ids
+
+def _scan(con, ids, matched=0):
+    with storage.transaction(con):
+        for eid in ids:
+            storage.mark_scanned(con, eid, matched)
+
+def _page_ids(con):
+    return [r[0] for r in storage.events_page(con, 0, 2**62, 1000, cols="id")]
+
+# =============================================================================
+# 迁移
+# =============================================================================
+def test_fresh_db_is_at_schema_version(con):
+    assert storage.schema_version(con) == storage.SCHEMA_VERSION
+    assert storage.migrate(con) == (storage.SCHEMA_VERSION, storage.SCHEMA_VERSION)
+
+def test_legacy_db_is_migrated_in_place(tmp_path):
+    # 拆分前 watcher 建的表：没有租约 / 重试列，user_version=0
+    path = str(tmp_path / "old.db")
+    old = sqlite3.connect(path)
+    old.executescript("""
+      CREATE TABLE meta(k TEXT PRIMARY KEY, v TEXT);
+      INSERT INTO meta VALUES('last_block', '42');
+      CREATE TABLE events(id INTEGER PRIMARY KEY AUTOINCREMENT, block INTEGER, txhash TEXT, tag BLOB, R BLOB,
+                          memo BLOB, commitment BLOB, scanned INTEGER DEFAULT 0, matched INTEGER DEFAULT 0,
+                          created_at INTEGER);
+      INSERT INTO events(block, scanned, matched) VALUES(1, 0, 0), (2, 1, 0), (3, 1, 1);
+    """)
+    old.commit()
+    old.close()
+
+    con = storage.connect(path)
+    try:
+        assert storage.schema_version(con) == storage.SCHEMA_VERSION
+        cols = {row[1] for row in con.execute("PRAGMA table_info(events)")}
+        assert {"lease_owner", "lease_until", "attempts", "retry_at", "last_error"} <= cols
+        assert storage.get_meta(con, "last_block") == "42"
+        # v3 按已有数据回填计数
+        assert storage.event_state_counts(con) == {"pending": 1, "scanned": 1, "matched": 1, "dead": 0}
+    finally:
+        con.close()
+
+# =============================================================================
+# 物化计数 / 查询计划
+# =============================================================================
+def _true_counts(con):
+    q = lambda where: con.execute(f"SELECT COUNT(*) FROM events WHERE {where}").fetchone()[0]
+    return {"events": q("1"), "events_pending": q("scanned=0"), "events_done": q("scanned=1"),
+            "events_scanned": q("scanned=1 AND matched IS NOT 1"), "events_matched": q("matched=1"),
+            "events_dead": q("scanned=-1"),
+            "inbox": con.execute("SELECT COUNT(*) FROM inbox").fetchone()[0]}
+
+def test_trigger_counters_track_every_write(con):
+    ids = _events(con, range(1, 11))
+    _scan(con, ids[:4])
+    _scan(con, ids[4:6], matched=1)
+    with storage.transaction(con):
+        con.execute("UPDATE events SET scanned=-1 WHERE id=?", (ids[6],))
+        con.execute("UPDATE events SET scanned=0 WHERE id=?", (ids[6],))
+        con.execute("UPDATE events SET scanned=-1 WHERE id=?", (ids[7],))
+        for eid, user in ((ids[4], "alice"), (ids[5], "bob"), (ids[5], "bob")):  # 重复的被 IGNORE
+            storage.insert_inbox(con, user, eid, b"", b"", b"", b"")
+        con.execute("DELETE FROM events WHERE id=?", (ids[9],))
+    c = storage.counters(con)
+    assert {k: c[k] for k in _true_counts(con)} == _true_counts(con)
+    assert (c["events_pending"], c["events_dead"], c["inbox:alice"], c["inbox:bob"]) == (2, 1, 1, 1)
+
+    with storage.transaction(con):
+        con.execute("DELETE FROM inbox WHERE user_id='bob'")
+    c = storage.counters(con)
+    assert (c["inbox"], c["inbox:bob"]) == (1, 0)
+
+def test_hot_queries_use_their_indexes(con):
+    assert storage.check_query_plans(con) == []
+
+# =============================================================================
+# 冷热分区
+# =============================================================================
+def test_archive_round_trip(con):
+    ids = _events(con, range(1, 21))
+    _scan(con, ids[:15])
+    with storage.transaction(con):
+        storage.insert_inbox(con, "alice", ids[0], b"", b"", b"", b"")
+    before = storage.counters(con)
+
+    moved = storage.archive_finalized(con, finality=5, batch=4)
+    # block <= 15 且已扫、没有 inbox 引用：ids[1:15]
+    assert moved == 14
+    hot = [r[0] for r in con.execute("SELECT id FROM main.events ORDER BY id")]
+    assert hot == [ids[0]] + ids[15:]
+    assert _page_ids(con) == ids
+    assert [r[0] for r in con.execute("SELECT id FROM all_events ORDER BY id")] == ids
+    after = storage.counters(con)
+    assert after["events_archived"] == 14
+    assert {k: after[k] for k in ("events", "events_done", "events_pending", "inbox")} == \
+           {k: before[k] for k in ("events", "events_done", "events_pending", "inbox")}
+    assert storage.max_block(con) == 20
+
+    with storage.transaction(con):
+        storage.mark_matched(con, ids[3])
+    assert con.execute("SELECT matched FROM main.events WHERE id=?", (ids[3],)).fetchone() == (1,)
+    assert con.execute("SELECT COUNT(*) FROM cold.events_archive WHERE id=?", (ids[3],)).fetchone() == (0,)
+    assert storage.counters(con)["events_archived"] == 13
+    assert _page_ids(con) == ids
+
+def test_archive_is_idempotent(con):
+    ids = _events(con, range(1, 11))
+    _scan(con, ids)
+    assert storage.archive_finalized(con, finality=0) == 10
+    assert storage.archive_finalized(con, finality=0) == 0
+    assert storage.counters(con)["events_archived"] == 10
+
+def test_crash_between_copy_and_delete_converges(con):
+    ids = _events(con, range(1, 11))
+    _scan(con, ids)
+    storage.archive_finalized(con, finality=0, batch=2, max_batches=1)
+    # 模拟第 1 步提交后进程退出：后面几行已复制进冷库，热表还没删
+    with storage.transaction(con):
+        con.execute(f"""INSERT INTO cold.events_archive({storage._ALL_EVENTS_COLS}, archived_at)
+                        SELECT {storage._ALL_EVENTS_COLS}, 0 FROM main.events WHERE id <= ?""", (ids[5],))
+    assert _page_ids(con) == ids   # 两边都有的行只出现一次
+    assert con.execute("SELECT COUNT(*) FROM all_events").fetchone() == (10,)
+
+    assert storage.archive_finalized(con, finality=0) == 8
+    assert con.execute("SELECT COUNT(*) FROM main.events").fetchone() == (0,)
+    assert con.execute("SELECT COUNT(*) FROM cold.events_archive").fetchone() == (10,)
+    assert storage.counters(con)["events_archived"] == 10
+
+def test_copied_row_that_gained_an_inbox_ref_stays_hot(con):
+    ids = _events(con, range(1, 4))
+    _scan(con, ids)
+    storage.attach_cold(con, create=True)
+    # 复制之后、删除之前 rescan 命中了它
+    with storage.transaction(con):
+        con.execute(f"""INSERT INTO cold.events_archive({storage._ALL_EVENTS_COLS}, archived_at)
+                        SELECT {storage._ALL_EVENTS_COLS}, 0 FROM main.events WHERE id = ?""", (ids[0],))
+    with storage.transaction(con):
+        storage.mark_matched(con, ids[0])
+        storage.insert_inbox(con, "bob", ids[0], b"", b"", b"", b"")
+    assert storage.archive_finalized(con, finality=0) == 2
+    assert [r[0] for r in con.execute("SELECT id FROM main.events")] == [ids[0]]
+    assert [r[0] for r in con.execute("SELECT id FROM cold.events_archive ORDER BY id")] == ids[1:]
+    assert _page_ids(con) == ids
+    assert storage.counters(con)["events_archived"] == 2
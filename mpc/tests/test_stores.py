@@ -0,0 +1,149 @@
+import itertools
+import os
+import random
+import time
+
+import pytest
+
+from mpc.mpc_core import stores
+
+_names = itertools.count()
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(time, "time", c)
+    return c
+
+@pytest.fixture(params=stores.BACKENDS)
+def store(request, tmp_path, clock):
+    path = str(tmp_path / "t.db") if request.param == "sqlite" else f"test-{next(_names)}"
+    s = stores.open_store(path, backend=request.param, component="test")
+    s.migrate()
+    return s
+
+def _events(store, n, block0=1):
+    return [store.insert_event(block0 + i, f"0x{i:064x}", os.urandom(32), b"\x02" + os.urandom(32),
+                               b"", os.urandom(32)) for i in range(n)]
+
+def test_lanes_claim_newest_and_oldest_without_overlap(store):
+    ids = _events(store, 10)
+    live = store.claim("live", 6, 3, "w1", 60)
+    back = store.claim("backfill", 6, 3, "w2", 60)
+    assert [r[0] for r in live] == ids[9:6:-1]
+    assert [r[0] for r in back] == ids[:3]
+    again = store.claim("live", 6, 10, "w2", 60)
+    assert [r[0] for r in again] == [ids[6]]    # 租约内不会被别的 worker 认领
+
+def test_expired_lease_is_reclaimed_and_old_owner_cannot_write(store, clock):
+    (eid,) = _events(store, 1)
+    assert store.claim("backfill", 10, 5, "w1", 60)
+    clock.now += 61
+    assert [r[0] for r in store.claim("backfill", 10, 5, "w2", 60)] == [eid]
+    assert store.renew_leases([eid], "w1", 60) == 0
+    assert store.mark_scanned(eid, 1, owner="w1") is False
+    assert store.defer(eid, 1, "boom", retry_at=int(clock.now) + 5, owner="w1") is False
+    assert store.counters()["events_pending"] == 1
+    assert store.mark_scanned(eid, 0, owner="w2") is True
+    assert store.counters()["events_done"] == 1
+
+def test_renew_keeps_the_lease(store, clock):
+    ids = _events(store, 2)
+    store.claim("backfill", 10, 5, "w1", 60)
+    clock.now += 50
+    assert store.renew_leases(ids, "w1", 60) == 2
+    clock.now += 50                             # 不续的话这里已经过期
+    assert store.claim("backfill", 10, 5, "w2", 60) == []
+
+def test_retry_backoff_then_dead_letter_then_requeue(store, clock):
+    (eid,) = _events(store, 1)
+    store.claim("backfill", 10, 5, "w1", 60)
+    assert store.defer(eid, 1, "node down", retry_at=int(clock.now) + 30, owner="w1")
+    assert store.attempts(eid) == 1
+    assert store.retry_counts() == (1, 0)
+    assert store.claim("backfill", 10, 5, "w1", 60) == []   # 未到重试时间
+    clock.now += 31
+    assert [r[0] for r in store.claim("backfill", 10, 5, "w1", 60)] == [eid]
+    assert store.defer(eid, 2, "still down", owner="w1")    # retry_at=None：死信
+    assert store.retry_counts() == (0, 1)
+    assert store.pending_counts(10) == (0, 0)
+    assert store.claim("backfill", 10, 5, "w1", 60) == []
+    assert store.requeue_dead() == 1
+    assert store.retry_counts() == (0, 0) and store.attempts(eid) == 0
+    assert [r[0] for r in store.claim("backfill", 10, 5, "w1", 60)] == [eid]
+
+def test_release_leases_frees_only_own_pending(store):
+    ids = _events(store, 4)
+    store.claim("backfill", 10, 2, "w1", 60)
+    store.claim("backfill", 10, 2, "w2", 60)
+    store.release_leases("w1")
+    assert [r[0] for r in store.claim("backfill", 10, 5, "w3", 60)] == ids[:2]
+
+def test_pending_counts_and_lag_blocks(store):
+    ids = _events(store, 5, block0=100)
+    store.claim("backfill", 10, 1, "w", 60)
+    store.mark_scanned(ids[0], 0, owner="w")
+    assert store.pending_counts(3) == (2, 2)
+    assert store.lag_blocks() == 3
+
+def _workload(store, clock):
+    """同一串写入在两个后端上跑，返回所有读接口的结果（去掉 created_at / detected_at：SQLite 用库里的时钟）"""
+    rng = random.Random(50)
+    ids = [store.insert_event(100 + i // 3, f"0x{i:064x}", rng.randbytes(32), b"\x02" + rng.randbytes(32),
+                              rng.randbytes(40), rng.randbytes(32)) for i in range(30)]
+    store.set_meta("last_block", 109)
+    out = [store.max_event_id(), store.max_block(), store.get_meta("last_block"), store.get_meta("nope", "d")]
+    floor = ids[19]
+    for lane, owner in (("live", "w1"), ("backfill", "w2"), ("live", "w2"), ("backfill", "w1")):
+        rows = store.claim(lane, floor, 6, owner, 60)
+        out.append([r[:5] for r in rows])
+        for eid, tag, R, memo, commitment, _ in rows:
+            if eid % 7 == 0:
+                store.defer(eid, 1, "flaky", retry_at=int(clock.now) + 10, owner=owner)
+            elif eid % 11 == 0:
+                store.defer(eid, 3, "dead", owner=owner)
+            else:
+                hit = eid % 4 == 0
+                if hit:
+                    user = "alice" if eid % 8 == 0 else "bob"
+                    store.insert_inbox(user, eid, tag, R, memo, commitment, b"plain-%d" % eid if eid % 3 else None)
+                    store.insert_inbox("carol", eid, tag, R, memo, commitment)  # 同 event_id 被忽略
+                store.mark_scanned(eid, int(hit), owner=owner)
+    store.release_leases("w2")
+    out += [store.pending_counts(floor), store.retry_counts(), store.lag_blocks(),
+            [store.attempts(e) for e in ids]]
+    for user in ("alice", "bob", "carol"):
+        inbox = store.fetch_inbox(user)
+        out.append([r[:8] for r in inbox])
+        out.append([store.inbox_memo(r[0], user) for r in inbox])
+        out.append([store.inbox_memo(r[0], "mallory") for r in inbox])
+    out += [store.requeue_dead(), store.retry_counts(), store.counters()]
+    return out
+
+def test_sqlite_and_memory_backends_agree(tmp_path, clock):
+    results = []
+    for backend in stores.BACKENDS:
+        path = str(tmp_path / "p.db") if backend == "sqlite" else f"parity-{next(_names)}"
+        s = stores.open_store(path, backend=backend, component="test")
+        s.migrate()
+        results.append(_workload(s, clock))
+    sqlite_out, memory_out = results
+    assert len(sqlite_out) == len(memory_out)
+    for i, (a, b) in enumerate(zip(sqlite_out, memory_out)):
+        assert a == b, f"step {i}"
+
+def test_store_is_abstract():
+    with pytest.raises(TypeError):
+        stores.Store()
+
+def test_standalone_entry_points_reject_memory_backend():
+    with pytest.raises(ValueError, match="per-process"):
+        stores.open_store("x", backend="memory", component="scanner", standalone=True)
+    assert stores.open_store("x", backend="memory").backend == "memory"
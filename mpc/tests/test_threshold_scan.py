@@ -0,0 +1,44 @@
+import random
+
+import pytest
+from coincurve import PrivateKey, PublicKey
+
+from mpc.mpc_core.local_scan import LocalScanEngine
+from mpc.mpc_core.primitives import SECP_N, tag_hash
+from mpc.mpc_core.threshold_scan import (derive_shared_tofn, derive_tag_tofn, derive_tags_tofn_batch,
+                                         make_tofn_pool)
+
+def _split(secret: int, t: int, n: int, rng: random.Random):
+    coeffs = [secret] + [rng.randrange(1, SECP_N) for _ in range(t - 1)]
+    return [(i, sum(c * pow(i, k, SECP_N) for k, c in enumerate(coeffs)) % SECP_N) for i in range(1, n + 1)]
+
+RNG = random.Random(30)
+SECRET = RNG.randrange(1, SECP_N)
+SHARES = _split(SECRET, 2, 3, RNG)
+SK_HEX = "0x%064x" % SECRET
+RS = [PrivateKey(RNG.randrange(1, SECP_N).to_bytes(32, "big")).public_key.format() for _ in range(12)]
+
+@pytest.mark.parametrize("subset", [[0, 1], [0, 2], [1, 2]])
+def test_any_t_shares_give_the_private_key_ecdh(subset):
+    shares = [SHARES[i] for i in subset]
+    for R in RS[:3]:
+        want = PublicKey(R).multiply(SECRET.to_bytes(32, "big"))
+        assert derive_shared_tofn(R, shares).format() == want.format()
+        assert derive_tag_tofn(R, shares) == tag_hash(want.format())
+
+def test_batch_matches_local_engine_x32():
+    eng = LocalScanEngine(SK_HEX, codec="x32")
+    got = derive_tags_tofn_batch(RS + [b"\x02" + b"\x00" * 32], SHARES[:2], codec="x32", workers=1)
+    assert got[:-1] == [eng.tags(R)[0] for R in RS]
+    assert got[-1] is None
+
+def test_pool_path_matches_inline():
+    inline = derive_tags_tofn_batch(RS, SHARES[1:], codec="comp33", workers=1)
+    with make_tofn_pool(SHARES[1:], codec="comp33", workers=2) as pool:
+        assert derive_tags_tofn_batch(RS, SHARES[1:], codec="comp33", chunk=5, executor=pool) == inline
+
+def test_rejects_bad_inputs():
+    with pytest.raises(ValueError):
+        derive_tags_tofn_batch(RS, SHARES[:1])
+    with pytest.raises(ValueError):
+        derive_tags_tofn_batch(RS, SHARES[:2], codec="auto")
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from mpc.mpc_core import tracing
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "traces.jsonl")
+    monkeypatch.setattr(tracing, "TRACE_FILE", path)
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE", 1.0)
+    monkeypatch.setattr(tracing, "_provider", None)
+    monkeypatch.setattr(tracing, "_tracer", None)
+    tracing.set_service("test")
+    yield path
+    if tracing._provider is not None:
+        tracing._provider.shutdown()
+
+def _spans(path):
+    tracing.flush()
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_disabled_is_noop(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_FILE", "")
+    assert tracing.start_span("x", root=True) is tracing.NOOP
+    assert tracing.span("y") is tracing.NOOP
+    assert tracing.inject({}) == {}
+
+def test_tree_propagates_across_threads_and_processes(trace_file):
+    root = tracing.start_span("scan.event", root=True, eid=7)
+    with tracing.activate(root):                 # 线程池里接着这条 trace
+        with tracing.span("node.request", node="n1") as sp:
+            headers = tracing.inject({})
+            sp.set(status=200)
+    root.set(matched=1)
+    root.end()
+    root.end()                                   # 重复 end 无害
+
+    # 节点侧：从 traceparent 头接上
+    remote = tracing.start_span("node.scan_share", traceparent=headers[tracing.TRACEPARENT])
+    child = tracing.start_span("node.point_mul", parent=remote)
+    child.end()
+    remote.end(RuntimeError("boom"))
+
+    spans = {s["name"]: s for s in _spans(trace_file)}
+    assert len(spans) == 4 and len({s["trace_id"] for s in spans.values()}) == 1
+    assert spans["scan.event"]["parent_id"] is None
+    assert spans["scan.event"]["attrs"] == {"eid": 7, "matched": 1}
+    assert spans["node.request"]["parent_id"] == spans["scan.event"]["span_id"]
+    assert spans["node.request"]["attrs"] == {"node": "n1", "status": 200}
+    assert spans["node.scan_share"]["parent_id"] == spans["node.request"]["span_id"]
+    assert spans["node.point_mul"]["parent_id"] == spans["node.scan_share"]["span_id"]
+    assert spans["node.scan_share"]["error"] == "RuntimeError: boom"
+    assert spans["scan.event"]["service"] == "test"
+    assert "scan.event" in tracing.summarize([trace_file])
+
+def test_unsampled_or_bad_traceparent_is_noop(trace_file):
+    assert tracing.start_span("n", traceparent="00-" + "1" * 32 + "-" + "2" * 16 + "-00") is tracing.NOOP
+    assert tracing.start_span("n", traceparent="garbage") is tracing.NOOP
+
+def test_traced_only_records_under_a_span(trace_file):
+    @tracing.traced("db.write")
+    def write():
+        return 42
+
+    assert write() == 42                         # 没有当前 span：不记录
+    with tracing.start_span("scan.event", root=True):
+        assert write() == 42
+    names = [s["name"] for s in _spans(trace_file)]
+    assert sorted(names) == ["db.write", "scan.event"]
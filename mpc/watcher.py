@@ -1,8 +1,11 @@
 # mpc/watcher.py
 # -*- coding: utf-8 -*-
-import os, json, sqlite3, time
-from web3 import Web3
-from web3._utils.events import get_event_data
+import os, json, time
+
+try:
+    from .mpc_core import metrics, profiling, replay, segments, storage, stores
+except ImportError:  # 以脚本方式运行：python3 mpc/watcher.py
+    from mpc_core import metrics, profiling, replay, segments, storage, stores
 
 # -------------------- .env 加载（优先 python-dotenv；无则用内置解析） --------------------
 def _load_dotenv():
@@ -49,6 +52,10 @@ _load_dotenv()
 # 必填
 RPC_URL = os.getenv("envRPC_URL", "http://127.0.0.1:8545")
 DB_PATH = os.getenv("DB_PATH", "mpc_index.db")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9102"))  # Prometheus /metrics；0 = 关闭
+WATCH_INTERVAL_S = float(os.getenv("WATCH_INTERVAL_S", "1.5"))  # 轮询间隔
+ARCHIVE_INTERVAL_S = float(os.getenv("ARCHIVE_INTERVAL_S", "300"))  # 冷热分区归档间隔；0 = 关闭（见 mpc_core/storage.py）
+SEGMENT_WRITE = os.getenv("SEGMENT_WRITE", "true").lower() in ("1", "true", "yes")  # 追加定长段文件供历史扫描（见 mpc_core/segments.py）
 
 # 合约地址优先取 SINGNALBOARD（按你给的拼写），其次 SIGNALBOARD，再退 REGISTRY_V2/CONTRACT_ADDR
 _CONTRACT_ADDR_RAW = (
@@ -62,11 +69,6 @@ if not _CONTRACT_ADDR_RAW:
     print("❌ CONTRACT address not set.\n请在 .env 中设置 SINGNALBOARD=0x...（或 SIGNALBOARD/REGISTRY_V2）")
     raise SystemExit(1)
 
-try:
-    CONTRACT_ADDR = Web3.to_checksum_address(_CONTRACT_ADDR_RAW)
-except Exception:
-    print(f"❌ 非法地址: { _CONTRACT_ADDR_RAW }")
-    raise SystemExit(1)
 
 # ABI 路径：SIGNALBOARD_ABI 优先，其次 REGISTRY_V2_ABI/CONTRACT_ABI，最后内置最小 ABI
 ABI_PATH = (
@@ -111,9 +113,6 @@ if abi is None:
     ]
     ABI_PATH = "<<built-in>>"
 
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
-contract = w3.eth.contract(address=CONTRACT_ADDR, abi=abi)
-
 # 选择事件：优先 Signal，其次 Announce
 evt_abi = None
 evt_kind = None  # "signal" | "announce"
@@ -129,121 +128,185 @@ if not evt_abi:
 
 print(f"✅ Using event: {evt_abi['name']} ({evt_kind})")
 
-# -------------------- DB helpers --------------------
-def _open_db():
-    con = sqlite3.connect(DB_PATH)
+# -------------------- 链连接（延迟到第一次用时） --------------------
+# import watcher 不导入 web3、不建 provider；main() / poll_once() 里才初始化
+w3 = None
+contract = None
+CONTRACT_ADDR = None
+_get_event_data = None
+_topic0 = None
+
+def init_chain():
+    global w3, contract, CONTRACT_ADDR, _get_event_data, _topic0
+    if w3 is not None:
+        return w3
+    from web3 import Web3
+    from web3._utils.events import get_event_data
+
     try:
-        con.execute("PRAGMA journal_mode=WAL;")
-        con.execute("PRAGMA synchronous=NORMAL;")
+        CONTRACT_ADDR = Web3.to_checksum_address(_CONTRACT_ADDR_RAW)
     except Exception:
-        pass
-    return con
+        print(f"❌ 非法地址: { _CONTRACT_ADDR_RAW }")
+        raise SystemExit(1)
+    # REPLAY_MODE=record|replay 时录制 / 回放 RPC（见 mpc_core/replay.py）
+    w3 = Web3(replay.provider(RPC_URL, "rpc"))
+    contract = w3.eth.contract(address=CONTRACT_ADDR, abi=abi)
+    _get_event_data = get_event_data
+    if evt_kind == "signal":
+        _topic0 = w3.keccak(text="Signal(bytes32,bool,bytes32,bytes)").hex()
+    else:
+        _topic0 = w3.keccak(text="Announce(bytes,bytes,bytes32,bytes32)").hex()
+    return w3
+
+# -------------------- 指标 --------------------
+M_INGESTED = metrics.counter("mpc_watcher_events_ingested_total", "Events decoded and stored")
+M_DECODE_ERR = metrics.counter("mpc_watcher_decode_errors_total", "Logs that failed to decode/store")
+M_GET_LOGS = metrics.histogram("mpc_watcher_get_logs_seconds", "eth_getLogs duration", ("outcome",))
+M_LAST_BLOCK = metrics.gauge("mpc_watcher_last_block", "Last block fully ingested")
+M_TIP = metrics.gauge("mpc_watcher_chain_tip", "Latest chain block seen")
+M_LAG_BLK = metrics.gauge("mpc_watcher_lag_blocks", "Chain tip minus last ingested block")
+M_ARCHIVED = metrics.counter("mpc_watcher_events_archived_total", "Scanned non-matching events moved to the cold store")
+M_SEGMENT = metrics.counter("mpc_watcher_segment_records_total", "Announcements appended to mmap segment files")
+
+# -------------------- DB helpers --------------------
+# 读写经由存储后端（STORAGE_BACKEND=sqlite；memory 是进程内的，独立进程拒绝，见 mpc_core/stores.py）；
+# 归档与段文件只对 SQLite 有意义（冷库 / 多进程共享），内存后端下跳过
+_store = None
+
+def _get_store() -> "stores.Store":
+    global _store
+    if _store is None:
+        _store = stores.open_store(DB_PATH, component="watcher", standalone=True)
+    return _store
+
+def _open_db():
+    """本线程复用的调优连接（见 mpc_core/storage.py）；不要 close()"""
+    return storage.connection(DB_PATH)
+
+def _on_sqlite() -> bool:
+    return _get_store().backend == "sqlite"
+
+_db_ready = False
 
 def ensure_db():
-    con = _open_db(); cur = con.cursor()
-    cur.execute("""CREATE TABLE IF NOT EXISTS meta(
-        k TEXT PRIMARY KEY,
-        v TEXT
-    )""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS events(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        block INTEGER,
-        txhash TEXT,
-        tag BLOB,
-        R   BLOB,
-        memo BLOB,
-        commitment BLOB,
-        scanned INTEGER DEFAULT 0,
-        matched INTEGER DEFAULT 0,
-        created_at INTEGER
-    )""")
-    cur.execute("INSERT OR IGNORE INTO meta(k,v) VALUES('last_block','0')")
-    con.commit(); con.close()
-    print(f"✅ Database ready @ {os.path.abspath(DB_PATH)}")
+    """建表 / 迁移由 storage 的迁移链负责；每个进程只需一次"""
+    global _db_ready
+    if _db_ready:
+        return
+    _get_store().migrate()
+    _db_ready = True
+    print(f"✅ Database ready @ {_get_store().location}")
 
 def get_last_block() -> int:
-    con = _open_db(); cur = con.cursor()
-    cur.execute("SELECT v FROM meta WHERE k='last_block'")
-    row = cur.fetchone(); con.close()
-    return int(row[0]) if row else 0
+    return int(_get_store().get_meta("last_block", "0"))
 
+@profiling.timed("db_write")
 def set_last_block(h: int):
-    con = _open_db(); cur = con.cursor()
-    cur.execute("UPDATE meta SET v=? WHERE k='last_block'", (str(h),))
-    con.commit(); con.close()
+    _get_store().set_meta("last_block", h)
 
+@profiling.timed("db_write")
 def insert_event(block, txhash, R_bytes, tag_bytes, memo_bytes, commitment_bytes):
-    con = _open_db(); cur = con.cursor()
-    cur.execute("""
-      INSERT INTO events(block, txhash, tag, R, memo, commitment, created_at)
-      VALUES(?,?,?,?,?,?, strftime('%s','now'))
-    """, (block, txhash, tag_bytes, R_bytes, memo_bytes, commitment_bytes))
-    eid = cur.lastrowid
-    con.commit(); con.close()
-    return eid
+    return _get_store().insert_event(block, txhash, tag_bytes, R_bytes, memo_bytes, commitment_bytes)
+
+@profiling.timed("db_archive")
+def archive_stage():
+    """终局、已扫、未命中的事件搬进冷库，再归还一部分空闲页"""
+    con = _open_db()
+    n = storage.archive_finalized(con)
+    freed = storage.incremental_vacuum(con)
+    if n:
+        M_ARCHIVED.inc(n)
+        print(f"🧊 archived {n} scanned event(s) to {storage.cold_path(con)}"
+              + (f", freed {freed} page(s)" if freed >= 0 else " (auto_vacuum off: python3 -m mpc.archive --enable-incremental-vacuum)"))
+
+_segment_writer = None
+
+@profiling.timed("segment_append")
+def segment_stage():
+    """把库里新提交的事件（含 server 写入的）追加到段文件；段是派生数据，失败只告警"""
+    global _segment_writer
+    try:
+        if _segment_writer is None:
+            _segment_writer = segments.SegmentWriter(segments.segment_dir(DB_PATH))
+            print(f"🧱 segments @ {os.path.abspath(_segment_writer.directory)} (last_id={_segment_writer.last_id})")
+        n = _segment_writer.sync_from_db(_open_db())
+        if n:
+            M_SEGMENT.inc(n)
+    except Exception as e:
+        print(f"⚠️ segment append failed: {e}")
+        _segment_writer = None  # 下一轮重开，截掉写了一半的尾部
 
 def _pack_R_from_rx(rx: bytes, y_parity: bool) -> bytes:
     return (b'\x03' if y_parity else b'\x02') + rx
 
 # -------------------- 主轮询 --------------------
 def poll_once():
+    init_chain()
     ensure_db()
     last = get_last_block()
 
     tip = w3.eth.block_number
+    M_TIP.set(tip)
+    M_LAST_BLOCK.set(last)
+    M_LAG_BLK.set(max(0, tip - last))
     if last >= tip:
         return
 
-    if evt_kind == "signal":
-        topic0 = w3.keccak(text="Signal(bytes32,bool,bytes32,bytes)").hex()
-    else:
-        topic0 = w3.keccak(text="Announce(bytes,bytes,bytes32,bytes32)").hex()
-
     start = last + 1
     end   = min(tip, start + 4095)
 
+    t0 = time.perf_counter()
     try:
-        logs = w3.eth.get_logs({
-            "fromBlock": start,
-            "toBlock": end,
-            "address": CONTRACT_ADDR,
-            "topics": [topic0]
-        })
+        with profiling.stage("get_logs"):
+            logs = w3.eth.get_logs({
+                "fromBlock": start,
+                "toBlock": end,
+                "address": CONTRACT_ADDR,
+                "topics": [_topic0]
+            })
     except Exception as e:
+        M_GET_LOGS.labels(outcome="error").observe(time.perf_counter() - t0)
         print(f"❌ get_logs failed: {e}")
         return
+    M_GET_LOGS.labels(outcome="ok").observe(time.perf_counter() - t0)
 
     if logs:
         print(f"📡 blocks {start}-{end}: {len(logs)} {evt_kind} event(s)")
 
     for lg in logs:
         try:
-            ed = get_event_data(w3.codec, evt_abi, lg)
-            if evt_kind == "signal":
-                rx       = ed["args"]["rx"]
-                yParity  = ed["args"]["yParity"]
-                tag      = ed["args"]["tag"]
-                memo     = ed["args"]["memo"]
-                R_bytes  = _pack_R_from_rx(bytes(rx), bool(yParity))
-                commit_b = b""
-            else:
-                R_bytes  = bytes(ed["args"]["R"])
-                memo     = bytes(ed["args"]["memoCipher"])
-                commit_b = bytes(ed["args"]["commitment"])
-                tag      = ed["args"]["tag"]
+            with profiling.stage("decode"):
+                ed = _get_event_data(w3.codec, evt_abi, lg)
+                if evt_kind == "signal":
+                    rx       = ed["args"]["rx"]
+                    yParity  = ed["args"]["yParity"]
+                    tag      = ed["args"]["tag"]
+                    memo     = ed["args"]["memo"]
+                    R_bytes  = _pack_R_from_rx(bytes(rx), bool(yParity))
+                    commit_b = b""
+                else:
+                    R_bytes  = bytes(ed["args"]["R"])
+                    memo     = bytes(ed["args"]["memoCipher"])
+                    commit_b = bytes(ed["args"]["commitment"])
+                    tag      = ed["args"]["tag"]
 
             eid = insert_event(
                 lg["blockNumber"], lg["transactionHash"].hex(),
                 R_bytes, bytes(tag), memo, commit_b
             )
+            M_INGESTED.inc()
             print(f"✅ saved event #{eid} @ block {lg['blockNumber']}  R={R_bytes[:2].hex()}.. tag={bytes(tag).hex()[:10]}..")
         except Exception as e:
+            M_DECODE_ERR.inc()
             print(f"❌ decode/save error: {e}")
 
     set_last_block(end)
+    M_LAST_BLOCK.set(end)
+    M_LAG_BLK.set(max(0, tip - end))
 
 def main():
     print("🔄 [watcher] starting…")
+    init_chain()
     print(f"⛓️  RPC: {RPC_URL}")
     print(f"📍 Contract: {CONTRACT_ADDR}")
     print(f"📄 ABI: {ABI_PATH}")
@@ -258,15 +321,23 @@ def main():
     except Exception as e:
         print("❌ RPC check error:", e); return
 
+    metrics.start_http_server(METRICS_PORT)
+    profiling.install_signal_handler("watcher", log_prefix="[watcher]")  # kill -USR1 <pid> 开/关剖析
     print("🚀 watcher running…")
+    archived_at = time.monotonic()
     while True:
         try:
             poll_once()
+            if SEGMENT_WRITE and _on_sqlite():
+                segment_stage()
+            if ARCHIVE_INTERVAL_S > 0 and _on_sqlite() and time.monotonic() - archived_at >= ARCHIVE_INTERVAL_S:
+                archived_at = time.monotonic()
+                archive_stage()
         except KeyboardInterrupt:
             print("\n👋 watcher stopped"); break
         except Exception as e:
             print("❌ loop error:", e)
-        time.sleep(1.5)
+        time.sleep(WATCH_INTERVAL_S)
 
 if __name__ == "__main__":
     main()
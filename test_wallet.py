@@ -1,7 +1,12 @@
 # improved_test_wallet.py
-import sqlite3, os, time
+import os, time
 from datetime import datetime
 
+try:
+    from mpc.mpc_core import stores
+except ImportError:  # 在 mpc/ 目录下运行
+    from mpc_core import stores
+
 DB_PATH = os.getenv("DB_PATH", "mpc_index.db")
 USER_ID = os.getenv("USER_ID", "alice")
 
@@ -10,39 +15,27 @@ def show_wallet_status():
     print(f"\n=== 钱包状态 - {USER_ID} ===")
     print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
+    store = stores.open_store(DB_PATH, component="test_wallet", standalone=True)  # 只读 SQLite；memory 是进程内的，这里拒绝
     
     # 检查收件箱
-    cur.execute("""
-    SELECT i.id, hex(i.tag), hex(i.R), i.status, e.txhash, e.block, i.detected_at
-    FROM inbox i
-    JOIN events e ON i.event_id = e.id
-    WHERE i.user_id=? ORDER BY i.detected_at DESC LIMIT 10
-    """, (USER_ID,))
-    
-    inbox_rows = cur.fetchall()
+    inbox_rows = store.fetch_inbox(USER_ID, limit=10)
     
     if inbox_rows:
         print(f"\n📬 收件箱 ({len(inbox_rows)} 条):")
         for r in inbox_rows:
-            iid, tag_hex, R_hex, status, tx, blk, detected = r
+            iid, blk, tx, tag_hex, R_hex, _memo_hex, _commit_hex, status, detected = r
             detected_time = datetime.fromtimestamp(int(detected)).strftime('%H:%M:%S')
             print(f"  {iid:2d} | {detected_time} | 区块{blk:6d} | {status:8s} | tag:{tag_hex[:12]}... | {tx[:10]}...")
     else:
         print("\n📭 收件箱为空")
     
-    # 检查链上事件总数
-    cur.execute("SELECT COUNT(*), MAX(block) FROM events")
-    event_count, latest_block = cur.fetchone()
-    print(f"\n📡 链上事件: {event_count or 0} 条, 最新区块: {latest_block or 'N/A'}")
+    # 检查链上事件总数（触发器维护的计数 + 块号索引，不随表变大）
+    counts = store.counters()
+    latest_block = store.max_block()
+    print(f"\n📡 链上事件: {counts['events']} 条, 最新区块: {latest_block or 'N/A'}")
     
     # 检查扫描状态
-    cur.execute("SELECT COUNT(*) FROM events WHERE scanned=1")
-    scanned_count = cur.fetchone()[0]
-    print(f"🔍 已扫描: {scanned_count or 0} 条")
-    
-    con.close()
+    print(f"🔍 已扫描: {counts['events_done']} 条")
 
 def watch_mode():
     """实时监控模式"""